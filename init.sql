@@ -1,11 +1,14 @@
+-- Lets the reservations exclusion constraint combine seat_id equality with range overlap
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 -- Managers Table
 CREATE TABLE managers (
     id BIGSERIAL PRIMARY KEY,
     username VARCHAR(255) NOT NULL,
     email VARCHAR(255) UNIQUE NOT NULL,
     password VARCHAR(255) NOT NULL,
-    bluDollar_balance DECIMAL(10, 2) DEFAULT 0, 
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    row_version BIGINT NOT NULL DEFAULT 1  -- Bumped on every update (see bump_row_version)
 );
 
 -- Employees Table
@@ -14,9 +17,9 @@ CREATE TABLE employees (
     username VARCHAR(255) NOT NULL,
     email VARCHAR(255) UNIQUE NOT NULL,
     password VARCHAR(255) NOT NULL,
-    bluDollar_used DECIMAL(10, 2) DEFAULT 0,
     manager_id INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    row_version BIGINT NOT NULL DEFAULT 1,  -- Bumped on every update (see bump_row_version)
     FOREIGN KEY (manager_id) REFERENCES managers(id) ON DELETE CASCADE
 );
 
@@ -24,6 +27,27 @@ CREATE TABLE employees (
 CREATE TABLE seats (
     id BIGSERIAL PRIMARY KEY, 
     seat_number INT NOT NULL CHECK (seat_number BETWEEN 1 AND 50),
+    -- Floor layout: seats in the same zone and row with consecutive positions sit side by side;
+    -- a gap in positions (aisle, pillar) breaks the row into separate runs
+    zone VARCHAR(20),
+    seat_row INT CHECK (seat_row > 0),
+    seat_position INT CHECK (seat_position > 0),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK ((zone IS NULL) = (seat_row IS NULL) AND (seat_row IS NULL) = (seat_position IS NULL)),
+    UNIQUE (zone, seat_row, seat_position)
+);
+
+-- Reservation Series Table: a recurrence rule expanded into individual reservations
+CREATE TABLE reservation_series (
+    id BIGSERIAL PRIMARY KEY,
+    seat_id BIGINT NOT NULL REFERENCES seats(id) ON DELETE CASCADE,
+    employee_id BIGINT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    frequency VARCHAR(10) CHECK (frequency IN ('DAILY', 'WEEKLY')) NOT NULL,
+    weekdays INT[],  -- ISO weekdays (1 = Monday) for WEEKLY series
+    start_time TIMESTAMP NOT NULL,  -- First occurrence
+    end_time TIMESTAMP NOT NULL,
+    until_date DATE NOT NULL,
+    status VARCHAR(50) CHECK (status IN ('ACTIVE', 'CANCELED')) DEFAULT 'ACTIVE',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -34,8 +58,131 @@ CREATE TABLE reservations (
     employee_id BIGINT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
     start_time TIMESTAMP NOT NULL,
     end_time TIMESTAMP NOT NULL,
-    status VARCHAR(50) CHECK (status IN ('RESERVED', 'CANCELED', 'RELEASED')) DEFAULT 'RESERVED',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    status VARCHAR(50) CHECK (status IN ('RESERVED', 'CANCELED', 'RELEASED', 'COMPLETED')) DEFAULT 'RESERVED',
+    checked_in_at TIMESTAMP,  -- Set when the employee shows up; unchecked reservations are released after a grace period
+    series_id BIGINT REFERENCES reservation_series(id) ON DELETE SET NULL,
+    during TSRANGE GENERATED ALWAYS AS (tsrange(start_time, end_time)) STORED,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK (start_time < end_time),
+    -- Double-booking is rejected by an index probe, safe under concurrent inserts
+    CONSTRAINT reservations_no_overlap EXCLUDE USING gist (seat_id WITH =, during WITH &&)
+        WHERE (status = 'RESERVED')
+);
+
+CREATE INDEX idx_reservations_series ON reservations (series_id) WHERE series_id IS NOT NULL;
+
+-- Per-seat history lookups (seat details, popularity ranking for auto-assign)
+CREATE INDEX idx_reservations_seat_start ON reservations (seat_id, start_time);
+
+-- Lets the sweeper find due reservations without scanning released and completed history
+CREATE INDEX idx_reservations_active_start ON reservations (start_time) WHERE status = 'RESERVED';
+
+-- Matches check-ins and badge events to an employee's active reservations
+CREATE INDEX idx_reservations_active_employee ON reservations (employee_id, start_time) WHERE status = 'RESERVED';
+
+-- Seat Holds Table: short leases on a seat-slot while an employee completes checkout.
+-- Active holds count as taken for everyone else; expired ones are ignored and reaped lazily
+CREATE TABLE seat_holds (
+    id BIGSERIAL PRIMARY KEY,
+    seat_id BIGINT NOT NULL REFERENCES seats(id) ON DELETE CASCADE,
+    employee_id BIGINT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    during TSRANGE GENERATED ALWAYS AS (tsrange(start_time, end_time)) STORED,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK (start_time < end_time),
+    CONSTRAINT seat_holds_no_overlap EXCLUDE USING gist (seat_id WITH =, during WITH &&)
+);
+
+CREATE INDEX idx_seat_holds_expires ON seat_holds (expires_at);
+
+-- Waitlist Table: employees waiting for a slot on one seat (or any seat) to be freed
+CREATE TABLE waitlist_entries (
+    id BIGSERIAL PRIMARY KEY,
+    employee_id BIGINT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    seat_id BIGINT REFERENCES seats(id) ON DELETE CASCADE,  -- NULL = any seat
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    during TSRANGE GENERATED ALWAYS AS (tsrange(start_time, end_time)) STORED,
+    -- EXPIRED: the slot ended without a seat freeing up (set by the sweeper)
+    status VARCHAR(20) CHECK (status IN ('WAITING', 'PROMOTED', 'CANCELED', 'EXPIRED')) NOT NULL DEFAULT 'WAITING',
+    reservation_id BIGINT REFERENCES reservations(id) ON DELETE SET NULL,  -- Set on promotion
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    promoted_at TIMESTAMP,
+    CHECK (start_time < end_time)
+);
+
+-- A freed slot finds the waiters that fit inside it with one index probe
+CREATE INDEX idx_waitlist_waiting ON waitlist_entries USING gist (during) WHERE status = 'WAITING';
+CREATE INDEX idx_waitlist_employee ON waitlist_entries (employee_id, created_at);
+
+-- Lottery Draws Table: a pre-registration window for an oversubscribed slot; seats are
+-- allocated to the registered employees in one batch run once registration closes
+CREATE TABLE lottery_draws (
+    id BIGSERIAL PRIMARY KEY,
+    manager_id BIGINT NOT NULL REFERENCES managers(id) ON DELETE CASCADE,  -- Who opened the draw
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    registration_closes_at TIMESTAMP NOT NULL,
+    status VARCHAR(10) CHECK (status IN ('OPEN', 'ALLOCATED')) NOT NULL DEFAULT 'OPEN',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    allocated_at TIMESTAMP,
+    CHECK (start_time < end_time),
+    CHECK (registration_closes_at <= start_time)
+);
+
+CREATE INDEX idx_lottery_draws_due ON lottery_draws (registration_closes_at) WHERE status = 'OPEN';
+
+-- Lottery Entries Table: one registration per employee and draw
+CREATE TABLE lottery_entries (
+    draw_id BIGINT NOT NULL REFERENCES lottery_draws(id) ON DELETE CASCADE,
+    employee_id BIGINT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    preferred_seat_ids BIGINT[] NOT NULL DEFAULT '{}',  -- Most wanted first; may be empty
+    status VARCHAR(10) CHECK (status IN ('PENDING', 'WON', 'LOST')) NOT NULL DEFAULT 'PENDING',
+    reservation_id BIGINT REFERENCES reservations(id) ON DELETE SET NULL,
+    reason TEXT,  -- Why the entry lost
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (draw_id, employee_id)
+);
+
+-- Booking Requests Table: durable intake queue for queued bookings; the id is the client's ticket
+CREATE TABLE booking_requests (
+    id BIGSERIAL PRIMARY KEY,
+    employee_id BIGINT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    manager_id BIGINT,  -- From the token, checked by book_seat() like a direct booking
+    seat_id BIGINT NOT NULL,  -- Unknown seats come back as SEAT_NOT_FOUND
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    status VARCHAR(10) CHECK (status IN ('PENDING', 'DONE')) NOT NULL DEFAULT 'PENDING',
+    result_code TEXT,  -- book_seat() result once processed
+    reservation_id BIGINT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+-- Workers claim the oldest pending tickets; the sweeper purges old processed ones
+CREATE INDEX idx_booking_requests_pending ON booking_requests (id) WHERE status = 'PENDING';
+CREATE INDEX idx_booking_requests_processed ON booking_requests (processed_at) WHERE status = 'DONE';
+
+-- Bulk Cancellations Table: closure jobs (maintenance, holidays) cancelling every active
+-- reservation on a set of seats in a time range, worked through in chunks
+CREATE TABLE bulk_cancellations (
+    id BIGSERIAL PRIMARY KEY,
+    manager_id BIGINT NOT NULL REFERENCES managers(id) ON DELETE CASCADE,  -- Who requested it
+    seat_ids BIGINT[],  -- NULL closes every seat
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    reason TEXT NOT NULL,
+    status VARCHAR(10) CHECK (status IN ('RUNNING', 'DONE', 'FAILED')) NOT NULL DEFAULT 'RUNNING',
+    total INT NOT NULL DEFAULT 0,  -- Reservations matching when the job started
+    canceled INT NOT NULL DEFAULT 0,
+    refunded DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    chunks INT NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    CHECK (start_time < end_time)
 );
 
 -- Transactions Table
@@ -44,7 +191,1065 @@ CREATE TABLE transactions (
     manager_id BIGINT NOT NULL REFERENCES managers(id) ON DELETE CASCADE,
     employee_id BIGINT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
     amount DECIMAL(10, 2) NOT NULL CHECK (amount >= 0),
-    type VARCHAR(50) CHECK (type IN ('ALLOCATION', 'RESERVATION', 'PENALTY', 'BOOST')) NOT NULL,
+    type VARCHAR(50) CHECK (type IN ('ALLOCATION', 'RESERVATION', 'CANCELLATION', 'MODIFICATION', 'PENALTY', 'BOOST')) NOT NULL,
     reason TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Daily Usage Table: BluDollars each employee has spent per day of seat use,
+-- kept in step with bookings and cancellations so the daily limit is a primary-key lookup
+CREATE TABLE employee_daily_usage (
+    employee_id BIGINT NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    usage_date DATE NOT NULL,
+    amount DECIMAL(10, 2) NOT NULL DEFAULT 0 CHECK (amount >= 0),
+    PRIMARY KEY (employee_id, usage_date)
+);
+
+-- Adds p_amount to an employee's usage for one day unless that would exceed the limit.
+-- The upsert locks the counter row, so concurrent bookings by the same employee cannot overshoot.
+CREATE OR REPLACE FUNCTION consume_daily_quota(
+    p_employee_id BIGINT,
+    p_usage_date DATE,
+    p_amount DECIMAL,
+    p_max_daily_usage DECIMAL
+) RETURNS BOOLEAN AS $$
+BEGIN
+    IF p_amount > p_max_daily_usage THEN
+        RETURN FALSE;
+    END IF;
+
+    INSERT INTO employee_daily_usage AS u (employee_id, usage_date, amount)
+    VALUES (p_employee_id, p_usage_date, p_amount)
+    ON CONFLICT (employee_id, usage_date) DO UPDATE SET amount = u.amount + EXCLUDED.amount
+    WHERE u.amount + EXCLUDED.amount <= p_max_daily_usage;
+
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Gives back usage for one day (cancellations and refunds).
+CREATE OR REPLACE FUNCTION release_daily_quota(
+    p_employee_id BIGINT,
+    p_usage_date DATE,
+    p_amount DECIMAL
+) RETURNS VOID AS $$
+    UPDATE employee_daily_usage SET amount = GREATEST(amount - p_amount, 0)
+    WHERE employee_id = p_employee_id AND usage_date = p_usage_date;
+$$ LANGUAGE sql;
+
+-- Manager Balance Shards Table: each manager's BluDollar budget is split across
+-- several rows so a large team's bookings don't all queue on one row lock
+CREATE TABLE manager_balance_shards (
+    manager_id BIGINT NOT NULL REFERENCES managers(id) ON DELETE CASCADE,
+    shard_id SMALLINT NOT NULL,
+    balance DECIMAL(10, 2) NOT NULL DEFAULT 0 CHECK (balance >= 0),
+    row_version BIGINT NOT NULL DEFAULT 1,  -- Bumped on every update; their sum versions the manager's balance
+    PRIMARY KEY (manager_id, shard_id)
+);
+
+-- A manager's spendable balance is the sum of their shards
+CREATE VIEW manager_balances AS
+SELECT manager_id, SUM(balance) AS balance
+FROM manager_balance_shards
+GROUP BY manager_id;
+
+-- Spreads p_amount evenly over the manager's shards, creating them on first allocation.
+CREATE OR REPLACE FUNCTION allocate_manager_budget(
+    p_manager_id BIGINT,
+    p_amount DECIMAL,
+    p_shard_count INT DEFAULT 8
+) RETURNS VOID AS $$
+    INSERT INTO manager_balance_shards AS s (manager_id, shard_id, balance)
+    SELECT p_manager_id, shard_id,
+           TRUNC(p_amount / p_shard_count, 2)
+           + CASE WHEN shard_id = 0 THEN p_amount - TRUNC(p_amount / p_shard_count, 2) * p_shard_count ELSE 0 END
+    FROM generate_series(0, p_shard_count - 1) AS shard_id
+    ON CONFLICT (manager_id, shard_id) DO UPDATE SET balance = s.balance + EXCLUDED.balance;
+$$ LANGUAGE sql;
+
+-- Takes p_amount from a manager's budget. Debits one random shard that can cover it,
+-- preferring shards no other booking holds; only when no single shard can cover it
+-- does it lock every shard and spread the debit. Returns FALSE when the combined balance is too low.
+-- A transaction that already holds shard locks from an earlier debit (intake batches, block bookings)
+-- never waits for another shard: waiting while holding could deadlock with a transaction doing the
+-- same, so it fails at once with lock_not_available, which book_seat() reports as BALANCE_BUSY.
+CREATE OR REPLACE FUNCTION debit_manager_balance(
+    p_manager_id BIGINT,
+    p_amount DECIMAL
+) RETURNS BOOLEAN AS $$
+DECLARE
+    v_shard_id SMALLINT;
+    v_total DECIMAL;
+    v_remaining DECIMAL := p_amount;
+    v_shard RECORD;
+    v_holds_shards BOOLEAN := COALESCE(current_setting('blu.holds_shards', TRUE), '') = 'on';
+BEGIN
+    SELECT shard_id INTO v_shard_id FROM manager_balance_shards
+    WHERE manager_id = p_manager_id AND balance >= p_amount
+    ORDER BY random() LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+
+    IF NOT FOUND THEN
+        -- All fitting shards are busy: queue on one of them (the lock re-checks the balance)
+        IF v_holds_shards THEN
+            SELECT shard_id INTO v_shard_id FROM manager_balance_shards
+            WHERE manager_id = p_manager_id AND balance >= p_amount
+            ORDER BY random() LIMIT 1
+            FOR UPDATE NOWAIT;
+        ELSE
+            SELECT shard_id INTO v_shard_id FROM manager_balance_shards
+            WHERE manager_id = p_manager_id AND balance >= p_amount
+            ORDER BY random() LIMIT 1
+            FOR UPDATE;
+        END IF;
+    END IF;
+
+    IF FOUND THEN
+        -- Transaction-local, so it is undone with the (sub)transaction that took the lock
+        PERFORM set_config('blu.holds_shards', 'on', TRUE);
+        UPDATE manager_balance_shards SET balance = balance - p_amount
+        WHERE manager_id = p_manager_id AND shard_id = v_shard_id;
+        RETURN TRUE;
+    END IF;
+
+    -- Slow path: the budget is fragmented across shards
+    IF v_holds_shards THEN
+        SELECT SUM(balance) INTO v_total FROM (
+            SELECT balance FROM manager_balance_shards
+            WHERE manager_id = p_manager_id
+            ORDER BY shard_id
+            FOR UPDATE NOWAIT
+        ) locked;
+    ELSE
+        SELECT SUM(balance) INTO v_total FROM (
+            SELECT balance FROM manager_balance_shards
+            WHERE manager_id = p_manager_id
+            ORDER BY shard_id
+            FOR UPDATE
+        ) locked;
+    END IF;
+    PERFORM set_config('blu.holds_shards', 'on', TRUE);
+
+    IF v_total IS NULL OR v_total < p_amount THEN
+        RETURN FALSE;
+    END IF;
+
+    FOR v_shard IN
+        SELECT shard_id, balance FROM manager_balance_shards
+        WHERE manager_id = p_manager_id AND balance > 0
+        ORDER BY balance DESC
+    LOOP
+        UPDATE manager_balance_shards SET balance = balance - LEAST(v_shard.balance, v_remaining)
+        WHERE manager_id = p_manager_id AND shard_id = v_shard.shard_id;
+        v_remaining := v_remaining - LEAST(v_shard.balance, v_remaining);
+        EXIT WHEN v_remaining <= 0;
+    END LOOP;
+
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Returns p_amount to a manager's budget on a random shard, preferring one no booking holds.
+-- A manager without budget shards gets shard 0 created for the refund, so a credit is never
+-- dropped while its ledger row is written; always returns TRUE.
+CREATE OR REPLACE FUNCTION credit_manager_balance(
+    p_manager_id BIGINT,
+    p_amount DECIMAL
+) RETURNS BOOLEAN AS $$
+DECLARE
+    v_shard_id SMALLINT;
+BEGIN
+    SELECT shard_id INTO v_shard_id FROM manager_balance_shards
+    WHERE manager_id = p_manager_id
+    ORDER BY random() LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+
+    IF NOT FOUND THEN
+        SELECT shard_id INTO v_shard_id FROM manager_balance_shards
+        WHERE manager_id = p_manager_id
+        ORDER BY random() LIMIT 1;
+    END IF;
+
+    IF NOT FOUND THEN
+        INSERT INTO manager_balance_shards AS s (manager_id, shard_id, balance)
+        VALUES (p_manager_id, 0, p_amount)
+        ON CONFLICT (manager_id, shard_id) DO UPDATE SET balance = s.balance + EXCLUDED.balance;
+        RETURN TRUE;
+    END IF;
+
+    UPDATE manager_balance_shards SET balance = balance + p_amount
+    WHERE manager_id = p_manager_id AND shard_id = v_shard_id;
+
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Places a short hold on a seat-slot for checkout. Expired holds on the seat are reaped first
+-- so they can't trip seat_holds_no_overlap; live overlapping holds are rejected by it.
+CREATE OR REPLACE FUNCTION hold_seat(
+    p_seat_id BIGINT,
+    p_employee_id BIGINT,
+    p_start_time TIMESTAMP,
+    p_end_time TIMESTAMP,
+    p_ttl INTERVAL,
+    p_max_holds INT
+) RETURNS TABLE (result_code TEXT, hold_id BIGINT, expires_at TIMESTAMP) AS $$
+DECLARE
+    v_hold_id BIGINT;
+    v_expires_at TIMESTAMP := now()::TIMESTAMP + p_ttl;
+BEGIN
+    DELETE FROM seat_holds h WHERE h.seat_id = p_seat_id AND h.expires_at <= now()::TIMESTAMP;
+
+    IF (SELECT COUNT(*) FROM seat_holds h
+        WHERE h.employee_id = p_employee_id AND h.expires_at > now()::TIMESTAMP) >= p_max_holds THEN
+        RETURN QUERY SELECT 'TOO_MANY_HOLDS', NULL::BIGINT, NULL::TIMESTAMP;
+        RETURN;
+    END IF;
+
+    PERFORM 1 FROM reservations r
+    WHERE r.seat_id = p_seat_id AND r.status = 'RESERVED' AND r.during && tsrange(p_start_time, p_end_time);
+    IF FOUND THEN
+        RETURN QUERY SELECT 'SEAT_TAKEN', NULL::BIGINT, NULL::TIMESTAMP;
+        RETURN;
+    END IF;
+
+    BEGIN
+        INSERT INTO seat_holds (seat_id, employee_id, start_time, end_time, expires_at)
+        VALUES (p_seat_id, p_employee_id, p_start_time, p_end_time, v_expires_at)
+        RETURNING id INTO v_hold_id;
+    EXCEPTION
+        WHEN exclusion_violation THEN
+            RETURN QUERY SELECT 'SEAT_HELD', NULL::BIGINT, NULL::TIMESTAMP;
+            RETURN;
+        WHEN foreign_key_violation THEN
+            RETURN QUERY SELECT 'SEAT_NOT_FOUND', NULL::BIGINT, NULL::TIMESTAMP;
+            RETURN;
+    END;
+
+    RETURN QUERY SELECT 'HELD', v_hold_id, v_expires_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Books a seat in a single round trip: reservation insert (conflicts are caught by
+-- reservations_no_overlap), daily quota check, manager debit and ledger entry run in one transaction.
+-- With p_hold_id the employee's hold on the same slot is consumed in place of the hold check.
+-- Returns a result code instead of raising so callers can map it to a response;
+-- any failure after the first write rolls the whole block back.
+CREATE OR REPLACE FUNCTION book_seat(
+    p_seat_id BIGINT,
+    p_employee_id BIGINT,
+    p_manager_id BIGINT,
+    p_start_time TIMESTAMP,
+    p_end_time TIMESTAMP,
+    p_cost DECIMAL,
+    p_max_daily_usage DECIMAL,
+    p_hold_id BIGINT DEFAULT NULL
+) RETURNS TABLE (result_code TEXT, reservation_id BIGINT) AS $$
+DECLARE
+    v_reservation_id BIGINT;
+BEGIN
+    BEGIN
+        -- Also proves the employee still reports to the manager named in the token
+        PERFORM 1 FROM employees WHERE id = p_employee_id AND manager_id = p_manager_id;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'EMPLOYEE_NOT_FOUND';
+        END IF;
+
+        IF p_hold_id IS NOT NULL THEN
+            -- The hold already kept other checkouts off this slot; consume it instead of checking holds again
+            DELETE FROM seat_holds
+            WHERE id = p_hold_id AND employee_id = p_employee_id AND seat_id = p_seat_id
+            AND start_time = p_start_time AND end_time = p_end_time AND expires_at > now()::TIMESTAMP;
+            IF NOT FOUND THEN
+                RAISE EXCEPTION 'HOLD_NOT_FOUND';
+            END IF;
+        ELSE
+            PERFORM 1 FROM seat_holds
+            WHERE seat_id = p_seat_id AND during && tsrange(p_start_time, p_end_time)
+            AND expires_at > now()::TIMESTAMP AND employee_id <> p_employee_id;
+            IF FOUND THEN
+                RAISE EXCEPTION 'SEAT_HELD';
+            END IF;
+        END IF;
+
+        -- Claim the slot before touching the shared manager row so losing requests never queue on it
+        INSERT INTO reservations (seat_id, employee_id, start_time, end_time, status)
+        VALUES (p_seat_id, p_employee_id, p_start_time, p_end_time, 'RESERVED')
+        RETURNING id INTO v_reservation_id;
+
+        IF NOT consume_daily_quota(p_employee_id, p_start_time::DATE, p_cost, p_max_daily_usage) THEN
+            RAISE EXCEPTION 'DAILY_LIMIT_REACHED';
+        END IF;
+
+        IF NOT debit_manager_balance(p_manager_id, p_cost) THEN
+            IF EXISTS (SELECT 1 FROM managers WHERE id = p_manager_id) THEN
+                RAISE EXCEPTION 'INSUFFICIENT_BALANCE';
+            END IF;
+            RAISE EXCEPTION 'MANAGER_NOT_FOUND';
+        END IF;
+
+        INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
+        VALUES (p_manager_id, p_employee_id, p_cost, 'RESERVATION', 'Seat reservation');
+    EXCEPTION
+        WHEN exclusion_violation THEN
+            RETURN QUERY SELECT 'SEAT_TAKEN', NULL::BIGINT;
+            RETURN;
+        WHEN lock_not_available OR deadlock_detected THEN
+            -- Only this booking is rolled back, releasing its locks; the caller may retry it
+            RETURN QUERY SELECT 'BALANCE_BUSY', NULL::BIGINT;
+            RETURN;
+        WHEN foreign_key_violation THEN
+            RETURN QUERY SELECT 'SEAT_NOT_FOUND', NULL::BIGINT;
+            RETURN;
+        WHEN raise_exception THEN
+            RETURN QUERY SELECT SQLERRM, NULL::BIGINT;
+            RETURN;
+    END;
+
+    RETURN QUERY SELECT 'BOOKED', v_reservation_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Picks a free seat for the range and books it. Candidate seats are locked FOR NO KEY UPDATE
+-- SKIP LOCKED, so concurrent auto-assign calls each get a different seat instead of colliding,
+-- while plain bookings (which only take a key-share lock on the seat) are not blocked.
+-- Preference: 'seat_number' (lowest first), 'popular' (most booked in the last 30 days)
+-- or 'favorite' (the employee's own most booked seats in the last 90 days).
+CREATE OR REPLACE FUNCTION book_any_seat(
+    p_employee_id BIGINT,
+    p_manager_id BIGINT,
+    p_start_time TIMESTAMP,
+    p_end_time TIMESTAMP,
+    p_cost DECIMAL,
+    p_max_daily_usage DECIMAL,
+    p_preference TEXT DEFAULT 'seat_number'
+) RETURNS TABLE (result_code TEXT, reservation_id BIGINT, seat_id BIGINT) AS $$
+DECLARE
+    v_seat_id BIGINT;
+    v_result RECORD;
+BEGIN
+    -- A plain booking can still take the picked seat first; then try the next one
+    FOR v_attempt IN 1..3 LOOP
+        SELECT s.id INTO v_seat_id
+        FROM seats s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM reservations r
+            WHERE r.seat_id = s.id AND r.status = 'RESERVED' AND r.during && tsrange(p_start_time, p_end_time)
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM seat_holds h
+            WHERE h.seat_id = s.id AND h.employee_id <> p_employee_id
+            AND h.expires_at > now()::TIMESTAMP AND h.during && tsrange(p_start_time, p_end_time)
+        )
+        ORDER BY
+            CASE p_preference
+                WHEN 'popular' THEN (
+                    SELECT COUNT(*) FROM reservations r
+                    WHERE r.seat_id = s.id AND r.start_time >= now()::TIMESTAMP - INTERVAL '30 days'
+                )
+                WHEN 'favorite' THEN (
+                    SELECT COUNT(*) FROM reservations r
+                    WHERE r.seat_id = s.id AND r.employee_id = p_employee_id
+                    AND r.start_time >= now()::TIMESTAMP - INTERVAL '90 days'
+                )
+                ELSE 0
+            END DESC,
+            s.seat_number, s.id
+        LIMIT 1
+        FOR NO KEY UPDATE OF s SKIP LOCKED;
+
+        IF NOT FOUND THEN
+            RETURN QUERY SELECT 'NO_SEAT_AVAILABLE', NULL::BIGINT, NULL::BIGINT;
+            RETURN;
+        END IF;
+
+        SELECT * INTO v_result
+        FROM book_seat(v_seat_id, p_employee_id, p_manager_id, p_start_time, p_end_time, p_cost, p_max_daily_usage);
+
+        IF v_result.result_code NOT IN ('SEAT_TAKEN', 'SEAT_HELD') THEN
+            RETURN QUERY SELECT v_result.result_code, v_result.reservation_id, v_seat_id;
+            RETURN;
+        END IF;
+    END LOOP;
+
+    RETURN QUERY SELECT 'NO_SEAT_AVAILABLE', NULL::BIGINT, NULL::BIGINT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Books several seat-slots for one employee in a single call. One set-based pass flags
+-- unknown seats, clashes with existing reservations and overlaps inside the batch;
+-- quota is charged per day, the manager is debited once and one ledger entry covers the batch.
+-- In atomic mode any failed item rejects the whole batch (others report BATCH_REJECTED);
+-- in partial mode the remaining items are booked. Returns one row per item, in input order.
+CREATE OR REPLACE FUNCTION book_seats_batch(
+    p_employee_id BIGINT,
+    p_manager_id BIGINT,
+    p_seat_ids BIGINT[],
+    p_start_times TIMESTAMP[],
+    p_end_times TIMESTAMP[],
+    p_cost DECIMAL,
+    p_max_daily_usage DECIMAL,
+    p_partial BOOLEAN
+) RETURNS TABLE (item_index INT, result_code TEXT, reservation_id BIGINT) AS $$
+DECLARE
+    v_count INT := COALESCE(array_length(p_seat_ids, 1), 0);
+    v_codes TEXT[];
+    v_ids BIGINT[];
+    v_day RECORD;
+    v_item RECORD;
+    v_used DECIMAL;
+    v_allowed INT;
+    v_accepted INT;
+    v_balance DECIMAL;
+BEGIN
+    PERFORM 1 FROM employees WHERE id = p_employee_id AND manager_id = p_manager_id;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT i::INT, 'EMPLOYEE_NOT_FOUND', NULL::BIGINT FROM generate_series(1, v_count) AS i;
+        RETURN;
+    END IF;
+
+    -- A concurrent booking can still take a slot between the check and the insert;
+    -- the exclusion constraint catches it and the batch is re-evaluated against the new state
+    FOR v_attempt IN 1..3 LOOP
+        BEGIN
+            v_ids := array_fill(NULL::BIGINT, ARRAY[v_count]);
+
+            WITH items AS (
+                SELECT * FROM unnest(p_seat_ids, p_start_times, p_end_times) WITH ORDINALITY AS i(seat_id, start_time, end_time, idx)
+            )
+            SELECT array_agg(
+                CASE
+                    WHEN NOT EXISTS (SELECT 1 FROM seats s WHERE s.id = i.seat_id) THEN 'SEAT_NOT_FOUND'
+                    WHEN EXISTS (
+                        SELECT 1 FROM reservations r
+                        WHERE r.seat_id = i.seat_id AND r.status = 'RESERVED'
+                        AND r.during && tsrange(i.start_time, i.end_time)
+                    ) THEN 'SEAT_TAKEN'
+                    WHEN EXISTS (
+                        SELECT 1 FROM seat_holds h
+                        WHERE h.seat_id = i.seat_id AND h.employee_id <> p_employee_id
+                        AND h.expires_at > now()::TIMESTAMP AND h.during && tsrange(i.start_time, i.end_time)
+                    ) THEN 'SEAT_HELD'
+                    WHEN EXISTS (
+                        SELECT 1 FROM items j
+                        WHERE j.idx < i.idx AND j.seat_id = i.seat_id
+                        AND tsrange(j.start_time, j.end_time) && tsrange(i.start_time, i.end_time)
+                    ) THEN 'DUPLICATE_ITEM'
+                END ORDER BY i.idx
+            ) INTO v_codes
+            FROM items i;
+
+            IF NOT p_partial AND EXISTS (SELECT 1 FROM unnest(v_codes) AS c WHERE c IS NOT NULL) THEN
+                RAISE EXCEPTION 'BATCH_REJECTED';
+            END IF;
+
+            -- Daily quota: lock each day's counter once and admit items in input order
+            FOR v_day IN
+                SELECT i.start_time::DATE AS usage_date, array_agg(i.idx ORDER BY i.idx) AS idxs
+                FROM unnest(p_start_times) WITH ORDINALITY AS i(start_time, idx)
+                WHERE v_codes[i.idx] IS NULL
+                GROUP BY 1
+                ORDER BY 1
+            LOOP
+                INSERT INTO employee_daily_usage (employee_id, usage_date) VALUES (p_employee_id, v_day.usage_date)
+                ON CONFLICT DO NOTHING;
+                SELECT amount INTO v_used FROM employee_daily_usage
+                WHERE employee_id = p_employee_id AND usage_date = v_day.usage_date
+                FOR UPDATE;
+
+                v_allowed := LEAST(GREATEST(FLOOR((p_max_daily_usage - v_used) / p_cost), 0), array_length(v_day.idxs, 1));
+                FOR v_n IN v_allowed + 1 .. array_length(v_day.idxs, 1) LOOP
+                    v_codes[v_day.idxs[v_n]] := 'DAILY_LIMIT_REACHED';
+                END LOOP;
+
+                UPDATE employee_daily_usage SET amount = amount + v_allowed * p_cost
+                WHERE employee_id = p_employee_id AND usage_date = v_day.usage_date;
+            END LOOP;
+
+            SELECT count(*) INTO v_accepted FROM unnest(v_codes) AS c WHERE c IS NULL;
+            IF NOT p_partial AND v_accepted < v_count THEN
+                RAISE EXCEPTION 'BATCH_REJECTED';
+            END IF;
+
+            IF v_accepted > 0 AND NOT debit_manager_balance(p_manager_id, v_accepted * p_cost) THEN
+                IF NOT p_partial THEN
+                    SELECT array_agg(COALESCE(c, 'INSUFFICIENT_BALANCE') ORDER BY idx) INTO v_codes
+                    FROM unnest(v_codes) WITH ORDINALITY AS u(c, idx);
+                    RAISE EXCEPTION 'BATCH_REJECTED';
+                END IF;
+
+                -- Book as many items as the budget covers; the failed debit already holds every shard
+                SELECT COALESCE(SUM(balance), 0) INTO v_balance FROM manager_balance_shards WHERE manager_id = p_manager_id;
+                v_allowed := FLOOR(v_balance / p_cost);
+                FOR v_item IN
+                    SELECT i.idx, i.start_time FROM unnest(p_start_times) WITH ORDINALITY AS i(start_time, idx)
+                    WHERE v_codes[i.idx] IS NULL
+                    ORDER BY i.idx
+                    OFFSET v_allowed
+                LOOP
+                    v_codes[v_item.idx] := 'INSUFFICIENT_BALANCE';
+                    PERFORM release_daily_quota(p_employee_id, v_item.start_time::DATE, p_cost);
+                END LOOP;
+
+                v_accepted := LEAST(v_accepted, v_allowed);
+                IF v_accepted > 0 THEN
+                    PERFORM debit_manager_balance(p_manager_id, v_accepted * p_cost);
+                END IF;
+            END IF;
+
+            IF v_accepted > 0 THEN
+                INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
+                VALUES (p_manager_id, p_employee_id, v_accepted * p_cost, 'RESERVATION',
+                        format('Batch seat reservation (%s seats)', v_accepted));
+
+                FOR v_item IN
+                    WITH inserted AS (
+                        INSERT INTO reservations (seat_id, employee_id, start_time, end_time, status)
+                        SELECT i.seat_id, p_employee_id, i.start_time, i.end_time, 'RESERVED'
+                        FROM unnest(p_seat_ids, p_start_times, p_end_times) WITH ORDINALITY AS i(seat_id, start_time, end_time, idx)
+                        WHERE v_codes[i.idx] IS NULL
+                        RETURNING id, seat_id, start_time
+                    )
+                    SELECT i.idx, ins.id
+                    FROM inserted ins
+                    JOIN unnest(p_seat_ids, p_start_times) WITH ORDINALITY AS i(seat_id, start_time, idx)
+                      ON i.seat_id = ins.seat_id AND i.start_time = ins.start_time AND v_codes[i.idx] IS NULL
+                LOOP
+                    v_ids[v_item.idx] := v_item.id;
+                END LOOP;
+            END IF;
+
+            RETURN QUERY
+            SELECT u.idx::INT, COALESCE(u.code, 'BOOKED'), v_ids[u.idx]
+            FROM unnest(v_codes) WITH ORDINALITY AS u(code, idx);
+            RETURN;
+        EXCEPTION
+            WHEN exclusion_violation THEN
+                NULL;  -- Retry with fresh conflict data
+            WHEN raise_exception THEN
+                RETURN QUERY
+                SELECT u.idx::INT, COALESCE(u.code, 'BATCH_REJECTED'), NULL::BIGINT
+                FROM unnest(v_codes) WITH ORDINALITY AS u(code, idx);
+                RETURN;
+        END;
+    END LOOP;
+
+    RETURN QUERY SELECT i::INT, 'SEAT_TAKEN', NULL::BIGINT FROM generate_series(1, v_count) AS i;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Books every occurrence of a daily or weekly rule in one transaction. The rule is expanded
+-- server-side, all occurrences are checked against reservations in a single join, quota is
+-- charged per day with one upsert, and the rows are bulk-inserted with one ledger entry each.
+-- Conflicting occurrences reject the series (listed in conflicts) unless p_skip_conflicts is set.
+CREATE OR REPLACE FUNCTION book_recurring_series(
+    p_employee_id BIGINT,
+    p_manager_id BIGINT,
+    p_seat_id BIGINT,
+    p_start_time TIMESTAMP,
+    p_end_time TIMESTAMP,
+    p_frequency TEXT,
+    p_weekdays INT[],
+    p_until DATE,
+    p_cost DECIMAL,
+    p_max_daily_usage DECIMAL,
+    p_skip_conflicts BOOLEAN
+) RETURNS TABLE (result_code TEXT, series_id BIGINT, booked INT, conflicts TIMESTAMP[]) AS $$
+DECLARE
+    v_starts TIMESTAMP[];
+    v_conflicts TIMESTAMP[];
+    v_count INT;
+    v_charged INT;
+    v_series_id BIGINT;
+BEGIN
+    PERFORM 1 FROM employees WHERE id = p_employee_id AND manager_id = p_manager_id;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'EMPLOYEE_NOT_FOUND', NULL::BIGINT, 0, NULL::TIMESTAMP[];
+        RETURN;
+    END IF;
+
+    PERFORM 1 FROM seats WHERE id = p_seat_id;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'SEAT_NOT_FOUND', NULL::BIGINT, 0, NULL::TIMESTAMP[];
+        RETURN;
+    END IF;
+
+    -- Expand the rule and find clashing occurrences in one pass
+    SELECT
+        array_agg(o.start_time ORDER BY o.start_time) FILTER (WHERE NOT o.taken),
+        array_agg(o.start_time ORDER BY o.start_time) FILTER (WHERE o.taken)
+    INTO v_starts, v_conflicts
+    FROM (
+        SELECT d.day + p_start_time::TIME AS start_time,
+               EXISTS (
+                   SELECT 1 FROM reservations r
+                   WHERE r.seat_id = p_seat_id AND r.status = 'RESERVED'
+                   AND r.during && tsrange(d.day + p_start_time::TIME, d.day + p_start_time::TIME + (p_end_time - p_start_time))
+               ) OR EXISTS (
+                   SELECT 1 FROM seat_holds h
+                   WHERE h.seat_id = p_seat_id AND h.employee_id <> p_employee_id AND h.expires_at > now()::TIMESTAMP
+                   AND h.during && tsrange(d.day + p_start_time::TIME, d.day + p_start_time::TIME + (p_end_time - p_start_time))
+               ) AS taken
+        FROM generate_series(p_start_time::DATE::TIMESTAMP, p_until::TIMESTAMP, INTERVAL '1 day') AS d(day)
+        WHERE p_frequency = 'DAILY' OR EXTRACT(ISODOW FROM d.day)::INT = ANY(p_weekdays)
+    ) o;
+
+    IF v_conflicts IS NOT NULL AND NOT p_skip_conflicts THEN
+        RETURN QUERY SELECT 'SEAT_TAKEN', NULL::BIGINT, 0, v_conflicts;
+        RETURN;
+    END IF;
+
+    v_count := COALESCE(array_length(v_starts, 1), 0);
+    IF v_count = 0 THEN
+        RETURN QUERY SELECT 'NO_OCCURRENCES', NULL::BIGINT, 0, v_conflicts;
+        RETURN;
+    END IF;
+
+    BEGIN
+        -- Charge every occurrence's day at once; days already at the limit are not updated
+        WITH charged AS (
+            INSERT INTO employee_daily_usage AS u (employee_id, usage_date, amount)
+            SELECT p_employee_id, s::DATE, p_cost FROM unnest(v_starts) AS s
+            WHERE p_cost <= p_max_daily_usage
+            ON CONFLICT (employee_id, usage_date) DO UPDATE SET amount = u.amount + EXCLUDED.amount
+            WHERE u.amount + EXCLUDED.amount <= p_max_daily_usage
+            RETURNING 1
+        )
+        SELECT count(*) INTO v_charged FROM charged;
+        IF v_charged < v_count THEN
+            RAISE EXCEPTION 'DAILY_LIMIT_REACHED';
+        END IF;
+
+        IF NOT debit_manager_balance(p_manager_id, v_count * p_cost) THEN
+            RAISE EXCEPTION 'INSUFFICIENT_BALANCE';
+        END IF;
+
+        INSERT INTO reservation_series (seat_id, employee_id, frequency, weekdays, start_time, end_time, until_date)
+        VALUES (p_seat_id, p_employee_id, p_frequency, p_weekdays, p_start_time, p_end_time, p_until)
+        RETURNING id INTO v_series_id;
+
+        INSERT INTO reservations (seat_id, employee_id, start_time, end_time, status, series_id)
+        SELECT p_seat_id, p_employee_id, s, s + (p_end_time - p_start_time), 'RESERVED', v_series_id
+        FROM unnest(v_starts) AS s;
+
+        INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
+        SELECT p_manager_id, p_employee_id, p_cost, 'RESERVATION', format('Recurring seat reservation (series %s, %s)', v_series_id, s::DATE)
+        FROM unnest(v_starts) AS s;
+    EXCEPTION
+        WHEN exclusion_violation THEN
+            RETURN QUERY SELECT 'SEAT_TAKEN', NULL::BIGINT, 0, v_conflicts;
+            RETURN;
+        WHEN raise_exception THEN
+            RETURN QUERY SELECT SQLERRM, NULL::BIGINT, 0, v_conflicts;
+            RETURN;
+    END;
+
+    RETURN QUERY SELECT 'BOOKED', v_series_id, v_count, v_conflicts;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cancels all upcoming occurrences of a series with one set-based update. Occurrences starting
+-- within p_min_notice are kept, matching the single-booking cancellation rule. Refunds go back
+-- to the manager in one credit, quota per day, with one ledger row per cancelled occurrence.
+CREATE OR REPLACE FUNCTION cancel_recurring_series(
+    p_series_id BIGINT,
+    p_employee_id BIGINT,
+    p_cost DECIMAL,
+    p_min_notice INTERVAL,
+    p_max_daily_usage DECIMAL
+) RETURNS TABLE (result_code TEXT, canceled INT) AS $$
+DECLARE
+    v_manager_id BIGINT;
+    v_seat_id BIGINT;
+    v_starts TIMESTAMP[];
+    v_ends TIMESTAMP[];
+    v_count INT;
+BEGIN
+    UPDATE reservation_series SET status = 'CANCELED'
+    WHERE id = p_series_id AND employee_id = p_employee_id AND status = 'ACTIVE'
+    RETURNING seat_id INTO v_seat_id;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'SERIES_NOT_FOUND', 0;
+        RETURN;
+    END IF;
+
+    WITH cancelled AS (
+        UPDATE reservations SET status = 'CANCELED'
+        WHERE series_id = p_series_id AND status = 'RESERVED' AND start_time >= now()::TIMESTAMP + p_min_notice
+        RETURNING start_time, end_time
+    )
+    SELECT array_agg(start_time ORDER BY start_time), array_agg(end_time ORDER BY start_time)
+    INTO v_starts, v_ends FROM cancelled;
+
+    v_count := COALESCE(array_length(v_starts, 1), 0);
+    IF v_count > 0 THEN
+        SELECT manager_id INTO v_manager_id FROM employees WHERE id = p_employee_id;
+        PERFORM credit_manager_balance(v_manager_id, v_count * p_cost);
+
+        UPDATE employee_daily_usage u SET amount = GREATEST(u.amount - p_cost, 0)
+        FROM unnest(v_starts) AS s
+        WHERE u.employee_id = p_employee_id AND u.usage_date = s::DATE;
+
+        INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
+        SELECT v_manager_id, p_employee_id, p_cost, 'CANCELLATION', format('Recurring reservation cancellation refund (series %s, %s)', p_series_id, s::DATE)
+        FROM unnest(v_starts) AS s;
+
+        PERFORM promote_waitlist(v_seat_id, f.start_time, f.end_time, p_cost, p_max_daily_usage)
+        FROM unnest(v_starts, v_ends) AS f(start_time, end_time);
+    END IF;
+
+    RETURN QUERY SELECT 'CANCELED', v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Processes up to p_batch_size queued booking requests, oldest first, in the caller's transaction.
+-- Rows are claimed with SKIP LOCKED so several workers drain the queue side by side; each request
+-- runs through book_seat() (its failures roll back only that request) and the whole batch shares
+-- one commit. Returns each ticket's result and how long it waited in the queue.
+-- BALANCE_BUSY is a passing shard-lock conflict, not an outcome: the request is retried a few
+-- times, then left PENDING (and not returned) for a later batch to pick up again.
+CREATE OR REPLACE FUNCTION drain_booking_requests(
+    p_batch_size INT,
+    p_cost DECIMAL,
+    p_max_daily_usage DECIMAL
+) RETURNS TABLE (ticket_id BIGINT, result_code TEXT, reservation_id BIGINT, queued_seconds DOUBLE PRECISION) AS $$
+DECLARE
+    v_request RECORD;
+    v_result RECORD;
+BEGIN
+    FOR v_request IN
+        SELECT q.id, q.seat_id, q.employee_id, q.manager_id, q.start_time, q.end_time, q.created_at
+        FROM booking_requests q
+        WHERE q.status = 'PENDING'
+        ORDER BY q.id
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    LOOP
+        FOR v_attempt IN 1..3 LOOP
+            SELECT * INTO v_result
+            FROM book_seat(v_request.seat_id, v_request.employee_id, v_request.manager_id,
+                           v_request.start_time, v_request.end_time, p_cost, p_max_daily_usage);
+            EXIT WHEN v_result.result_code <> 'BALANCE_BUSY';
+        END LOOP;
+
+        CONTINUE WHEN v_result.result_code = 'BALANCE_BUSY';
+
+        UPDATE booking_requests q
+        SET status = 'DONE', result_code = v_result.result_code, reservation_id = v_result.reservation_id,
+            processed_at = clock_timestamp()
+        WHERE q.id = v_request.id;
+
+        ticket_id := v_request.id;
+        result_code := v_result.result_code;
+        reservation_id := v_result.reservation_id;
+        queued_seconds := EXTRACT(EPOCH FROM clock_timestamp()::TIMESTAMP - v_request.created_at);
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Offers a freed seat-slot to the waitlist. Waiters whose range fits inside it, for this seat
+-- or any seat, are tried oldest first through book_seat(), so the usual hold, quota and balance
+-- checks apply; waiters that can't be booked stay queued. A long slot can promote several waiters.
+CREATE OR REPLACE FUNCTION promote_waitlist(
+    p_seat_id BIGINT,
+    p_start_time TIMESTAMP,
+    p_end_time TIMESTAMP,
+    p_cost DECIMAL,
+    p_max_daily_usage DECIMAL,
+    p_max_attempts INT DEFAULT 10
+) RETURNS TABLE (waitlist_id BIGINT, reservation_id BIGINT) AS $$
+DECLARE
+    v_entry RECORD;
+    v_result RECORD;
+BEGIN
+    IF p_end_time <= now()::TIMESTAMP THEN
+        RETURN;
+    END IF;
+
+    FOR v_entry IN
+        SELECT w.id, w.employee_id, w.start_time, w.end_time, e.manager_id
+        FROM waitlist_entries w
+        JOIN employees e ON e.id = w.employee_id
+        WHERE w.status = 'WAITING'
+        AND w.during <@ tsrange(GREATEST(p_start_time, now()::TIMESTAMP), p_end_time)
+        AND (w.seat_id = p_seat_id OR w.seat_id IS NULL)
+        ORDER BY w.created_at, w.id
+        LIMIT p_max_attempts
+        FOR UPDATE OF w SKIP LOCKED
+    LOOP
+        SELECT * INTO v_result
+        FROM book_seat(p_seat_id, v_entry.employee_id, v_entry.manager_id, v_entry.start_time, v_entry.end_time, p_cost, p_max_daily_usage);
+
+        IF v_result.result_code = 'BOOKED' THEN
+            UPDATE waitlist_entries w
+            SET status = 'PROMOTED', reservation_id = v_result.reservation_id, promoted_at = now()
+            WHERE w.id = v_entry.id;
+
+            waitlist_id := v_entry.id;
+            reservation_id := v_result.reservation_id;
+            RETURN NEXT;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Moves and/or resizes a reservation in place (NULL keeps the current seat, start or end).
+-- Only the part of the new slot the reservation didn't already cover is checked for conflicts,
+-- quota moves between days only if the date changes, one MODIFICATION ledger row records the
+-- change instead of a refund and re-debit, and whatever part of the old slot is given up
+-- is offered to the waitlist. Once started, only the end time can change.
+CREATE OR REPLACE FUNCTION modify_reservation(
+    p_reservation_id BIGINT,
+    p_employee_id BIGINT,
+    p_seat_id BIGINT,
+    p_start_time TIMESTAMP,
+    p_end_time TIMESTAMP,
+    p_cost DECIMAL,
+    p_max_daily_usage DECIMAL
+) RETURNS TEXT AS $$
+DECLARE
+    v_old RECORD;
+    v_seat_id BIGINT;
+    v_start TIMESTAMP;
+    v_end TIMESTAMP;
+    v_added tsmultirange;
+    v_freed tsmultirange;
+    v_now TIMESTAMP := now()::TIMESTAMP;
+BEGIN
+    SELECT r.seat_id, r.start_time, r.end_time, e.manager_id INTO v_old
+    FROM reservations r
+    JOIN employees e ON e.id = r.employee_id
+    WHERE r.id = p_reservation_id AND r.employee_id = p_employee_id AND r.status = 'RESERVED'
+    FOR UPDATE OF r;
+    IF NOT FOUND THEN
+        RETURN 'RESERVATION_NOT_FOUND';
+    END IF;
+
+    v_seat_id := COALESCE(p_seat_id, v_old.seat_id);
+    v_start := COALESCE(p_start_time, v_old.start_time);
+    v_end := COALESCE(p_end_time, v_old.end_time);
+
+    IF v_start >= v_end THEN
+        RETURN 'INVALID_RANGE';
+    END IF;
+    IF v_old.end_time <= v_now OR v_end <= v_now THEN
+        RETURN 'ALREADY_ENDED';
+    END IF;
+    IF (v_old.start_time <= v_now OR v_start <= v_now)
+       AND (v_seat_id <> v_old.seat_id OR v_start <> v_old.start_time) THEN
+        RETURN 'ALREADY_STARTED';
+    END IF;
+    IF v_seat_id = v_old.seat_id AND v_start = v_old.start_time AND v_end = v_old.end_time THEN
+        RETURN 'MODIFIED';
+    END IF;
+
+    IF v_seat_id = v_old.seat_id THEN
+        v_added := tsmultirange(tsrange(v_start, v_end)) - tsmultirange(tsrange(v_old.start_time, v_old.end_time));
+        v_freed := tsmultirange(tsrange(v_old.start_time, v_old.end_time)) - tsmultirange(tsrange(v_start, v_end));
+    ELSE
+        v_added := tsmultirange(tsrange(v_start, v_end));
+        v_freed := tsmultirange(tsrange(v_old.start_time, v_old.end_time));
+    END IF;
+
+    BEGIN
+        IF NOT isempty(v_added) THEN
+            PERFORM 1 FROM reservations r
+            WHERE r.seat_id = v_seat_id AND r.status = 'RESERVED' AND r.id <> p_reservation_id
+            AND r.during && v_added;
+            IF FOUND THEN
+                RAISE EXCEPTION 'SEAT_TAKEN';
+            END IF;
+
+            PERFORM 1 FROM seat_holds h
+            WHERE h.seat_id = v_seat_id AND h.employee_id <> p_employee_id
+            AND h.expires_at > v_now AND h.during && v_added;
+            IF FOUND THEN
+                RAISE EXCEPTION 'SEAT_HELD';
+            END IF;
+        END IF;
+
+        IF v_start::DATE <> v_old.start_time::DATE THEN
+            IF NOT consume_daily_quota(p_employee_id, v_start::DATE, p_cost, p_max_daily_usage) THEN
+                RAISE EXCEPTION 'DAILY_LIMIT_REACHED';
+            END IF;
+            PERFORM release_daily_quota(p_employee_id, v_old.start_time::DATE, p_cost);
+        END IF;
+
+        -- The exclusion constraint still catches a booking that raced into the added range
+        UPDATE reservations SET seat_id = v_seat_id, start_time = v_start, end_time = v_end
+        WHERE id = p_reservation_id;
+
+        -- Reservations are priced per booking, so the difference is zero; the row keeps the audit trail
+        INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
+        VALUES (v_old.manager_id, p_employee_id, 0, 'MODIFICATION',
+                format('Reservation %s changed from seat %s, %s - %s to seat %s, %s - %s', p_reservation_id,
+                       v_old.seat_id, v_old.start_time, v_old.end_time, v_seat_id, v_start, v_end));
+    EXCEPTION
+        WHEN exclusion_violation THEN
+            RETURN 'SEAT_TAKEN';
+        WHEN foreign_key_violation THEN
+            RETURN 'SEAT_NOT_FOUND';
+        WHEN raise_exception THEN
+            RETURN SQLERRM;
+    END;
+
+    PERFORM promote_waitlist(v_old.seat_id, lower(f), upper(f), p_cost, p_max_daily_usage)
+    FROM unnest(v_freed) AS f;
+
+    RETURN 'MODIFIED';
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cancels and refunds up to p_limit active reservations matching a bulk cancellation job in
+-- one transaction, so a large closure never holds many row locks at once. Refunds are summed
+-- into one credit per manager, quota is given back per employee and day, the ledger rows go
+-- in with one multi-row insert, and the job's progress counters move with the same commit.
+-- Reservations already over are left for the sweeper. Returns how many were cancelled.
+CREATE OR REPLACE FUNCTION cancel_reservations_chunk(
+    p_job_id BIGINT,
+    p_cost DECIMAL,
+    p_limit INT
+) RETURNS INT AS $$
+DECLARE
+    v_job RECORD;
+    v_employee_ids BIGINT[];
+    v_manager_ids BIGINT[];
+    v_dates DATE[];
+    v_count INT;
+BEGIN
+    SELECT seat_ids, start_time, end_time, reason INTO v_job
+    FROM bulk_cancellations WHERE id = p_job_id AND status = 'RUNNING';
+    IF NOT FOUND THEN
+        RETURN 0;
+    END IF;
+
+    WITH picked AS (
+        SELECT r.id FROM reservations r
+        WHERE r.status = 'RESERVED' AND r.during && tsrange(v_job.start_time, v_job.end_time)
+        AND r.end_time > now()::TIMESTAMP
+        AND (v_job.seat_ids IS NULL OR r.seat_id = ANY(v_job.seat_ids))
+        ORDER BY r.id
+        LIMIT p_limit
+        FOR UPDATE
+    ), canceled AS (
+        UPDATE reservations r SET status = 'CANCELED'
+        FROM picked WHERE r.id = picked.id
+        RETURNING r.employee_id, r.start_time
+    )
+    SELECT array_agg(c.employee_id), array_agg(e.manager_id), array_agg(c.start_time::DATE)
+    INTO v_employee_ids, v_manager_ids, v_dates
+    FROM canceled c
+    JOIN employees e ON e.id = c.employee_id;
+
+    v_count := COALESCE(array_length(v_employee_ids, 1), 0);
+    IF v_count = 0 THEN
+        RETURN 0;
+    END IF;
+
+    PERFORM credit_manager_balance(m.manager_id, m.refund)
+    FROM (
+        SELECT manager_id, COUNT(*) * p_cost AS refund
+        FROM unnest(v_manager_ids) AS manager_id
+        GROUP BY manager_id
+        ORDER BY manager_id
+    ) m;
+
+    UPDATE employee_daily_usage u SET amount = GREATEST(u.amount - q.n * p_cost, 0)
+    FROM (
+        SELECT employee_id, usage_date, COUNT(*) AS n
+        FROM unnest(v_employee_ids, v_dates) AS c(employee_id, usage_date)
+        GROUP BY employee_id, usage_date
+    ) q
+    WHERE u.employee_id = q.employee_id AND u.usage_date = q.usage_date;
+
+    INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
+    SELECT manager_id, employee_id, p_cost, 'CANCELLATION', 'Seat reservation cancelled: ' || v_job.reason
+    FROM unnest(v_manager_ids, v_employee_ids) AS c(manager_id, employee_id);
+
+    UPDATE bulk_cancellations
+    SET canceled = canceled + v_count, refunded = refunded + v_count * p_cost, chunks = chunks + 1
+    WHERE id = p_job_id;
+
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Idempotency Keys Table: the response each (user, Idempotency-Key) pair produced,
+-- so a retried booking or cancellation is answered without running again
+CREATE TABLE idempotency_keys (
+    user_id BIGINT NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,  -- SHA-256 of method, path and body the key was first used with
+    status_code INT,  -- NULL while the first request is still in flight
+    response JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key)
+);
+
+CREATE INDEX idx_idempotency_keys_expires ON idempotency_keys (expires_at);
+
+-- Broadcasts every change that affects seat availability on the seat_changes channel, so
+-- seat_service can keep its in-memory availability index current without re-querying.
+-- The payload is the row's new state (its last state for deletes).
+CREATE OR REPLACE FUNCTION notify_seat_change() RETURNS TRIGGER AS $$
+DECLARE
+    v_row JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        v_row := to_jsonb(OLD);
+    ELSE
+        v_row := to_jsonb(NEW);
+    END IF;
+
+    PERFORM pg_notify('seat_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'row', v_row - 'during' - 'created_at'
+    )::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER seats_notify
+AFTER INSERT OR UPDATE OR DELETE ON seats
+FOR EACH ROW EXECUTE FUNCTION notify_seat_change();
+
+CREATE TRIGGER seat_holds_notify
+AFTER INSERT OR UPDATE OR DELETE ON seat_holds
+FOR EACH ROW EXECUTE FUNCTION notify_seat_change();
+
+CREATE TRIGGER reservations_notify
+AFTER INSERT OR DELETE ON reservations
+FOR EACH ROW EXECUTE FUNCTION notify_seat_change();
+
+-- Check-ins and other bookkeeping updates don't change availability and stay silent
+CREATE TRIGGER reservations_notify_update
+AFTER UPDATE ON reservations
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.seat_id IS DISTINCT FROM NEW.seat_id
+      OR OLD.start_time IS DISTINCT FROM NEW.start_time OR OLD.end_time IS DISTINCT FROM NEW.end_time)
+EXECUTE FUNCTION notify_seat_change();
+
+-- Increments row_version on every update, so a reader can tell whether a row changed (and answer
+-- conditional GETs) by comparing one number instead of re-reading and re-serializing the row.
+-- The bump happens on a row the update is already writing, so it takes no extra lock.
+CREATE OR REPLACE FUNCTION bump_row_version() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.row_version := OLD.row_version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER managers_row_version
+BEFORE UPDATE ON managers
+FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER employees_row_version
+BEFORE UPDATE ON employees
+FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER manager_balance_shards_row_version
+BEFORE UPDATE ON manager_balance_shards
+FOR EACH ROW EXECUTE FUNCTION bump_row_version();
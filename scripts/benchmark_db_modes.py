@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import asyncpg
+import psycopg2
+import psycopg2.pool
+
+# Database connection details
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_NAME = os.getenv("POSTGRES_DB", "blu_reserve")
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+
+# Same availability query seat_service runs for GET /seats?filter=available
+AVAILABILITY_QUERY = """
+    SELECT s.id, s.seat_number
+    FROM seats s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM reservations r
+        WHERE r.seat_id = s.id AND r.status = 'RESERVED'
+        AND r.during && tsrange({start}, {end})
+    )
+"""
+
+
+def random_window():
+    """Pick a 1-4 hour slot within the next week, as a booking client would."""
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=random.randint(1, 24 * 7))
+    return start, start + timedelta(hours=random.randint(1, 4))
+
+
+def summarize(mode, latencies, elapsed):
+    """Print throughput and latency percentiles for one run."""
+    latencies.sort()
+    pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    print(f"[📊] {mode:<5} requests={len(latencies)} elapsed={elapsed:.2f}s "
+          f"throughput={len(latencies) / elapsed:.1f} req/s "
+          f"p50={pct(0.50):.1f}ms p95={pct(0.95):.1f}ms p99={pct(0.99):.1f}ms "
+          f"mean={statistics.mean(latencies) * 1000:.1f}ms")
+
+
+def run_sync(args):
+    """psycopg2 + thread pool, the way FastAPI executes sync `def` handlers."""
+    pool = psycopg2.pool.ThreadedConnectionPool(
+        1, args.pool_size, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
+    )
+    query = AVAILABILITY_QUERY.format(start="%s", end="%s")
+    slots = threading.BoundedSemaphore(args.pool_size)  # ThreadedConnectionPool raises instead of waiting
+
+    def one_request(_):
+        started = time.perf_counter()
+        start, end = random_window()
+        with slots:
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    if args.db_latency_ms:
+                        cur.execute("SELECT pg_sleep(%s)", (args.db_latency_ms / 1000,))
+                    cur.execute(query, (start, end))
+                    cur.fetchall()
+                conn.rollback()
+            finally:
+                pool.putconn(conn)
+        return time.perf_counter() - started
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        latencies = list(executor.map(one_request, range(args.requests)))
+    summarize("sync", latencies, time.perf_counter() - began)
+    pool.closeall()
+
+
+async def run_async(args):
+    """asyncpg pool + coroutines, the way booking_service and seat_service now run."""
+    pool = await asyncpg.create_pool(
+        host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+        min_size=1, max_size=args.pool_size
+    )
+    query = AVAILABILITY_QUERY.format(start="$2", end="$1")
+    in_flight = asyncio.Semaphore(args.concurrency)
+
+    async def one_request():
+        async with in_flight:
+            started = time.perf_counter()
+            start, end = random_window()
+            async with pool.acquire() as conn:
+                if args.db_latency_ms:
+                    await conn.execute("SELECT pg_sleep($1)", args.db_latency_ms / 1000)
+                await conn.fetch(query, end, start)
+            return time.perf_counter() - started
+
+    began = time.perf_counter()
+    latencies = await asyncio.gather(*(one_request() for _ in range(args.requests)))
+    summarize("async", list(latencies), time.perf_counter() - began)
+    await pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync (psycopg2 + threads) and async (asyncpg) database access on the same workload.")
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=2000, help="Total availability lookups per mode")
+    parser.add_argument("--concurrency", type=int, default=200, help="Concurrent in-flight requests (async mode)")
+    parser.add_argument("--threads", type=int, default=40, help="Worker threads (sync mode; FastAPI's default threadpool is 40)")
+    parser.add_argument("--pool-size", type=int, default=50, help="Max database connections in both modes")
+    parser.add_argument("--db-latency-ms", type=float, default=0, help="Extra server-side pg_sleep per request to mimic a slow database")
+    args = parser.parse_args()
+
+    print(f"[⏳] Benchmarking {args.requests} requests, pool size {args.pool_size}, extra DB latency {args.db_latency_ms}ms")
+    if args.mode in ("sync", "both"):
+        run_sync(args)
+    if args.mode in ("async", "both"):
+        asyncio.run(run_async(args))
+
+
+# Run the script
+if __name__ == "__main__":
+    main()
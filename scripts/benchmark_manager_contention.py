@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+import asyncpg
+
+# Database connection details
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_NAME = os.getenv("POSTGRES_DB", "blu_reserve")
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+
+DEBIT_AMOUNT = 5  # Same as BLU_DOLLAR_COST in booking_service
+
+
+async def create_manager(conn, shard_count, budget):
+    """Create a throwaway manager whose budget is split into `shard_count` shards."""
+    tag = uuid.uuid4().hex[:8]
+    manager_id = await conn.fetchval("""
+        INSERT INTO managers (username, email, password) VALUES ($1, $2, 'benchmark') RETURNING id
+    """, f"bench-{tag}", f"bench-{tag}@benchmark.local")
+    await conn.execute("SELECT allocate_manager_budget($1, $2, $3)", manager_id, budget, shard_count)
+    return manager_id
+
+
+async def run(pool, args, shard_count):
+    """Debit one manager from many concurrent transactions and measure committed debits per second."""
+    async with pool.acquire() as conn:
+        manager_id = await create_manager(conn, shard_count, DEBIT_AMOUNT * args.bookings * 2)
+
+    in_flight = asyncio.Semaphore(args.concurrency)
+
+    async def one_booking():
+        async with in_flight, pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.fetchval("SELECT debit_manager_balance($1, $2)", manager_id, DEBIT_AMOUNT)
+                if args.hold_ms:
+                    # Rest of the booking transaction (ledger + reservation inserts) while the shard stays locked
+                    await conn.execute("SELECT pg_sleep($1)", args.hold_ms / 1000)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(one_booking() for _ in range(args.bookings)))
+    elapsed = time.perf_counter() - began
+
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM managers WHERE id = $1", manager_id)
+
+    print(f"[📊] shards={shard_count:<3} bookings={args.bookings} elapsed={elapsed:.2f}s "
+          f"throughput={args.bookings / elapsed:.1f} debits/s for one manager")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure per-manager booking throughput with and without balance shards.")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 8], help="Shard counts to compare (1 = single balance row)")
+    parser.add_argument("--bookings", type=int, default=500, help="Debits per run, all against the same manager")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent booking transactions")
+    parser.add_argument("--hold-ms", type=float, default=5, help="Time each transaction keeps its shard locked after debiting")
+    args = parser.parse_args()
+
+    pool = await asyncpg.create_pool(
+        host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+        min_size=1, max_size=args.concurrency
+    )
+    try:
+        for shard_count in args.shards:
+            await run(pool, args, shard_count)
+    finally:
+        await pool.close()
+
+
+# Run the script
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+# Database connection details
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_NAME = os.getenv("POSTGRES_DB", "blu_reserve")
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+
+CHECK_IN_EARLY = timedelta(minutes=15)  # Same window as booking_service's check-in endpoint
+END_OF_INPUT = object()  # Put on the event queue once the reader has consumed the whole stream
+
+# One statement per batch: unnest the events, match each to the employee's active reservation
+# through idx_reservations_active_employee, and stamp the earliest badge time per reservation.
+MARK_CHECK_INS = """
+    UPDATE reservations r SET checked_in_at = matched.badge_time
+    FROM (
+        SELECT DISTINCT ON (res.id) res.id, ev.badge_time
+        FROM unnest(%s::BIGINT[], %s::TIMESTAMP[]) AS ev(employee_id, badge_time)
+        JOIN reservations res
+            ON res.employee_id = ev.employee_id AND res.status = 'RESERVED'
+            AND res.start_time <= ev.badge_time + %s AND res.end_time > ev.badge_time
+        WHERE res.checked_in_at IS NULL
+        ORDER BY res.id, ev.badge_time
+    ) matched
+    WHERE r.id = matched.id AND r.checked_in_at IS NULL
+"""
+
+
+def parse_time(value: str) -> datetime:
+    """Accept ISO-8601 badge times; timezone-aware ones are converted to local time like the rest of the schema."""
+    parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def read_events(stream, fmt):
+    """Yield (employee_id, badge_time) pairs from JSONL or CSV lines; malformed lines yield None."""
+    rows = csv.DictReader(stream) if fmt == "csv" else stream
+    for row in rows:
+        try:
+            if fmt == "jsonl":
+                if not row.strip():
+                    continue
+                row = json.loads(row)
+            yield int(row["employee_id"]), parse_time(row["timestamp"])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # AttributeError: a null timestamp, or a CSV row missing its trailing columns
+            yield None
+
+
+def read_into(events, stream, fmt):
+    """Reader thread: feed parsed events into the queue, so the main loop can flush on a timer while stdin is quiet."""
+    try:
+        for event in read_events(stream, fmt):
+            events.put(event)
+    except Exception as e:
+        events.put(e)
+    events.put(END_OF_INPUT)
+
+
+def flush(conn, batch):
+    """Apply one batch of events; returns how many reservations were checked in."""
+    with conn.cursor() as cur:
+        cur.execute(MARK_CHECK_INS, ([e for e, _ in batch], [t for _, t in batch], CHECK_IN_EARLY))
+        checked_in = cur.rowcount
+    conn.commit()
+    return checked_in
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark reservations as checked in from door-badge events (JSONL or CSV).")
+    parser.add_argument("path", nargs="?", default="-", help="Event file, or '-' to stream from stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the file extension, else jsonl)")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Events matched per UPDATE")
+    parser.add_argument("--flush-seconds", type=float, default=1.0, help="Flush a partial batch once its first event is this old, even if no more arrive")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "jsonl")
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="")
+    conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
+
+    events = skipped = checked_in = 0
+    batch, batch_started = [], None
+    began = time.perf_counter()
+    incoming = queue.Queue(maxsize=args.batch_size * 2)
+    threading.Thread(target=read_into, args=(incoming, stream, fmt), daemon=True).start()
+    try:
+        while True:
+            timeout = None if batch_started is None else max(0.0, batch_started + args.flush_seconds - time.monotonic())
+            try:
+                event = incoming.get(timeout=timeout)
+            except queue.Empty:
+                # The oldest event has waited long enough and nothing else came in
+                checked_in += flush(conn, batch)
+                batch, batch_started = [], None
+                continue
+            if event is END_OF_INPUT:
+                break
+            if isinstance(event, Exception):
+                raise event
+            if event is None:
+                skipped += 1
+                continue
+            events += 1
+            batch.append(event)
+            batch_started = batch_started or time.monotonic()
+            if len(batch) >= args.batch_size or time.monotonic() - batch_started >= args.flush_seconds:
+                checked_in += flush(conn, batch)
+                batch, batch_started = [], None
+        if batch:
+            checked_in += flush(conn, batch)
+    finally:
+        conn.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    elapsed = time.perf_counter() - began
+    print(f"[📊] events={events} skipped={skipped} checked_in={checked_in} elapsed={elapsed:.2f}s "
+          f"throughput={events / elapsed:.1f} events/s")
+
+
+# Run the script
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,10 @@ DB_NAME = os.getenv("POSTGRES_DB", "blu_reserve")
 DB_USER = os.getenv("POSTGRES_USER", "postgres")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 
+# Floor layout: zone A holds 5 rows of 10 desks with an aisle between positions 5 and 7
+SEATS_PER_ROW = 10
+AISLE_AFTER = 5
+
 def create_seats():
     """Insert 50 seats into the database."""
     try:
@@ -23,12 +27,16 @@ def create_seats():
         # Clear existing seats (optional)
         cur.execute("DELETE FROM seats;")
 
-        # Insert 50 seats (only seat_number, as per the schema)
+        # Insert 50 seats with their place on the floor
         for seat_number in range(1, 51):  # Seat numbers between 1 and 50
+            seat_row = (seat_number - 1) // SEATS_PER_ROW + 1
+            seat_position = (seat_number - 1) % SEATS_PER_ROW + 1
+            if seat_position > AISLE_AFTER:
+                seat_position += 1  # Skip the aisle so the two sides aren't adjacent
             cur.execute("""
-                INSERT INTO seats (seat_number) 
-                VALUES (%s);
-            """, (seat_number,))
+                INSERT INTO seats (seat_number, zone, seat_row, seat_position)
+                VALUES (%s, 'A', %s, %s);
+            """, (seat_number, seat_row, seat_position))
 
         conn.commit()
         print("[✅] Successfully inserted 50 seats into the database.")
@@ -0,0 +1,177 @@
+import argparse
+import os
+import time
+from datetime import timedelta
+
+import psycopg2
+
+# Database connection details
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_NAME = os.getenv("POSTGRES_DB", "blu_reserve")
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+
+# Sweeper settings
+CHECK_IN_GRACE_MINUTES = int(os.getenv("CHECK_IN_GRACE_MINUTES", "15"))  # No check-in by start + grace → released
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))  # Rows updated per transaction
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "60"))  # Pause between sweeps
+TICKET_RETENTION_HOURS = int(os.getenv("TICKET_RETENTION_HOURS", "24"))  # Processed queued-booking tickets kept this long
+
+BLU_DOLLAR_COST = 5  # Same as booking_service, charged to promoted waiters
+MAX_DAILY_USAGE = 20
+
+# Each statement claims one bounded batch with SKIP LOCKED, so rows a booking or cancellation
+# is working on are left for the next sweep and no lock is held past one short transaction.
+RELEASE_NO_SHOWS = """
+    UPDATE reservations r SET status = 'RELEASED'
+    FROM (
+        SELECT id FROM reservations
+        WHERE status = 'RESERVED' AND checked_in_at IS NULL
+        AND start_time <= now()::TIMESTAMP - %s
+        ORDER BY start_time
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE r.id = due.id
+    RETURNING r.seat_id, r.start_time, r.end_time
+"""
+
+# The rest of each released slot goes to the waitlist in the same transaction
+PROMOTE_WAITLIST = """
+    SELECT COUNT(*)
+    FROM unnest(%s::BIGINT[], %s::TIMESTAMP[], %s::TIMESTAMP[]) AS f(seat_id, start_time, end_time),
+    LATERAL promote_waitlist(f.seat_id, f.start_time, f.end_time, %s, %s)
+"""
+
+COMPLETE_FINISHED = """
+    UPDATE reservations r SET status = 'COMPLETED'
+    FROM (
+        SELECT id FROM reservations
+        WHERE status = 'RESERVED' AND checked_in_at IS NOT NULL
+        AND end_time <= now()::TIMESTAMP
+        ORDER BY start_time
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE r.id = due.id
+"""
+
+REAP_EXPIRED_HOLDS = """
+    DELETE FROM seat_holds
+    WHERE id IN (
+        SELECT id FROM seat_holds
+        WHERE expires_at <= now()::TIMESTAMP
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+"""
+
+# Waits whose slot has ended can't be filled any more; idx_waitlist_waiting finds them (strictly left of now)
+EXPIRE_PAST_WAITS = """
+    UPDATE waitlist_entries w SET status = 'EXPIRED'
+    FROM (
+        SELECT id FROM waitlist_entries
+        WHERE status = 'WAITING' AND during << tsrange(now()::TIMESTAMP, NULL)
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE w.id = due.id
+"""
+
+PURGE_OLD_TICKETS = """
+    DELETE FROM booking_requests
+    WHERE id IN (
+        SELECT id FROM booking_requests
+        WHERE status = 'DONE' AND processed_at <= now()::TIMESTAMP - %s
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+"""
+
+
+def sweep_in_batches(conn, query, params, batch_size):
+    """Run one batched UPDATE until it stops finding rows; each batch commits on its own."""
+    total = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            updated = cur.rowcount
+        conn.commit()
+        total += updated
+        if updated < batch_size:
+            return total
+
+
+def release_no_shows(conn, grace, batch_size):
+    """Release no-shows batch by batch, promoting waiters into each freed slot; returns (released, promoted)."""
+    released = promoted = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(RELEASE_NO_SHOWS, (grace, batch_size))
+            freed = cur.fetchall()
+            if freed:
+                seat_ids, starts, ends = zip(*freed)
+                cur.execute(PROMOTE_WAITLIST, (list(seat_ids), list(starts), list(ends), BLU_DOLLAR_COST, MAX_DAILY_USAGE))
+                promoted += cur.fetchone()[0]
+        conn.commit()
+        released += len(freed)
+        if len(freed) < batch_size:
+            return released, promoted
+
+
+def sweep(conn, grace, batch_size):
+    """Release no-shows, complete finished reservations, reap expired holds, past waits and old tickets; returns counts and seconds."""
+    started = time.perf_counter()
+    released, promoted = release_no_shows(conn, grace, batch_size)
+    completed = sweep_in_batches(conn, COMPLETE_FINISHED, (batch_size,), batch_size)
+    reaped = sweep_in_batches(conn, REAP_EXPIRED_HOLDS, (batch_size,), batch_size)
+    reaped += sweep_in_batches(conn, EXPIRE_PAST_WAITS, (batch_size,), batch_size)
+    reaped += sweep_in_batches(conn, PURGE_OLD_TICKETS, (timedelta(hours=TICKET_RETENTION_HOURS), batch_size), batch_size)
+    return released, promoted, completed, reaped, time.perf_counter() - started
+
+
+def connect():
+    """Open the sweeper's single database connection."""
+    return psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Release no-show reservations, mark finished ones as completed and reap expired holds, past waitlist entries and old queue tickets.")
+    parser.add_argument("--once", action="store_true", help="Run a single sweep and exit")
+    parser.add_argument("--grace-minutes", type=int, default=CHECK_IN_GRACE_MINUTES, help="Minutes after start before an unchecked reservation is released")
+    parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE, help="Rows updated per transaction")
+    parser.add_argument("--interval", type=float, default=SWEEP_INTERVAL_SECONDS, help="Seconds between sweeps")
+    args = parser.parse_args()
+
+    conn = connect()
+    grace = timedelta(minutes=args.grace_minutes)
+    print(f"[⏳] Sweeping reservations every {args.interval}s (grace {args.grace_minutes} min, batches of {args.batch_size})")
+
+    try:
+        while True:
+            try:
+                released, promoted, completed, reaped, elapsed = sweep(conn, grace, args.batch_size)
+            except psycopg2.Error as e:
+                print(f"[❌] Sweep failed: {e}")
+                if conn.closed:
+                    conn = connect()
+                else:
+                    conn.rollback()
+            else:
+                processed = released + completed + reaped
+                if processed or args.once:
+                    print(f"[📊] released={released} waitlist_promoted={promoted} completed={completed} "
+                          f"reaped={reaped} elapsed={elapsed:.2f}s "
+                          f"throughput={processed / elapsed:.1f} rows/s")
+
+            if args.once:
+                break
+            time.sleep(args.interval)
+    finally:
+        conn.close()
+
+
+# Run the script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import os
+import random
+import time
+from collections import defaultdict
+
+import psycopg2
+import psycopg2.errors
+
+# Database connection details
+DB_HOST = os.getenv("DB_HOST", "db")
+DB_NAME = os.getenv("POSTGRES_DB", "blu_reserve")
+DB_USER = os.getenv("POSTGRES_USER", "postgres")
+DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+
+BLU_DOLLAR_COST = 5  # Same as BLU_DOLLAR_COST in booking_service
+MAX_DAILY_USAGE = 20  # Same as MAX_DAILY_USAGE in booking_service
+MAX_ATTEMPTS = 3  # Re-runs when a direct booking takes a seat while the draw is being written
+
+
+def load(cur, draw_id):
+    """Lock the draw and read everything the allocation needs; returns None if it isn't due."""
+    cur.execute("""
+        SELECT start_time, end_time FROM lottery_draws
+        WHERE id = %s AND status = 'OPEN' AND registration_closes_at <= now()::TIMESTAMP
+        FOR UPDATE
+    """, (draw_id,))
+    draw = cur.fetchone()
+    if not draw:
+        return None
+    start_time, end_time = draw
+
+    cur.execute("""
+        SELECT e.employee_id, emp.manager_id, e.preferred_seat_ids
+        FROM lottery_entries e JOIN employees emp ON emp.id = e.employee_id
+        WHERE e.draw_id = %s
+    """, (draw_id,))
+    entries = cur.fetchall()
+
+    # Seats already reserved (or held by a checkout) for the slot are not up for allocation
+    cur.execute("""
+        SELECT s.id FROM seats s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM reservations r
+            WHERE r.seat_id = s.id AND r.status = 'RESERVED' AND r.during && tsrange(%s, %s)
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM seat_holds h
+            WHERE h.seat_id = s.id AND h.expires_at > now()::TIMESTAMP AND h.during && tsrange(%s, %s)
+        )
+        ORDER BY s.zone, s.seat_row, s.seat_position, s.seat_number, s.id  -- Floor order, so consecutive ids sit together
+    """, (start_time, end_time, start_time, end_time))
+    free_seats = [row[0] for row in cur.fetchall()]
+
+    # Lock the quota counters, then the budgets, the run will charge: the same order book_seat() takes them in.
+    # Missing counters are created first, since FOR UPDATE can't lock a row a concurrent booking is about to insert.
+    employee_ids = sorted(employee_id for employee_id, _, _ in entries)
+    cur.execute("""
+        INSERT INTO employee_daily_usage (employee_id, usage_date, amount)
+        SELECT employee_id, %s, 0 FROM unnest(%s::BIGINT[]) AS employee_id
+        ORDER BY employee_id
+        ON CONFLICT (employee_id, usage_date) DO NOTHING
+    """, (start_time.date(), employee_ids))
+    cur.execute("""
+        SELECT employee_id, amount FROM employee_daily_usage
+        WHERE usage_date = %s AND employee_id = ANY(%s) ORDER BY employee_id FOR UPDATE
+    """, (start_time.date(), employee_ids))
+    used = {employee_id: float(amount) for employee_id, amount in cur.fetchall()}
+
+    manager_ids = sorted({manager_id for _, manager_id, _ in entries})
+    cur.execute("""
+        SELECT manager_id, balance FROM manager_balance_shards
+        WHERE manager_id = ANY(%s) ORDER BY manager_id, shard_id FOR UPDATE
+    """, (manager_ids,))
+    budgets = defaultdict(float)
+    for manager_id, balance in cur.fetchall():
+        budgets[manager_id] += float(balance)
+
+    return start_time, end_time, entries, free_seats, budgets, used
+
+
+def allocate(entries, free_seats, budgets, used, rng):
+    """
+    Pick winners in random order, within seats, manager budgets and daily limits, then place them:
+    ranked preferences first (in draw order), then the rest seated team by team on consecutive seats.
+    Returns ({employee_id: seat_id}, {employee_id: reason}).
+    """
+    order = list(entries)
+    rng.shuffle(order)
+
+    budgets = dict(budgets)
+    winners, losers = [], {}
+    for employee_id, manager_id, preferred in order:
+        if len(winners) == len(free_seats):
+            losers[employee_id] = "No seat left"
+        elif used.get(employee_id, 0) + BLU_DOLLAR_COST > MAX_DAILY_USAGE:
+            losers[employee_id] = "Daily BluDollar usage limit reached"
+        elif budgets.get(manager_id, 0) < BLU_DOLLAR_COST:
+            losers[employee_id] = "Insufficient BluDollar balance"
+        else:
+            budgets[manager_id] -= BLU_DOLLAR_COST
+            winners.append((employee_id, manager_id, preferred))
+
+    open_seats = set(free_seats)
+    assignment = {}
+    for employee_id, _, preferred in winners:
+        for seat_id in preferred or []:
+            if seat_id in open_seats:
+                open_seats.discard(seat_id)
+                assignment[employee_id] = seat_id
+                break
+
+    # Larger teams first, so each team gets one consecutive run of the remaining seats
+    teams = defaultdict(list)
+    for employee_id, manager_id, _ in winners:
+        if employee_id not in assignment:
+            teams[manager_id].append(employee_id)
+    remaining = iter([seat_id for seat_id in free_seats if seat_id in open_seats])
+    for manager_id in sorted(teams, key=lambda m: (-len(teams[m]), m)):
+        for employee_id in teams[manager_id]:
+            assignment[employee_id] = next(remaining)
+
+    return assignment, losers
+
+
+def write(cur, draw_id, start_time, end_time, entries, assignment, losers):
+    """Charge quota, insert reservations, debit budgets, write the ledger and record results in bulk."""
+    managers = {employee_id: manager_id for employee_id, manager_id, _ in entries}
+    winners = list(assignment)
+
+    cur.execute("""
+        INSERT INTO employee_daily_usage AS u (employee_id, usage_date, amount)
+        SELECT employee_id, %s, %s FROM unnest(%s::BIGINT[]) AS employee_id
+        ON CONFLICT (employee_id, usage_date) DO UPDATE SET amount = u.amount + EXCLUDED.amount
+    """, (start_time.date(), BLU_DOLLAR_COST, winners))
+
+    cur.execute("""
+        INSERT INTO reservations (seat_id, employee_id, start_time, end_time, status)
+        SELECT seat_id, employee_id, %s, %s, 'RESERVED'
+        FROM unnest(%s::BIGINT[], %s::BIGINT[]) AS w(employee_id, seat_id)
+        RETURNING employee_id, id
+    """, (start_time, end_time, winners, [assignment[e] for e in winners]))
+    reservation_ids = dict(cur.fetchall())
+
+    debits = defaultdict(int)
+    for employee_id in winners:
+        debits[managers[employee_id]] += BLU_DOLLAR_COST
+    cur.execute("""
+        SELECT bool_and(debit_manager_balance(manager_id, amount))
+        FROM unnest(%s::BIGINT[], %s::DECIMAL[]) AS d(manager_id, amount)
+    """, (sorted(debits), [debits[m] for m in sorted(debits)]))
+    if cur.fetchone()[0] is False:
+        # The shards were locked since load(), so this means the budgets changed under us
+        raise RuntimeError("a manager budget could not cover the draw's winners")
+
+    cur.execute("""
+        INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
+        SELECT manager_id, employee_id, %s, 'RESERVATION', %s
+        FROM unnest(%s::BIGINT[], %s::BIGINT[]) AS w(employee_id, manager_id)
+    """, (BLU_DOLLAR_COST, f"Lottery seat reservation (draw {draw_id})", winners, [managers[e] for e in winners]))
+
+    cur.execute("""
+        UPDATE lottery_entries e SET status = r.status, reservation_id = r.reservation_id, reason = r.reason
+        FROM unnest(%s::BIGINT[], %s::TEXT[], %s::BIGINT[], %s::TEXT[]) AS r(employee_id, status, reservation_id, reason)
+        WHERE e.draw_id = %s AND e.employee_id = r.employee_id
+    """, (
+        winners + list(losers),
+        ["WON"] * len(winners) + ["LOST"] * len(losers),
+        [reservation_ids[e] for e in winners] + [None] * len(losers),
+        [None] * len(winners) + list(losers.values()),
+        draw_id,
+    ))
+
+    cur.execute("UPDATE lottery_draws SET status = 'ALLOCATED', allocated_at = now() WHERE id = %s", (draw_id,))
+
+
+def run_draw(conn, draw_id, seed):
+    """Allocate one draw in a single transaction, retrying if a seat was taken mid-run."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        began = time.perf_counter()
+        try:
+            with conn.cursor() as cur:
+                loaded = load(cur, draw_id)
+                if loaded is None:
+                    conn.rollback()
+                    print(f"[⚠️] Draw {draw_id} is not open or registration hasn't closed yet")
+                    return
+                start_time, end_time, entries, free_seats, budgets, used = loaded
+                loaded_at = time.perf_counter()
+
+                assignment, losers = allocate(entries, free_seats, budgets, used, random.Random(seed if seed is not None else draw_id))
+                solved_at = time.perf_counter()
+
+                write(cur, draw_id, start_time, end_time, entries, assignment, losers)
+            conn.commit()
+        except psycopg2.errors.ExclusionViolation:
+            conn.rollback()
+            print(f"[🔄] Draw {draw_id}: a seat was booked during allocation, retrying ({attempt}/{MAX_ATTEMPTS})")
+            continue
+        except psycopg2.errors.TransactionRollbackError as e:
+            # Deadlock or serialization failure against concurrent bookings
+            conn.rollback()
+            print(f"[🔄] Draw {draw_id}: {e.pgcode} from a concurrent booking, retrying ({attempt}/{MAX_ATTEMPTS})")
+            continue
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+        done = time.perf_counter()
+        print(f"[📊] draw={draw_id} entries={len(entries)} seats={len(free_seats)} won={len(assignment)} "
+              f"lost={len(losers)} load={loaded_at - began:.2f}s solve={solved_at - loaded_at:.2f}s "
+              f"write={done - solved_at:.2f}s total={done - began:.2f}s")
+        return
+
+    print(f"[❌] Draw {draw_id} could not be allocated after {MAX_ATTEMPTS} attempts")
+
+
+def connect():
+    return psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Allocate seats for lottery draws whose registration has closed.")
+    parser.add_argument("--draw", type=int, help="Allocate only this draw (default: every due draw)")
+    parser.add_argument("--seed", type=int, help="Random seed for the draw order (default: the draw id)")
+    parser.add_argument("--watch", type=float, help="Keep running, checking for due draws every N seconds")
+    args = parser.parse_args()
+
+    conn = None
+    try:
+        while True:
+            try:
+                if conn is None or conn.closed:
+                    conn = connect()
+                if args.draw is not None:
+                    draw_ids = [args.draw]
+                else:
+                    with conn.cursor() as cur:
+                        cur.execute("""
+                            SELECT id FROM lottery_draws
+                            WHERE status = 'OPEN' AND registration_closes_at <= now()::TIMESTAMP
+                            ORDER BY registration_closes_at
+                        """)
+                        draw_ids = [row[0] for row in cur.fetchall()]
+                    conn.commit()
+
+                for draw_id in draw_ids:
+                    try:
+                        run_draw(conn, draw_id, args.seed)
+                    except psycopg2.InterfaceError:
+                        raise  # Connection gone: reconnect before the next draw
+                    except Exception as e:
+                        print(f"[❌] Draw {draw_id} failed: {e}")
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if not args.watch:
+                    raise
+                print(f"[⚠️] Database unavailable, retrying in {args.watch}s: {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+# Run the script
+if __name__ == "__main__":
+    main()
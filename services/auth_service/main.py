@@ -1,7 +1,7 @@
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
 from passlib.context import CryptContext
-from utils.database import get_db_connection
+from utils.database import get_db, db_pool, init_db_pool, close_db_pool
 from utils.jwt_handler import create_access_token
 import logging
 
@@ -14,6 +14,24 @@ logger = logging.getLogger(__name__)
 # Password hashing utility
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+MANAGER_INITIAL_BUDGET = 200  # BluDollars granted to a newly registered manager
+
+
+@app.on_event("startup")
+def startup():
+    init_db_pool()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    close_db_pool()
+
+
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+    """Report connection pool usage (in use, waiting, wait time)."""
+    return db_pool.stats()
+
 class UserRegister(BaseModel):
     username: str
     email: str
@@ -26,9 +44,8 @@ class UserLogin(BaseModel):
     password: str
 
 @app.post("/register")
-def register_user(user: UserRegister):
+def register_user(user: UserRegister, conn=Depends(get_db)):
     """Register a new user (Employee or Manager)."""
-    conn = get_db_connection()
     cur = conn.cursor()
 
     # Hash the password
@@ -52,13 +69,18 @@ def register_user(user: UserRegister):
 
         elif user.role.upper() == "MANAGER":
             cur.execute(
-                "INSERT INTO managers (username, email, password, bluDollar_balance) VALUES (%s, %s, %s, %s) RETURNING id",
-                (user.username, user.email, hashed_password, 200)  # Managers start with 200 BluDollars
+                "INSERT INTO managers (username, email, password) VALUES (%s, %s, %s) RETURNING id",
+                (user.username, user.email, hashed_password)
             )
         else:
             raise HTTPException(status_code=400, detail="Invalid role")
 
         user_id = cur.fetchone()[0]
+
+        if user.role.upper() == "MANAGER":
+            # Spread the starting budget across balance shards
+            cur.execute("SELECT allocate_manager_budget(%s, %s)", (user_id, MANAGER_INITIAL_BUDGET))
+
         conn.commit()
 
     except Exception as e:
@@ -68,14 +90,12 @@ def register_user(user: UserRegister):
 
     finally:
         cur.close()
-        conn.close()
 
     return {"id": user_id, "message": f"{user.role.capitalize()} registered successfully"}
 
 @app.post("/login")
-def login_user(user: UserLogin):
+def login_user(user: UserLogin, conn=Depends(get_db)):
     """Authenticate a user and return a JWT token."""
-    conn = get_db_connection()
     cur = conn.cursor()
 
     try:
@@ -112,6 +132,5 @@ def login_user(user: UserLogin):
 
     finally:
         cur.close()
-        conn.close()
 
     return {"access_token": access_token, "token_type": "bearer"}
@@ -1,8 +1,17 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, BackgroundTasks
 from pydantic import BaseModel
-from utils.database import get_db_connection
-from utils.jwt_handler import get_current_user
+from typing import List, Optional
+from utils.database import get_db, db_pool, init_db_pool, close_db_pool, PoolTimeout
+from utils.idempotency import (
+    request_fingerprint, replay_cached, claim_key, store_response, remember_response, purge_expired_keys
+)
+from utils.holds import hold_store
+from utils.intake import booking_intake, INTAKE_IDLE_POLL
+from utils.layout import seat_layout
+from utils.jwt_handler import get_current_user, require_manager, require_admin
 from datetime import datetime, timedelta
+import asyncio
+import time
 import logging
 
 # Initialize FastAPI
@@ -16,135 +25,990 @@ class BookingRequest(BaseModel):
     seat_id: int
     start_time: str
     end_time: str
+    hold_id: Optional[int] = None  # Converts this hold into the reservation (POST /bookings only)
+
+class ModifyBookingRequest(BaseModel):
+    seat_id: Optional[int] = None  # Leave out to keep the current value
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+
+class HoldRequest(BaseModel):
+    seat_id: int
+    start_time: str
+    end_time: str
+
+class WaitlistRequest(BaseModel):
+    seat_id: Optional[int] = None  # Leave out to take any seat that frees up
+    start_time: str
+    end_time: str
+
+class AutoBookingRequest(BaseModel):
+    start_time: str
+    end_time: str
+    preference: str = "seat_number"  # 'seat_number', 'popular' or 'favorite'
+
+class BlockBookingRequest(BaseModel):
+    employee_ids: List[int]  # Team members to seat together, seated in this order along the row
+    start_time: str
+    end_time: str
+    zone: Optional[str] = None  # Only look for a block in this zone
+
+class LotteryRequest(BaseModel):
+    start_time: str  # The oversubscribed slot, YYYY-MM-DD HH:MM
+    end_time: str
+    registration_closes_at: str  # When entries stop and the allocation can run
+
+class LotteryEntryRequest(BaseModel):
+    preferred_seat_ids: List[int] = []  # Most wanted first; empty = any seat
+
+class BulkCancellationRequest(BaseModel):
+    seat_ids: Optional[List[int]] = None  # Leave out to close every seat
+    start_time: str
+    end_time: str
+    reason: str  # Shown in the refund ledger entries, e.g. "Floor 3 maintenance"
+
+class BatchBookingRequest(BaseModel):
+    items: List[BookingRequest]
+    mode: str = "atomic"  # 'atomic': all or nothing, 'partial': book whatever can be booked
+
+class RecurringBookingRequest(BaseModel):
+    seat_id: int
+    start_time: str  # First occurrence, YYYY-MM-DD HH:MM
+    end_time: str
+    until: str  # Last date an occurrence may fall on, YYYY-MM-DD
+    frequency: str = "weekly"  # 'daily' or 'weekly'
+    weekdays: List[int] = []  # ISO weekdays for weekly rules (1 = Monday); defaults to the first occurrence's day
+    skip_conflicts: bool = False  # Book the free occurrences instead of rejecting the series
 
 BLU_DOLLAR_COST = 5  # Cost per booking
 MAX_DAILY_USAGE = 20  # Max BluDollars an employee can use per day
+MAX_BATCH_ITEMS = 50  # Seat-slots accepted by one batch request
+MAX_SERIES_DAYS = 180  # Furthest a recurrence rule may run past its first occurrence
+MIN_CANCEL_NOTICE = timedelta(hours=1)  # Reservations can't be cancelled closer to their start
+CHECK_IN_EARLY = timedelta(minutes=15)  # How long before the start an employee may check in
+HOLD_TTL = timedelta(minutes=2)  # How long a seat hold lasts while the employee completes checkout
+MAX_ACTIVE_HOLDS = 3  # Live holds one employee may keep at a time
+MAX_WAITLIST_ENTRIES = 5  # Slots one employee may wait for at a time
+MAX_TICKET_WAIT = 30  # Longest long-poll on a queued booking ticket, in seconds
+MAX_SEAT_PREFERENCES = 10  # Seats an employee may rank in a lottery entry
+MAX_BLOCK_SIZE = 20  # Team members one block booking may seat together
+MAX_BLOCK_ATTEMPTS = 3  # Block searches before giving up when seats are taken mid-booking
+BULK_CANCEL_CHUNK_SIZE = 200  # Reservations cancelled per transaction by a bulk cancellation
+
+# Result codes returned by the book_seat() database function
+BOOKING_ERRORS = {
+    "SEAT_TAKEN": (400, "Seat is already booked for this time range"),
+    "SEAT_NOT_FOUND": (404, "Seat not found"),
+    "EMPLOYEE_NOT_FOUND": (404, "Employee not found"),
+    "DAILY_LIMIT_REACHED": (400, "Daily BluDollar usage limit reached (max 20 BluDollars)"),
+    "MANAGER_NOT_FOUND": (404, "Manager not found"),
+    "INSUFFICIENT_BALANCE": (400, "Insufficient BluDollar balance"),
+    "DUPLICATE_ITEM": (400, "Overlaps an earlier item in the same batch"),
+    "BATCH_REJECTED": (400, "Not booked because another item in the batch failed"),
+    "NO_OCCURRENCES": (400, "Recurrence rule does not produce any occurrence"),
+    "SEAT_HELD": (400, "Seat is on hold for another employee's checkout"),
+    "HOLD_NOT_FOUND": (404, "Hold not found, expired or for a different slot"),
+    "TOO_MANY_HOLDS": (400, f"Too many active seat holds (max {MAX_ACTIVE_HOLDS})"),
+    "NO_SEAT_AVAILABLE": (400, "No seat is free for this time range"),
+    "NO_BLOCK_AVAILABLE": (400, "No block of adjacent free seats fits the team for this time range"),
+    "RESERVATION_NOT_FOUND": (404, "Reservation not found or no longer active"),
+    "INVALID_RANGE": (400, "End time must be after start time"),
+    "ALREADY_STARTED": (400, "Only the end time of a reservation can change once it has started"),
+    "ALREADY_ENDED": (400, "Reservation can't end in the past"),
+    "BALANCE_BUSY": (503, "The manager's budget is busy with other bookings, please retry"),
+}
+
+
+def parse_time_range(start_time: str, end_time: str):
+    """Parse a 'YYYY-MM-DD HH:MM' start/end pair, rejecting malformed or reversed ranges."""
+    try:
+        start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M")
+        end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM")
+
+    if start_dt >= end_dt:
+        raise HTTPException(status_code=400, detail="End time must be after start time")
+
+    return start_dt, end_dt
+
+
+def raise_for_booking_result(result_code: str):
+    """Translate a book_seat() result code into the matching HTTP error."""
+    if result_code in BOOKING_ERRORS:
+        status_code, detail = BOOKING_ERRORS[result_code]
+        raise HTTPException(status_code=status_code, detail=detail)
+
+
+@app.on_event("startup")
+async def startup():
+    await init_db_pool()
+    conn = await db_pool.acquire()
+    try:
+        purged = await purge_expired_keys(conn)
+    finally:
+        await db_pool.release(conn)
+    logger.info(f"Purged {purged} expired idempotency key(s)")
+    booking_intake.start(BLU_DOLLAR_COST, MAX_DAILY_USAGE)
+    await resume_bulk_cancellations()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await booking_intake.stop()
+    await close_db_pool()
+
+
+@app.get("/metrics/db-pool")
+async def db_pool_metrics():
+    """Report connection pool usage (in use, waiting, wait time)."""
+    return db_pool.stats()
 
 
 @app.post("/bookings")
-def book_seat(request: BookingRequest, current_user: dict = Depends(get_current_user)):
+async def book_seat(request: BookingRequest, current_user: dict = Depends(get_current_user), conn=Depends(get_db),
+                    idempotency_key: Optional[str] = Header(None)):
     """
     Reserve a seat for a user. Ensures the employee has enough BluDollars before making a reservation.
+    Retries sent with the same `Idempotency-Key` header get the original response back without booking again.
+    Passing the `hold_id` from POST /holds books the held slot.
+    """
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+
+    # Turn away requests racing a hold granted by this process before opening a transaction
+    if request.hold_id is None and hold_store.is_held_by_other(request.seat_id, current_user['id'], start_dt, end_dt):
+        raise_for_booking_result("SEAT_HELD")
+
+    fingerprint = request_fingerprint("POST", "/bookings", request)
+    replay = replay_cached(current_user['id'], idempotency_key, fingerprint)
+    if replay is not None:
+        return replay
+
+    async with conn.transaction():
+        replay = await claim_key(conn, current_user['id'], idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
+
+        # Conflict check, quota check, debit, ledger and reservation run server-side in one round trip
+        result = await conn.fetchrow("""
+            SELECT result_code, reservation_id FROM book_seat($1, $2, $3, $4, $5, $6, $7, $8)
+        """, request.seat_id, current_user['id'], current_user.get('manager_id'), start_dt, end_dt,
+            BLU_DOLLAR_COST, MAX_DAILY_USAGE, request.hold_id)
+
+        raise_for_booking_result(result['result_code'])
+        response = {"reservation_id": result['reservation_id'], "message": "Seat booked successfully"}
+        await store_response(conn, current_user['id'], idempotency_key, response)
+
+    remember_response(current_user['id'], idempotency_key, fingerprint, response)
+    if request.hold_id is not None:
+        hold_store.remove(request.hold_id)
+    return response
+
+
+@app.get("/metrics/booking-queue")
+async def booking_queue_metrics(conn=Depends(get_db)):
+    """Report intake queue depth, oldest waiting request and throughput of this process's workers."""
+    depth, oldest = await conn.fetchrow("""
+        SELECT COUNT(*), EXTRACT(EPOCH FROM now()::TIMESTAMP - MIN(created_at))
+        FROM booking_requests WHERE status = 'PENDING'
+    """)
+    return {"queue_depth": depth, "oldest_pending_s": round(oldest or 0, 3), **booking_intake.stats()}
+
+
+@app.post("/bookings/queue", status_code=202)
+async def queue_booking(request: BookingRequest, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
     """
+    Queued alternative to POST /bookings for peak-hour bursts. The request is stored durably and
+    answered at once with a ticket; workers book queued requests in batches.
+    Fetch the outcome with GET /bookings/tickets/{ticket_id}, optionally long-polling with `wait`.
+    Employees only: tickets are stored against the employee making the booking.
+    """
+    if current_user.get('role') != "EMPLOYEE":
+        raise HTTPException(status_code=403, detail="Only employees can queue a booking")
+
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+
+    ticket_id = await booking_intake.enqueue(
+        conn, current_user['id'], current_user.get('manager_id'), request.seat_id, start_dt, end_dt
+    )
+
+    return {"ticket_id": ticket_id, "status": "PENDING", "message": "Booking request queued"}
+
+
+async def fetch_ticket(ticket_id: int, employee_id: int):
+    """Read a ticket on a briefly borrowed connection, so long-polls don't pin pool connections."""
     try:
-        start_dt = datetime.strptime(request.start_time, "%Y-%m-%d %H:%M")
-        end_dt = datetime.strptime(request.end_time, "%Y-%m-%d %H:%M")
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM")
+        conn = await db_pool.acquire()
+    except PoolTimeout as e:
+        logger.error(f"Database pool exhausted: {e}")
+        raise HTTPException(status_code=503, detail="Database is busy, please retry")
+
+    try:
+        return await conn.fetchrow("""
+            SELECT result_code, reservation_id FROM booking_requests
+            WHERE id = $1 AND employee_id = $2
+        """, ticket_id, employee_id)
+    finally:
+        await db_pool.release(conn)
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+
+@app.get("/bookings/tickets/{ticket_id}")
+async def get_ticket(ticket_id: int, wait: float = Query(0, ge=0, le=MAX_TICKET_WAIT, description="Seconds to wait for the outcome"),
+                     current_user: dict = Depends(get_current_user)):
+    """
+    Report the outcome of a queued booking: PENDING, BOOKED or FAILED (with the reason).
+    With `wait`, the call returns as soon as the ticket is processed or after `wait` seconds.
+    """
+    ticket = await fetch_ticket(ticket_id, current_user['id'])
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    deadline = time.monotonic() + wait
+    result_code, reservation_id = ticket['result_code'], ticket['reservation_id']
+    while result_code is None and time.monotonic() < deadline:
+        # Woken when this process finishes a batch; otherwise re-check the table periodically
+        await booking_intake.wait_for_progress(min(deadline - time.monotonic(), INTAKE_IDLE_POLL))
+        local = booking_intake.result(ticket_id)
+        if local is not None:
+            result_code, reservation_id = local
+        else:
+            ticket = await fetch_ticket(ticket_id, current_user['id'])
+            if not ticket:
+                # Purged by the sweeper while we were waiting
+                raise HTTPException(status_code=404, detail="Ticket not found")
+            result_code, reservation_id = ticket['result_code'], ticket['reservation_id']
+
+    if result_code is None:
+        return {"ticket_id": ticket_id, "status": "PENDING"}
+    if result_code == "BOOKED":
+        return {"ticket_id": ticket_id, "status": "BOOKED", "reservation_id": reservation_id}
+    return {"ticket_id": ticket_id, "status": "FAILED", "error": BOOKING_ERRORS[result_code][1]}
+
+
+@app.post("/bookings/auto")
+async def book_any_seat(request: AutoBookingRequest, current_user: dict = Depends(get_current_user), conn=Depends(get_db),
+                        idempotency_key: Optional[str] = Header(None)):
+    """
+    Pick and book a free seat for the time range in one call, so employees who don't mind
+    which desk they get never race each other on the same seat.
+
+    - `preference="seat_number"` → Lowest seat number first.
+    - `preference="popular"` → Seats booked most often in the last 30 days first.
+    - `preference="favorite"` → Seats this employee booked most in the last 90 days first.
+    """
+    if request.preference not in ("seat_number", "popular", "favorite"):
+        raise HTTPException(status_code=400, detail="Invalid preference. Use 'seat_number', 'popular' or 'favorite'.")
+
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+
+    fingerprint = request_fingerprint("POST", "/bookings/auto", request)
+    replay = replay_cached(current_user['id'], idempotency_key, fingerprint)
+    if replay is not None:
+        return replay
+
+    async with conn.transaction():
+        replay = await claim_key(conn, current_user['id'], idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
+
+        result = await conn.fetchrow("""
+            SELECT result_code, reservation_id, seat_id FROM book_any_seat($1, $2, $3, $4, $5, $6, $7)
+        """, current_user['id'], current_user.get('manager_id'), start_dt, end_dt,
+            BLU_DOLLAR_COST, MAX_DAILY_USAGE, request.preference)
+
+        raise_for_booking_result(result['result_code'])
+        response = {
+            "reservation_id": result['reservation_id'],
+            "seat_id": result['seat_id'],
+            "message": "Seat assigned and booked successfully"
+        }
+        await store_response(conn, current_user['id'], idempotency_key, response)
+
+    remember_response(current_user['id'], idempotency_key, fingerprint, response)
+    return response
+
+
+class BlockTaken(Exception):
+    """A seat of the chosen block was booked or held between the search and the booking."""
+
+
+@app.post("/bookings/block")
+async def book_seat_block(request: BlockBookingRequest, current_user: dict = Depends(require_manager), conn=Depends(get_db)):
+    """
+    Seat a team side by side: find the best block of adjacent free seats (same zone and row,
+    consecutive positions) for the time range and book one seat per team member, all or nothing.
+    Each booking is charged to the manager's budget and the employee's daily quota as usual. Managers only.
+    """
+    if not request.employee_ids:
+        raise HTTPException(status_code=400, detail="A block needs at least one employee")
+    if len(request.employee_ids) > MAX_BLOCK_SIZE:
+        raise HTTPException(status_code=400, detail=f"A block is limited to {MAX_BLOCK_SIZE} employees")
+    if len(set(request.employee_ids)) != len(request.employee_ids):
+        raise HTTPException(status_code=400, detail="Each employee can only appear once in a block")
+
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+
+    team_size = await conn.fetchval("""
+        SELECT COUNT(*) FROM employees WHERE id = ANY($1) AND manager_id = $2
+    """, request.employee_ids, current_user['id'])
+    if team_size != len(request.employee_ids):
+        raise HTTPException(status_code=404, detail="One or more employees were not found in your team")
+
+    await seat_layout.ensure_loaded(conn)
+
+    for attempt in range(MAX_BLOCK_ATTEMPTS):
+        free_seats = await conn.fetch("""
+            SELECT s.id FROM seats s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM reservations r
+                WHERE r.seat_id = s.id AND r.status = 'RESERVED' AND r.during && tsrange($1, $2)
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM seat_holds h
+                WHERE h.seat_id = s.id AND h.expires_at > now()::TIMESTAMP AND h.during && tsrange($1, $2)
+            )
+        """, start_dt, end_dt)
+
+        block = seat_layout.find_block({row['id'] for row in free_seats}, len(request.employee_ids), request.zone)
+        if block is None:
+            raise_for_booking_result("NO_BLOCK_AVAILABLE")
+
+        seats = []
+        try:
+            async with conn.transaction():
+                for employee_id, (seat_id, zone, seat_row, seat_position) in zip(request.employee_ids, block):
+                    result = await conn.fetchrow("""
+                        SELECT result_code, reservation_id FROM book_seat($1, $2, $3, $4, $5, $6, $7)
+                    """, seat_id, employee_id, current_user['id'], start_dt, end_dt, BLU_DOLLAR_COST, MAX_DAILY_USAGE)
+
+                    if result['result_code'] in ("SEAT_TAKEN", "SEAT_HELD"):
+                        raise BlockTaken()
+                    if result['result_code'] in BOOKING_ERRORS:
+                        status_code, detail = BOOKING_ERRORS[result['result_code']]
+                        raise HTTPException(status_code=status_code, detail=f"Employee {employee_id}: {detail}")
+
+                    seats.append({
+                        "employee_id": employee_id,
+                        "seat_id": seat_id,
+                        "zone": zone,
+                        "row": seat_row,
+                        "position": seat_position,
+                        "reservation_id": result['reservation_id'],
+                    })
+        except BlockTaken:
+            logger.info(f"Block for manager {current_user['id']} was taken mid-booking, searching again ({attempt + 1}/{MAX_BLOCK_ATTEMPTS})")
+            continue
+
+        return {
+            "seats": seats,
+            "bluDollars_charged": len(seats) * BLU_DOLLAR_COST,
+            "message": "Team seated together successfully"
+        }
+
+    raise_for_booking_result("NO_BLOCK_AVAILABLE")
+
+
+@app.post("/holds")
+async def hold_seat(request: HoldRequest, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Put a 2-minute hold on a seat-slot while the employee completes checkout.
+    Held slots show as taken to everyone else; book them with POST /bookings and the returned `hold_id`.
+    """
+    if current_user.get('role') != "EMPLOYEE":
+        raise HTTPException(status_code=403, detail="Only employees can hold a seat")
+
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+
+    if hold_store.is_held_by_other(request.seat_id, current_user['id'], start_dt, end_dt):
+        raise_for_booking_result("SEAT_HELD")
+
+    result = await conn.fetchrow("""
+        SELECT result_code, hold_id, expires_at FROM hold_seat($1, $2, $3, $4, $5, $6)
+    """, request.seat_id, current_user['id'], start_dt, end_dt, HOLD_TTL, MAX_ACTIVE_HOLDS)
+
+    raise_for_booking_result(result['result_code'])
+    hold_store.add(result['hold_id'], request.seat_id, current_user['id'], start_dt, end_dt, result['expires_at'])
+
+    return {"hold_id": result['hold_id'], "expires_at": result['expires_at'], "message": "Seat held successfully"}
+
+
+@app.delete("/holds/{hold_id}")
+async def release_hold(hold_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Give up a hold before it expires so the slot is free for others straight away.
+    """
+    if current_user.get('role') != "EMPLOYEE":
+        raise HTTPException(status_code=403, detail="Only employees can release a hold")
+
+    released = await conn.fetchval("""
+        DELETE FROM seat_holds WHERE id = $1 AND employee_id = $2 RETURNING id
+    """, hold_id, current_user['id'])
+
+    if not released:
+        raise HTTPException(status_code=404, detail="Hold not found or already released")
+
+    hold_store.remove(hold_id)
+    return {"message": "Hold released successfully"}
+
+
+@app.post("/bookings/batch")
+async def book_seats_batch(request: BatchBookingRequest, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Reserve several seat-slots in one request. Conflicts for all items are checked in one query
+    and the BluDollar debit is applied once for the whole batch.
+
+    - `mode="atomic"` → Books every item or none (400 with per-item results on failure).
+    - `mode="partial"` → Books the items that can be booked and reports the rest per item.
+    """
+    if request.mode not in ("atomic", "partial"):
+        raise HTTPException(status_code=400, detail="Invalid mode. Use 'atomic' or 'partial'.")
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one item")
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch is limited to {MAX_BATCH_ITEMS} items")
+
+    windows = [parse_time_range(item.start_time, item.end_time) for item in request.items]
+
+    rows = await conn.fetch("""
+        SELECT item_index, result_code, reservation_id
+        FROM book_seats_batch($1, $2, $3, $4, $5, $6, $7, $8)
+    """, current_user['id'], current_user.get('manager_id'),
+        [item.seat_id for item in request.items],
+        [start_dt for start_dt, _ in windows],
+        [end_dt for _, end_dt in windows],
+        BLU_DOLLAR_COST, MAX_DAILY_USAGE, request.mode == "partial")
+
+    if rows[0]['result_code'] == "EMPLOYEE_NOT_FOUND":
+        raise_for_booking_result("EMPLOYEE_NOT_FOUND")
+
+    results = []
+    for row in rows:
+        item = request.items[row['item_index'] - 1]
+        result = {
+            "seat_id": item.seat_id,
+            "start_time": item.start_time,
+            "end_time": item.end_time,
+            "status": "BOOKED" if row['result_code'] == "BOOKED" else "FAILED",
+            "reservation_id": row['reservation_id'],
+        }
+        if row['result_code'] != "BOOKED":
+            result["error"] = BOOKING_ERRORS[row['result_code']][1]
+        results.append(result)
+
+    booked = sum(1 for result in results if result["status"] == "BOOKED")
+    if request.mode == "atomic" and booked < len(results):
+        raise HTTPException(status_code=400, detail={"message": "Batch was not booked", "results": results})
+
+    return {
+        "booked": booked,
+        "failed": len(results) - booked,
+        "bluDollars_charged": booked * BLU_DOLLAR_COST,
+        "results": results
+    }
+
+
+@app.post("/bookings/recurring")
+async def book_recurring(request: RecurringBookingRequest, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Reserve the same seat on a daily or weekly schedule until a given date.
+    The rule is expanded and conflict-checked server-side, and all occurrences are booked in one transaction.
+    """
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+    if start_dt.date() != end_dt.date():
+        raise HTTPException(status_code=400, detail="A recurring slot must start and end on the same day")
 
     try:
-        # Check if the seat is available
-        cur.execute("""
-            SELECT id FROM reservations 
-            WHERE seat_id = %s AND (start_time < %s AND end_time > %s) AND status = 'RESERVED'
-        """, (request.seat_id, end_dt, start_dt))
-
-        if cur.fetchone():
-            raise HTTPException(status_code=400, detail="Seat is already booked for this time range")
-
-        # Get employee's BluDollar usage & manager ID
-        cur.execute("SELECT bluDollar_used, manager_id FROM employees WHERE id = %s", (current_user['id'],))
-        employee = cur.fetchone()
-        if not employee:
-            raise HTTPException(status_code=404, detail="Employee not found")
-
-        bluDollar_used, manager_id = employee
-
-        # Check total BluDollars used today
-        today = datetime.now().date()
-        cur.execute("""
-            SELECT SUM(amount) FROM transactions 
-            WHERE employee_id = %s AND type = 'RESERVATION' AND DATE(created_at) = %s
-        """, (current_user['id'], today))
-        total_used_today = cur.fetchone()[0] or 0
-
-        if total_used_today + BLU_DOLLAR_COST > MAX_DAILY_USAGE:
-            raise HTTPException(status_code=400, detail="Daily BluDollar usage limit reached (max 20 BluDollars)")
-
-        # Get manager's BluDollar balance
-        cur.execute("SELECT bluDollar_balance FROM managers WHERE id = %s", (manager_id,))
-        manager_balance = cur.fetchone()
-        if not manager_balance:
-            raise HTTPException(status_code=404, detail="Manager not found")
-
-        if manager_balance[0] < BLU_DOLLAR_COST:
-            raise HTTPException(status_code=400, detail="Insufficient BluDollar balance")
-
-        # Deduct BluDollar balance from manager
-        cur.execute("UPDATE managers SET bluDollar_balance = bluDollar_balance - %s WHERE id = %s", (BLU_DOLLAR_COST, manager_id))
-
-        # Update employee's used BluDollars
-        cur.execute("UPDATE employees SET bluDollar_used = bluDollar_used + %s WHERE id = %s", (BLU_DOLLAR_COST, current_user['id']))
-
-        # Record the transaction
-        cur.execute("""
-            INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
-            VALUES (%s, %s, %s, 'RESERVATION', 'Seat reservation')
-        """, (manager_id, current_user['id'], BLU_DOLLAR_COST))
+        until = datetime.strptime(request.until, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format for 'until'. Use YYYY-MM-DD")
+
+    if until < start_dt.date() or until > start_dt.date() + timedelta(days=MAX_SERIES_DAYS):
+        raise HTTPException(status_code=400, detail=f"'until' must be within {MAX_SERIES_DAYS} days after the first occurrence")
+
+    frequency = request.frequency.upper()
+    if frequency not in ("DAILY", "WEEKLY"):
+        raise HTTPException(status_code=400, detail="Invalid frequency. Use 'daily' or 'weekly'.")
+
+    weekdays = sorted(set(request.weekdays)) or [start_dt.isoweekday()]
+    if any(day < 1 or day > 7 for day in weekdays):
+        raise HTTPException(status_code=400, detail="Weekdays must be between 1 (Monday) and 7 (Sunday)")
+
+    result = await conn.fetchrow("""
+        SELECT result_code, series_id, booked, conflicts
+        FROM book_recurring_series($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+    """, current_user['id'], current_user.get('manager_id'), request.seat_id, start_dt, end_dt,
+        frequency, weekdays if frequency == "WEEKLY" else None, until,
+        BLU_DOLLAR_COST, MAX_DAILY_USAGE, request.skip_conflicts)
+
+    conflicts = [start.strftime("%Y-%m-%d %H:%M") for start in result['conflicts'] or []]
+    if result['result_code'] == "SEAT_TAKEN" and conflicts:
+        raise HTTPException(status_code=400, detail={
+            "message": "Seat is already booked for some occurrences",
+            "conflicts": conflicts
+        })
+    raise_for_booking_result(result['result_code'])
+
+    return {
+        "series_id": result['series_id'],
+        "booked": result['booked'],
+        "skipped": conflicts,
+        "message": "Recurring reservation booked successfully"
+    }
+
+
+@app.put("/bookings/series/{series_id}/cancel")
+async def cancel_recurring(series_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Cancel every upcoming occurrence of a recurring reservation in one set-based update.
+    Occurrences starting within the next hour are kept, as with single cancellations,
+    and each freed occurrence is offered to the waitlist.
+    """
+    result = await conn.fetchrow("""
+        SELECT result_code, canceled FROM cancel_recurring_series($1, $2, $3, $4, $5)
+    """, series_id, current_user['id'], BLU_DOLLAR_COST, MIN_CANCEL_NOTICE, MAX_DAILY_USAGE)
 
-        # Reserve the seat
-        cur.execute("""
-            INSERT INTO reservations (seat_id, employee_id, start_time, end_time, status)
-            VALUES (%s, %s, %s, %s, 'RESERVED') RETURNING id
-        """, (request.seat_id, current_user['id'], start_dt, end_dt))
+    if result['result_code'] == "SERIES_NOT_FOUND":
+        raise HTTPException(status_code=404, detail="Series not found or already cancelled")
+
+    return {
+        "canceled": result['canceled'],
+        "message": "Recurring reservation cancelled and BluDollars refunded successfully"
+    }
 
-        reservation_id = cur.fetchone()[0]
-        conn.commit()
-    finally:
-        cur.close()
-        conn.close()
 
-    return {"reservation_id": reservation_id, "message": "Seat booked successfully"}
+@app.patch("/bookings/{reservation_id}")
+async def modify_booking(reservation_id: int, request: ModifyBookingRequest, current_user: dict = Depends(get_current_user),
+                         conn=Depends(get_db)):
+    """
+    Move a reservation to another seat and/or extend or shorten it in one transaction, without
+    cancelling and rebooking. Only the newly covered part of the slot is checked for conflicts,
+    the ledger gets a single MODIFICATION entry, and any part of the old slot given up goes to the waitlist.
+    """
+    times = {}
+    for field in ("start_time", "end_time"):
+        value = getattr(request, field)
+        if value is not None:
+            try:
+                times[field] = datetime.strptime(value, "%Y-%m-%d %H:%M")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM")
+
+    if request.seat_id is None and not times:
+        raise HTTPException(status_code=400, detail="Nothing to change. Pass seat_id, start_time and/or end_time.")
+
+    result_code = await conn.fetchval("""
+        SELECT modify_reservation($1, $2, $3, $4, $5, $6, $7)
+    """, reservation_id, current_user['id'], request.seat_id, times.get("start_time"), times.get("end_time"),
+        BLU_DOLLAR_COST, MAX_DAILY_USAGE)
+
+    raise_for_booking_result(result_code)
+
+    reservation = await conn.fetchrow("""
+        SELECT seat_id, start_time, end_time FROM reservations WHERE id = $1
+    """, reservation_id)
+
+    return {
+        "reservation_id": reservation_id,
+        "seat_id": reservation['seat_id'],
+        "start_time": reservation['start_time'],
+        "end_time": reservation['end_time'],
+        "message": "Reservation updated successfully"
+    }
 
 
 @app.put("/bookings/{reservation_id}/cancel")
-def cancel_booking(reservation_id: int, current_user: dict = Depends(get_current_user)):
+async def cancel_booking(reservation_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db),
+                         idempotency_key: Optional[str] = Header(None)):
     """
     Cancel a reservation, ensuring there is at least a 1-hour gap before the start time.
-    Refunds BluDollars upon successful cancellation.
+    Refunds BluDollars upon successful cancellation and offers the freed slot to the waitlist.
+    Retries with the same `Idempotency-Key` replay the original response instead of
+    reporting the reservation as already cancelled.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
+    fingerprint = request_fingerprint("PUT", f"/bookings/{reservation_id}/cancel")
+    replay = replay_cached(current_user['id'], idempotency_key, fingerprint)
+    if replay is not None:
+        return replay
+
+    async with conn.transaction():
+        replay = await claim_key(conn, current_user['id'], idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
 
-    try:
         # Check if the reservation exists
-        cur.execute("""
-            SELECT id, start_time, seat_id, employee_id FROM reservations 
-            WHERE id = %s AND employee_id = %s AND status = 'RESERVED'
-        """, (reservation_id, current_user['id']))
+        result = await conn.fetchrow("""
+            SELECT id, start_time, seat_id, employee_id, end_time FROM reservations
+            WHERE id = $1 AND employee_id = $2 AND status = 'RESERVED'
+            FOR UPDATE
+        """, reservation_id, current_user['id'])
 
-        result = cur.fetchone()
         if not result:
             raise HTTPException(status_code=404, detail="Reservation not found or already cancelled")
 
-        reservation_start_time, seat_id, employee_id = result[1], result[2], result[3]
+        reservation_start_time, seat_id, employee_id, reservation_end_time = result[1], result[2], result[3], result[4]
 
         # Ensure a 1-hour gap before cancellation is allowed
         current_time = datetime.now()
-        if (reservation_start_time - current_time).total_seconds() < 3600:
+        if reservation_start_time - current_time < MIN_CANCEL_NOTICE:
             raise HTTPException(status_code=400, detail="Cannot cancel reservation less than 1 hour before start time")
 
         # Refund BluDollars
-        cur.execute("SELECT manager_id FROM employees WHERE id = %s", (current_user['id'],))
-        manager_id = cur.fetchone()[0]
+        manager_id = await conn.fetchval("SELECT manager_id FROM employees WHERE id = $1", current_user['id'])
+
+        await conn.execute("SELECT credit_manager_balance($1, $2)", manager_id, BLU_DOLLAR_COST)
 
-        cur.execute("UPDATE managers SET bluDollar_balance = bluDollar_balance + %s WHERE id = %s", (BLU_DOLLAR_COST, manager_id))
-        cur.execute("UPDATE employees SET bluDollar_used = bluDollar_used - %s WHERE id = %s", (BLU_DOLLAR_COST, current_user['id']))
+        # Give the usage back to the day the seat was booked for
+        await conn.execute("SELECT release_daily_quota($1, $2, $3)", current_user['id'], reservation_start_time.date(), BLU_DOLLAR_COST)
 
         # Record the refund transaction
-        cur.execute("""
+        await conn.execute("""
             INSERT INTO transactions (manager_id, employee_id, amount, type, reason)
-            VALUES (%s, %s, %s, 'CANCELLATION', 'Seat reservation cancellation refund')
-        """, (manager_id, current_user['id'], BLU_DOLLAR_COST))
+            VALUES ($1, $2, $3, 'CANCELLATION', 'Seat reservation cancellation refund')
+        """, manager_id, current_user['id'], BLU_DOLLAR_COST)
 
         # Cancel the reservation
-        cur.execute("UPDATE reservations SET status = 'CANCELED' WHERE id = %s", (reservation_id,))
-        conn.commit()
+        await conn.execute("UPDATE reservations SET status = 'CANCELED' WHERE id = $1", reservation_id)
+
+        # Hand the freed slot to the first eligible waiter(s) before anyone polling can grab it
+        await conn.execute("""
+            SELECT COUNT(*) FROM promote_waitlist($1, $2, $3, $4, $5)
+        """, seat_id, reservation_start_time, reservation_end_time, BLU_DOLLAR_COST, MAX_DAILY_USAGE)
+
+        response = {"message": "Reservation cancelled and BluDollars refunded successfully"}
+        await store_response(conn, current_user['id'], idempotency_key, response)
+
+    remember_response(current_user['id'], idempotency_key, fingerprint, response)
+    return response
+
+
+@app.put("/bookings/{reservation_id}/check-in")
+async def check_in(reservation_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Mark the employee as present for a reservation, from 15 minutes before its start until its end.
+    Checked-in reservations are kept by the sweeper instead of being released as no-shows.
+    """
+    if current_user.get('role') != "EMPLOYEE":
+        raise HTTPException(status_code=403, detail="Only employees can check in")
+
+    current_time = datetime.now()
+    result = await conn.fetchrow("""
+        UPDATE reservations SET checked_in_at = COALESCE(checked_in_at, $3)
+        WHERE id = $1 AND employee_id = $2 AND status = 'RESERVED'
+        AND start_time - $4::INTERVAL <= $3 AND end_time > $3
+        RETURNING checked_in_at
+    """, reservation_id, current_user['id'], current_time, CHECK_IN_EARLY)
+
+    if not result:
+        exists = await conn.fetchval("""
+            SELECT 1 FROM reservations WHERE id = $1 AND employee_id = $2 AND status = 'RESERVED'
+        """, reservation_id, current_user['id'])
+        if not exists:
+            raise HTTPException(status_code=404, detail="Reservation not found or no longer active")
+        raise HTTPException(status_code=400, detail="Check-in opens 15 minutes before the start time and closes at the end time")
+
+    return {"reservation_id": reservation_id, "checked_in_at": result['checked_in_at'], "message": "Checked in successfully"}
+
+
+@app.post("/waitlist")
+async def join_waitlist(request: WaitlistRequest, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Wait for a seat (or any seat) to free up for a time range. When a matching slot is
+    cancelled or released it is booked for the oldest eligible waiter automatically;
+    check GET /waitlist for the resulting reservation instead of polling the seat list.
+    """
+    if current_user.get('role') != "EMPLOYEE":
+        raise HTTPException(status_code=403, detail="Only employees can join a waitlist")
+
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+    if start_dt <= datetime.now():
+        raise HTTPException(status_code=400, detail="Can only wait for slots in the future")
+
+    async with conn.transaction():
+        # Serialize one employee's joins so the entry limit holds under concurrent requests
+        await conn.execute("SELECT 1 FROM employees WHERE id = $1 FOR NO KEY UPDATE", current_user['id'])
+
+        # Entries whose slot is over no longer count, even before the sweeper expires them
+        waiting = await conn.fetchval("""
+            SELECT COUNT(*) FROM waitlist_entries
+            WHERE employee_id = $1 AND status = 'WAITING' AND end_time > now()::TIMESTAMP
+        """, current_user['id'])
+        if waiting >= MAX_WAITLIST_ENTRIES:
+            raise HTTPException(status_code=400, detail=f"Too many waitlist entries (max {MAX_WAITLIST_ENTRIES})")
+
+        if request.seat_id is not None:
+            seat = await conn.fetchval("SELECT id FROM seats WHERE id = $1", request.seat_id)
+            if not seat:
+                raise HTTPException(status_code=404, detail="Seat not found")
+
+        waitlist_id = await conn.fetchval("""
+            INSERT INTO waitlist_entries (employee_id, seat_id, start_time, end_time)
+            VALUES ($1, $2, $3, $4) RETURNING id
+        """, current_user['id'], request.seat_id, start_dt, end_dt)
+
+    return {"waitlist_id": waitlist_id, "message": "Added to the waitlist"}
+
+
+@app.get("/waitlist")
+async def get_waitlist(current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    List the employee's waitlist entries, newest first, with the reservation made on promotion.
+    """
+    entries = await conn.fetch("""
+        SELECT w.id, w.seat_id, w.start_time, w.end_time, w.status, w.reservation_id, r.seat_id AS booked_seat_id
+        FROM waitlist_entries w
+        LEFT JOIN reservations r ON r.id = w.reservation_id
+        WHERE w.employee_id = $1
+        ORDER BY w.created_at DESC
+        LIMIT 50
+    """, current_user['id'])
+
+    return [
+        {
+            "waitlist_id": entry['id'],
+            "seat_id": entry['seat_id'],
+            "start_time": entry['start_time'],
+            "end_time": entry['end_time'],
+            "status": entry['status'],
+            "reservation_id": entry['reservation_id'],
+            "booked_seat_id": entry['booked_seat_id'],
+        }
+        for entry in entries
+    ]
+
+
+@app.delete("/waitlist/{waitlist_id}")
+async def leave_waitlist(waitlist_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Stop waiting for a slot.
+    """
+    left = await conn.fetchval("""
+        UPDATE waitlist_entries SET status = 'CANCELED'
+        WHERE id = $1 AND employee_id = $2 AND status = 'WAITING'
+        RETURNING id
+    """, waitlist_id, current_user['id'])
+
+    if not left:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found or no longer waiting")
+
+    return {"message": "Removed from the waitlist"}
+
+
+@app.post("/lotteries")
+async def create_lottery(request: LotteryRequest, current_user: dict = Depends(require_manager), conn=Depends(get_db)):
+    """
+    Open a lottery for an oversubscribed slot (all-hands, team days). Employees register until
+    `registration_closes_at`; seats are then allocated to them in one batch run by
+    scripts/run_lottery.py instead of first-come-first-served. Managers only.
+    """
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+    if start_dt.date() != end_dt.date():
+        raise HTTPException(status_code=400, detail="A lottery slot must start and end on the same day")
+
+    try:
+        closes_at = datetime.strptime(request.registration_closes_at, "%Y-%m-%d %H:%M")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM")
+
+    if not datetime.now() < closes_at <= start_dt:
+        raise HTTPException(status_code=400, detail="Registration must close in the future and no later than the start time")
+
+    draw_id = await conn.fetchval("""
+        INSERT INTO lottery_draws (manager_id, start_time, end_time, registration_closes_at)
+        VALUES ($1, $2, $3, $4) RETURNING id
+    """, current_user['id'], start_dt, end_dt, closes_at)
+
+    return {"draw_id": draw_id, "message": "Lottery opened for registration"}
+
+
+@app.get("/lotteries/{draw_id}")
+async def get_lottery(draw_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Show a lottery, how many employees registered and, for employees, their own entry and result.
+    """
+    draw = await conn.fetchrow("""
+        SELECT d.id, d.start_time, d.end_time, d.registration_closes_at, d.status,
+               (SELECT COUNT(*) FROM lottery_entries e WHERE e.draw_id = d.id) AS entries
+        FROM lottery_draws d WHERE d.id = $1
+    """, draw_id)
+
+    if not draw:
+        raise HTTPException(status_code=404, detail="Lottery not found")
+
+    entry = None
+    if current_user.get('role') != "MANAGER":
+        entry = await conn.fetchrow("""
+            SELECT preferred_seat_ids, status, reservation_id, reason FROM lottery_entries
+            WHERE draw_id = $1 AND employee_id = $2
+        """, draw_id, current_user['id'])
+
+    return {
+        "draw_id": draw['id'],
+        "start_time": draw['start_time'],
+        "end_time": draw['end_time'],
+        "registration_closes_at": draw['registration_closes_at'],
+        "status": draw['status'],
+        "entries": draw['entries'],
+        "my_entry": dict(entry) if entry else None
+    }
+
+
+@app.post("/lotteries/{draw_id}/entries")
+async def enter_lottery(draw_id: int, request: LotteryEntryRequest, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Register for a lottery, optionally ranking preferred seats. Registering again replaces the preferences.
+    Nothing is charged until the allocation run books a seat.
+    """
+    if current_user.get('role') == "MANAGER":
+        raise HTTPException(status_code=403, detail="Only employees can enter a lottery")
+
+    preferred = list(dict.fromkeys(request.preferred_seat_ids))
+    if len(preferred) > MAX_SEAT_PREFERENCES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SEAT_PREFERENCES} preferred seats")
+
+    entered = await conn.fetchval("""
+        INSERT INTO lottery_entries (draw_id, employee_id, preferred_seat_ids)
+        SELECT d.id, $2, $3 FROM lottery_draws d
+        WHERE d.id = $1 AND d.status = 'OPEN' AND d.registration_closes_at > $4
+        ON CONFLICT (draw_id, employee_id) DO UPDATE SET preferred_seat_ids = EXCLUDED.preferred_seat_ids
+        RETURNING TRUE
+    """, draw_id, current_user['id'], preferred, datetime.now())
+
+    if not entered:
+        raise HTTPException(status_code=400, detail="Lottery not found or registration is closed")
+
+    return {"draw_id": draw_id, "message": "Registered for the lottery"}
+
+
+@app.delete("/lotteries/{draw_id}/entries")
+async def leave_lottery(draw_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Withdraw from a lottery while registration is open.
+    """
+    left = await conn.fetchval("""
+        DELETE FROM lottery_entries e USING lottery_draws d
+        WHERE e.draw_id = $1 AND e.employee_id = $2
+        AND d.id = e.draw_id AND d.status = 'OPEN' AND d.registration_closes_at > $3
+        RETURNING TRUE
+    """, draw_id, current_user['id'], datetime.now())
+
+    if not left:
+        raise HTTPException(status_code=404, detail="Entry not found or registration is closed")
+
+    return {"message": "Withdrawn from the lottery"}
+
+
+async def run_bulk_cancellation(job_id: int):
+    """Work through a bulk cancellation one committed chunk at a time, then mark it finished."""
+    status, error = "DONE", None
+    try:
+        while True:
+            conn = await db_pool.acquire()
+            try:
+                canceled = await conn.fetchval("""
+                    SELECT cancel_reservations_chunk($1, $2, $3)
+                """, job_id, BLU_DOLLAR_COST, BULK_CANCEL_CHUNK_SIZE)
+            finally:
+                await db_pool.release(conn)
+            if not canceled:
+                break
+    except Exception as e:
+        logger.error(f"Bulk cancellation {job_id} failed: {e}")
+        status, error = "FAILED", str(e)
+
+    conn = await db_pool.acquire()
+    try:
+        await conn.execute("""
+            UPDATE bulk_cancellations SET status = $2, error = $3, finished_at = now()
+            WHERE id = $1 AND status = 'RUNNING'
+        """, job_id, status, error)
+    finally:
+        await db_pool.release(conn)
+
+
+resumed_bulk_cancellations = set()  # Background tasks started by resume_bulk_cancellations()
+
+
+async def resume_bulk_cancellations():
+    """
+    Finish bulk cancellations left RUNNING by a restart. Chunks already committed stay done and
+    cancel_reservations_chunk() only picks still-active reservations, so the job simply carries on.
+    """
+    conn = await db_pool.acquire()
+    try:
+        job_ids = await conn.fetch("SELECT id FROM bulk_cancellations WHERE status = 'RUNNING' ORDER BY id")
     finally:
-        cur.close()
-        conn.close()
+        await db_pool.release(conn)
+    for job in job_ids:
+        logger.info(f"Resuming bulk cancellation {job['id']}")
+        task = asyncio.ensure_future(run_bulk_cancellation(job['id']))
+        resumed_bulk_cancellations.add(task)  # Keep a reference until the task finishes
+        task.add_done_callback(resumed_bulk_cancellations.discard)
+
+
+@app.post("/admin/bulk-cancellations", status_code=202)
+async def create_bulk_cancellation(request: BulkCancellationRequest, background_tasks: BackgroundTasks,
+                                   current_user: dict = Depends(require_admin), conn=Depends(get_db)):
+    """
+    Close seats for a time range (maintenance, holidays): cancel and refund every active reservation
+    on `seat_ids` (all seats if left out) overlapping the range, regardless of the 1-hour cancellation rule.
+    Work runs in the background in chunks of BULK_CANCEL_CHUNK_SIZE; follow it with GET on the returned job.
+    Freed slots are not offered to the waitlist, since the seats are closed.
+    Managers listed in ADMIN_MANAGER_IDS only. Jobs interrupted by a restart are resumed at startup.
+    """
+    start_dt, end_dt = parse_time_range(request.start_time, request.end_time)
+    if request.seat_ids is not None and not request.seat_ids:
+        raise HTTPException(status_code=400, detail="seat_ids must not be empty; leave it out to close every seat")
+    if not request.reason.strip():
+        raise HTTPException(status_code=400, detail="A reason is required")
+
+    job = await conn.fetchrow("""
+        INSERT INTO bulk_cancellations (manager_id, seat_ids, start_time, end_time, reason, total)
+        SELECT $1, $2::BIGINT[], $3, $4, $5, COUNT(*)
+        FROM reservations r
+        WHERE r.status = 'RESERVED' AND r.during && tsrange($3, $4) AND r.end_time > now()::TIMESTAMP
+        AND ($2::BIGINT[] IS NULL OR r.seat_id = ANY($2::BIGINT[]))
+        RETURNING id, total
+    """, current_user['id'], request.seat_ids, start_dt, end_dt, request.reason.strip())
 
-    return {"message": "Reservation cancelled and BluDollars refunded successfully"}
+    background_tasks.add_task(run_bulk_cancellation, job['id'])
+
+    return {"job_id": job['id'], "total": job['total'], "message": "Bulk cancellation started"}
+
+
+@app.get("/admin/bulk-cancellations/{job_id}")
+async def get_bulk_cancellation(job_id: int, current_user: dict = Depends(require_admin), conn=Depends(get_db)):
+    """
+    Report a bulk cancellation's progress: reservations cancelled so far out of those matching at the start.
+    """
+    job = await conn.fetchrow("""
+        SELECT id, seat_ids, start_time, end_time, reason, status, total, canceled, refunded, chunks,
+               error, created_at, finished_at
+        FROM bulk_cancellations WHERE id = $1
+    """, job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk cancellation not found")
+
+    result = dict(job)
+    # Bookings made in the range after the job started are cancelled too, so the count can pass the total
+    result["progress_pct"] = 100.0 if job['status'] == "DONE" or not job['total'] \
+        else round(min(job['canceled'] / job['total'], 1.0) * 100, 1)
+    return result
+
+
+@app.get("/usage/today")
+async def get_usage_today(current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
+    """
+    Return how many BluDollars the employee has used for today's seats, served from the daily usage counters.
+    """
+    today = datetime.now().date()
+    used = await conn.fetchval("""
+        SELECT amount FROM employee_daily_usage WHERE employee_id = $1 AND usage_date = $2
+    """, current_user['id'], today) or 0
+
+    return {
+        "date": today.isoformat(),
+        "used": used,
+        "limit": MAX_DAILY_USAGE,
+        "remaining": max(MAX_DAILY_USAGE - used, 0)
+    }
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+
+class HoldStore:
+    """
+    In-process copy of the seat holds this service has granted, indexed by seat.
+    It lets a request that clashes with a live hold be turned away without a database
+    round trip; a miss is not authoritative and falls through to the seat_holds table,
+    which also sees holds granted by other processes.
+    """
+
+    def __init__(self):
+        self._by_seat = {}  # seat_id -> {hold_id: (employee_id, start_time, end_time, expires_at)}
+        self._seat_of = {}  # hold_id -> seat_id
+
+    def add(self, hold_id: int, seat_id: int, employee_id: int, start_time: datetime, end_time: datetime, expires_at: datetime):
+        self._by_seat.setdefault(seat_id, {})[hold_id] = (employee_id, start_time, end_time, expires_at)
+        self._seat_of[hold_id] = seat_id
+
+    def remove(self, hold_id: int):
+        seat_id = self._seat_of.pop(hold_id, None)
+        if seat_id is None:
+            return
+        holds = self._by_seat[seat_id]
+        holds.pop(hold_id, None)
+        if not holds:
+            del self._by_seat[seat_id]
+
+    def is_held_by_other(self, seat_id: int, employee_id: int, start_time: datetime, end_time: datetime) -> bool:
+        """True if another employee holds an overlapping slot; expired holds on the seat are dropped on the way."""
+        now = datetime.now()
+        for hold_id, (holder, held_start, held_end, expires_at) in list(self._by_seat.get(seat_id, {}).items()):
+            if expires_at <= now:
+                self.remove(hold_id)
+            elif holder != employee_id and held_start < end_time and held_end > start_time:
+                return True
+        return False
+
+
+hold_store = HoldStore()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Idempotency settings from environment variables
+IDEMPOTENCY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))  # How long a key can be replayed
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))  # Responses kept in memory per process
+MAX_KEY_LENGTH = 255
+
+
+class ResponseCache:
+    """
+    Bounded LRU of stored responses so retries hitting the same process are answered
+    without a database round trip. Entries expire after the same TTL as the table rows.
+    """
+
+    def __init__(self, max_size: int, ttl: timedelta):
+        self.max_size = max_size
+        self.ttl = ttl.total_seconds()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+response_cache = ResponseCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL)
+
+
+def request_fingerprint(method: str, path: str, body=None) -> str:
+    """Hash of the request a key was first used with, so a key can't be reused for a different request."""
+    payload = json.dumps(jsonable_encoder(body), sort_keys=True)
+    return hashlib.sha256(f"{method} {path} {payload}".encode()).hexdigest()
+
+
+def _replay(stored, fingerprint: str):
+    stored_fingerprint, status_code, body = stored
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return JSONResponse(status_code=status_code, content=body, headers={"Idempotent-Replayed": "true"})
+
+
+def replay_cached(user_id: int, key: str, fingerprint: str):
+    """Return the stored response for this key from the in-process cache, or None."""
+    if key is None:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    stored = response_cache.get((user_id, key))
+    return _replay(stored, fingerprint) if stored is not None else None
+
+
+async def claim_key(conn, user_id: int, key: str, fingerprint: str):
+    """
+    Claim the key inside the caller's transaction, or return the response it already produced.
+    A concurrent request with the same key blocks on the insert until the first one commits
+    (and then replays its response) or rolls back (and then runs itself).
+    """
+    if key is None:
+        return None
+
+    claimed = await conn.fetchval("""
+        INSERT INTO idempotency_keys (user_id, idempotency_key, request_hash, expires_at)
+        VALUES ($1, $2, $3, now() + $4::INTERVAL)
+        ON CONFLICT (user_id, idempotency_key) DO UPDATE
+            SET request_hash = EXCLUDED.request_hash, status_code = NULL, response = NULL,
+                created_at = now(), expires_at = EXCLUDED.expires_at
+            WHERE idempotency_keys.expires_at < now()
+        RETURNING TRUE
+    """, user_id, key, fingerprint, IDEMPOTENCY_TTL)
+    if claimed:
+        return None
+
+    row = await conn.fetchrow("""
+        SELECT request_hash, status_code, response FROM idempotency_keys
+        WHERE user_id = $1 AND idempotency_key = $2
+    """, user_id, key)
+    stored = (row['request_hash'], row['status_code'], json.loads(row['response']))
+    response_cache.put((user_id, key), stored)
+    logger.info(f"Replaying stored response for idempotency key {key!r} of user {user_id}")
+    return _replay(stored, fingerprint)
+
+
+async def store_response(conn, user_id: int, key: str, body: dict, status_code: int = 200):
+    """Save the response for a claimed key; it becomes visible to retries when the transaction commits."""
+    if key is None:
+        return
+
+    await conn.execute("""
+        UPDATE idempotency_keys SET status_code = $3, response = $4
+        WHERE user_id = $1 AND idempotency_key = $2
+    """, user_id, key, status_code, json.dumps(jsonable_encoder(body)))
+
+
+def remember_response(user_id: int, key: str, fingerprint: str, body: dict, status_code: int = 200):
+    """Cache a committed response in-process so the next retry skips the database."""
+    if key is not None:
+        response_cache.put((user_id, key), (fingerprint, status_code, jsonable_encoder(body)))
+
+
+async def purge_expired_keys(conn) -> int:
+    """Delete keys past their TTL; returns the number removed."""
+    result = await conn.execute("DELETE FROM idempotency_keys WHERE expires_at < now()")
+    return int(result.split()[-1])
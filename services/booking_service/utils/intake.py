@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict, deque
+from utils.database import db_pool
+
+logger = logging.getLogger(__name__)
+
+# Intake queue settings from environment variables
+INTAKE_WORKERS = int(os.getenv("BOOKING_INTAKE_WORKERS", "2"))  # Workers draining the queue in this process
+INTAKE_BATCH_SIZE = int(os.getenv("BOOKING_INTAKE_BATCH_SIZE", "200"))  # Requests booked per commit
+INTAKE_IDLE_POLL = float(os.getenv("BOOKING_INTAKE_IDLE_POLL", "1.0"))  # Seconds between checks when idle
+RESULTS_KEPT = 10000  # Recent results kept in memory to answer long-polls
+THROUGHPUT_WINDOW = 60.0  # Seconds of history behind the throughput metric
+
+
+class BookingIntake:
+    """
+    Durable intake queue for peak-hour bookings. Requests are stored in booking_requests
+    and answered with a ticket; a fixed set of workers drains them in batches, so a burst
+    costs one INSERT per request plus one commit per batch instead of one connection per request.
+    Tickets finished by this process wake long-polls directly; others are seen on the next DB check.
+    """
+
+    def __init__(self, workers: int, batch_size: int, idle_poll: float):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_poll = idle_poll
+        self._tasks = []
+        self._wakeup = None
+        self._progress = None
+        self._results = OrderedDict()  # ticket_id -> (result_code, reservation_id)
+
+        # Counters reported by stats()
+        self._enqueued = 0
+        self._processed = 0
+        self._booked = 0
+        self._batches = 0
+        self._queued_time_total = 0.0
+        self._queued_time_max = 0.0
+        self._recent = deque()  # (finished_at, processed) per batch inside THROUGHPUT_WINDOW
+
+    def start(self, cost, max_daily_usage):
+        """Start the workers; call once the database pool is open."""
+        self._wakeup = asyncio.Event()
+        self._progress = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._work(cost, max_daily_usage)) for _ in range(self.workers)]
+        logger.info(f"Booking intake started with {self.workers} worker(s), batches of {self.batch_size}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, conn, employee_id, manager_id, seat_id, start_time, end_time) -> int:
+        """Store one booking request and return its ticket id."""
+        ticket_id = await conn.fetchval("""
+            INSERT INTO booking_requests (employee_id, manager_id, seat_id, start_time, end_time)
+            VALUES ($1, $2, $3, $4, $5) RETURNING id
+        """, employee_id, manager_id, seat_id, start_time, end_time)
+        self._enqueued += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return ticket_id
+
+    def result(self, ticket_id: int):
+        """(result_code, reservation_id) if this process has finished the ticket, else None."""
+        return self._results.get(ticket_id)
+
+    async def wait_for_progress(self, timeout: float):
+        """Sleep until a batch finishes in this process, or `timeout` seconds pass."""
+        progress = self._progress
+        if progress is None:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            await asyncio.wait_for(progress.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _work(self, cost, max_daily_usage):
+        while True:
+            try:
+                rows = await self._drain(cost, max_daily_usage)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Booking intake batch failed: {e}")
+                await asyncio.sleep(self.idle_poll)
+                continue
+
+            if rows:
+                self._record(rows)
+                continue
+
+            # Queue is empty: wait for a local enqueue, or re-check for requests from other processes
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.idle_poll)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _drain(self, cost, max_daily_usage):
+        conn = await db_pool.acquire()
+        try:
+            return await conn.fetch("""
+                SELECT ticket_id, result_code, reservation_id, queued_seconds
+                FROM drain_booking_requests($1, $2, $3)
+            """, self.batch_size, cost, max_daily_usage)
+        finally:
+            await db_pool.release(conn)
+
+    def _record(self, rows):
+        now = time.monotonic()
+        for row in rows:
+            self._results[row['ticket_id']] = (row['result_code'], row['reservation_id'])
+            self._booked += row['result_code'] == "BOOKED"
+            self._queued_time_total += row['queued_seconds']
+            self._queued_time_max = max(self._queued_time_max, row['queued_seconds'])
+        while len(self._results) > RESULTS_KEPT:
+            self._results.popitem(last=False)
+
+        self._processed += len(rows)
+        self._batches += 1
+        self._recent.append((now, len(rows)))
+        while self._recent and self._recent[0][0] < now - THROUGHPUT_WINDOW:
+            self._recent.popleft()
+
+        # Wake every long-poll waiting on this process, then arm a fresh event for the next batch
+        progress, self._progress = self._progress, asyncio.Event()
+        progress.set()
+
+    def stats(self) -> dict:
+        """Snapshot of intake counters for the metrics endpoint (queue depth is added by the caller)."""
+        now = time.monotonic()
+        recent = sum(count for finished_at, count in self._recent if finished_at >= now - THROUGHPUT_WINDOW)
+        return {
+            "workers": len(self._tasks),
+            "batch_size": self.batch_size,
+            "enqueued_total": self._enqueued,
+            "processed_total": self._processed,
+            "booked_total": self._booked,
+            "batches_total": self._batches,
+            "avg_batch_size": round(self._processed / self._batches, 2) if self._batches else 0.0,
+            "throughput_per_s": round(recent / THROUGHPUT_WINDOW, 2),
+            "queued_time_avg_ms": round(self._queued_time_total / self._processed * 1000, 3) if self._processed else 0.0,
+            "queued_time_max_ms": round(self._queued_time_max * 1000, 3),
+        }
+
+
+booking_intake = BookingIntake(INTAKE_WORKERS, INTAKE_BATCH_SIZE, INTAKE_IDLE_POLL)
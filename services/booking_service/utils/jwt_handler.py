@@ -14,6 +14,9 @@ SECRET_KEY = os.getenv("JWT_SECRET", "your_secret_key")  # Change this in produc
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# Managers allowed to run company-wide admin actions such as bulk cancellations (comma-separated ids)
+ADMIN_MANAGER_IDS = {int(i) for i in os.getenv("ADMIN_MANAGER_IDS", "").split(",") if i.strip()}
+
 # Security Schema
 security = HTTPBearer()
 
@@ -47,3 +50,25 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Security(securi
 
     logger.debug(f"Decoded User Data: {user_data}")
     return user_data
+
+
+def require_manager(current_user: dict = Depends(get_current_user)):
+    """
+    Allow the request only for managers.
+    :param current_user: Decoded user information (dict)
+    :return: Decoded user information (dict)
+    """
+    if current_user.get('role') != "MANAGER":
+        raise HTTPException(status_code=403, detail="Only managers can perform this action")
+    return current_user
+
+
+def require_admin(current_user: dict = Depends(require_manager)):
+    """
+    Allow the request only for managers listed in ADMIN_MANAGER_IDS.
+    :param current_user: Decoded user information (dict)
+    :return: Decoded user information (dict)
+    """
+    if current_user.get('id') not in ADMIN_MANAGER_IDS:
+        raise HTTPException(status_code=403, detail="Only administrators can perform this action")
+    return current_user
@@ -0,0 +1,71 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEAT_LAYOUT_TTL = float(os.getenv("SEAT_LAYOUT_TTL", "300"))  # Seconds before the floor layout is re-read
+
+
+class SeatLayout:
+    """
+    Precomputed seat adjacency. Seats are grouped into runs: seats in the same zone and row
+    whose positions are consecutive, in position order. Two seats are next to each other
+    exactly when they are neighbours in a run, so finding k adjacent free seats is a single
+    scan over the runs instead of a search over seat combinations.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._runs = []  # [(zone, seat_row, [(seat_id, seat_position), ...]), ...] in floor order
+        self._loaded_at = None
+
+    async def load(self, conn):
+        """(Re)build the runs from the seats table."""
+        rows = await conn.fetch("""
+            SELECT id, zone, seat_row, seat_position FROM seats
+            WHERE zone IS NOT NULL
+            ORDER BY zone, seat_row, seat_position
+        """)
+        runs = []
+        previous = None
+        for row in rows:
+            if previous is None or (row['zone'], row['seat_row']) != (previous['zone'], previous['seat_row']) \
+                    or row['seat_position'] != previous['seat_position'] + 1:
+                runs.append((row['zone'], row['seat_row'], []))
+            runs[-1][2].append((row['id'], row['seat_position']))
+            previous = row
+        self._runs = runs
+        self._loaded_at = time.monotonic()
+        logger.info(f"Seat layout loaded: {len(rows)} seats in {len(runs)} runs")
+
+    async def ensure_loaded(self, conn):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            await self.load(conn)
+
+    def find_block(self, free_seat_ids: set, size: int, zone: str = None):
+        """
+        Best block of `size` adjacent free seats, as [(seat_id, zone, seat_row, seat_position), ...],
+        or None. Each run is scanned once for its stretches of free seats; the shortest stretch
+        that fits wins (ties go to the first on the floor), and the block starts at its left end,
+        so larger stretches stay whole for bigger teams.
+        """
+        best = None  # (stretch length, block)
+        for run_zone, seat_row, seats in self._runs:
+            if zone is not None and run_zone != zone:
+                continue
+            stretch_start = 0
+            for i in range(len(seats) + 1):
+                if i < len(seats) and seats[i][0] in free_seat_ids:
+                    continue
+                length = i - stretch_start
+                if length >= size and (best is None or length < best[0]):
+                    block = [(seat_id, run_zone, seat_row, position) for seat_id, position in seats[stretch_start:stretch_start + size]]
+                    best = (length, block)
+                    if length == size:
+                        return block  # Exact fit: nothing is left fragmented
+                stretch_start = i + 1
+        return best[1] if best else None
+
+
+seat_layout = SeatLayout(SEAT_LAYOUT_TTL)
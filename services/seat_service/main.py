@@ -1,32 +1,87 @@
-from fastapi import FastAPI, HTTPException, Query, Depends, Security
+from fastapi import FastAPI, HTTPException, Query, Header, Depends, Security, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from utils.database import get_db_connection
+from utils.database import get_db, db_connection, db_pool, init_db_pool, close_db_pool
+from utils.seat_index import seat_index, SEAT_INDEX_ENABLED
+from utils.availability_cache import availability_cache
+from utils.single_flight import single_flight
+from utils.etag import make_etag, etag_matches
+from utils.grid import rasterize, encode_runs, encode_bitsets, HELD, RESERVED
 from utils.jwt_handler import get_current_user
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timedelta
+import numpy as np
+import json
 import logging
 
 # Initialize FastAPI
 app = FastAPI(title="Seat Management Service")
 security = HTTPBearer()
 
+MAX_WINDOW_SEARCH = timedelta(days=31)  # Longest time range one free-window search may scan
+DEFAULT_WINDOW_SEARCH = timedelta(days=7)  # Range searched when no end is given
+MAX_WINDOWS = 50  # Windows one free-window search may return
+MIN_GRID_SLOT_MINUTES = 5  # Finest slot the day grid can be drawn with
+
 # Initialize Logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+@app.on_event("startup")
+async def startup():
+    await init_db_pool()
+    if SEAT_INDEX_ENABLED:
+        seat_index.subscribe(availability_cache.invalidate)
+        await seat_index.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await seat_index.stop()
+    await close_db_pool()
+
+
+@app.get("/metrics/db-pool")
+async def db_pool_metrics():
+    """Report connection pool usage (in use, waiting, wait time)."""
+    return db_pool.stats()
+
+
+@app.get("/metrics/seat-index")
+async def seat_index_metrics():
+    """Report the in-memory availability index: freshness, size, and reads served from memory vs the database."""
+    return seat_index.stats()
+
+
+@app.get("/metrics/availability-cache")
+async def availability_cache_metrics():
+    """Report the availability response cache: size, hits (fresh and stale), misses, invalidations."""
+    return availability_cache.stats()
+
+
+@app.get("/metrics/single-flight")
+async def single_flight_metrics():
+    """Report how many identical concurrent reads were coalesced onto one database query."""
+    return single_flight.stats()
+
+
 @app.get("/seats")
-def get_seats(
+async def get_seats(
         start_time: str = Query(..., description="Start time in YYYY-MM-DD HH:MM format"),
         end_time: str = Query(..., description="End time in YYYY-MM-DD HH:MM format"),
         filter: str = Query("available", description="Filter: 'available' for free seats, 'all' for all seats"),
+        if_none_match: Optional[str] = Header(None),
         current_user: dict = Depends(get_current_user)  # Authenticate user
 ):
     """
     Fetch seats based on the given time range.
 
     - `filter="available"` → Returns only available seats.
-    - `filter="all"` → Returns all seats (both available and reserved).
+    - `filter="all"` → Returns all seats (available, reserved, or held by someone's checkout).
     - Requires authentication via JWT.
+    - Answered from the in-memory seat index while it is current, otherwise from the database.
+      Index answers are cached per (time range, filter) until a change overlaps the range.
+    - Index answers carry an ETag; a matching If-None-Match gets `304 Not Modified` without building the body.
     """
 
     try:
@@ -35,97 +90,318 @@ def get_seats(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+    if filter.lower() not in ("available", "all"):
+        raise HTTPException(status_code=400, detail="Invalid filter value. Use 'available' or 'all'.")
 
-    try:
-        if filter.lower() == "available":
-            # Fetch only available seats during the given time range
-            query = """
-                SELECT s.id, s.seat_number
-                FROM seats s
-                WHERE NOT EXISTS (
+    if seat_index.is_fresh():
+        etag = seats_etag(start_dt, end_dt, filter.lower())
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        # The cache may hand back a body built a moment ago, so it is served with the tag it was built with
+        etag, body = await availability_cache.get((start_dt, end_dt, filter.lower()), start_dt, end_dt,
+                                                  lambda: build_seats_body(start_dt, end_dt, filter.lower()))
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    # Identical concurrent requests share one query (and one pooled connection)
+    seats = await single_flight.do(("seats", start_dt, end_dt, filter.lower()),
+                                   lambda: fetch_seats(start_dt, end_dt, filter.lower()))
+    return [seat_payload(seat, seat['status']) for seat in seats]
+
+
+def seat_payload(seat, status: str) -> dict:
+    return {
+        "id": seat['id'],
+        "seat_number": seat['seat_number'],
+        "zone": seat['zone'],
+        "row": seat['seat_row'],
+        "position": seat['seat_position'],
+        "status": status
+    }
+
+
+def seats_etag(start_dt: datetime, end_dt: datetime, filter: str) -> str:
+    """
+    ETag of the get_seats response as the seat index stands now. Expiring holds free seats without
+    any change event, so the next hold expiry in the range is part of the tag.
+    """
+    return make_etag(seat_index.version(), start_dt, end_dt, filter, seat_index.next_hold_expiry(start_dt, end_dt))
+
+
+async def build_seats_body(start_dt: datetime, end_dt: datetime, filter: str):
+    """
+    (ETag, serialized get_seats response) from the seat index, and when a hold it shows runs out (for the cache).
+    Nothing here awaits, so the tag and the body describe the same state of the index.
+    """
+    seats = [
+        seat_payload(seat, status)
+        for seat, status in seat_index.seat_statuses(start_dt, end_dt)
+        if filter == "all" or status == "AVAILABLE"
+    ]
+    body = json.dumps(seats, separators=(",", ":")).encode("utf-8")
+    return (seats_etag(start_dt, end_dt, filter), body), seat_index.next_hold_expiry(start_dt, end_dt)
+
+
+async def fetch_seats(start_dt: datetime, end_dt: datetime, filter: str):
+    """Database path of get_seats, used while the seat index is loading or behind."""
+    if filter == "available":
+        # Fetch only available seats during the given time range
+        query = """
+            SELECT s.id, s.seat_number, s.zone, s.seat_row, s.seat_position, 'AVAILABLE' AS status
+            FROM seats s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM reservations r
+                WHERE r.seat_id = s.id AND r.status = 'RESERVED'
+                AND r.during && tsrange($2, $1)
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM seat_holds h
+                WHERE h.seat_id = s.id AND h.expires_at > now()::TIMESTAMP
+                AND h.during && tsrange($2, $1)
+            )
+            ORDER BY s.seat_number, s.id
+        """
+    else:
+        # Fetch all seats, including reserved ones
+        query = """
+            SELECT s.id, s.seat_number, s.zone, s.seat_row, s.seat_position,
+            CASE
+                WHEN EXISTS (
                     SELECT 1 FROM reservations r
-                    WHERE r.seat_id = s.id
-                    AND r.start_time < %s AND r.end_time > %s
-                )
-            """
-            cur.execute(query, (end_dt, start_dt))
-
-        elif filter.lower() == "all":
-            # Fetch all seats, including reserved ones
-            query = """
-                SELECT s.id, s.seat_number,
-                CASE 
-                    WHEN EXISTS (
-                        SELECT 1 FROM reservations r
-                        WHERE r.seat_id = s.id
-                        AND r.start_time < %s AND r.end_time > %s
-                    ) THEN 'RESERVED'
-                    ELSE 'AVAILABLE'
-                END AS status
-                FROM seats s
-            """
-            cur.execute(query, (end_dt, start_dt))
-
-        else:
-            raise HTTPException(status_code=400, detail="Invalid filter value. Use 'available' or 'all'.")
-
-        seats = cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
+                    WHERE r.seat_id = s.id AND r.status = 'RESERVED'
+                    AND r.during && tsrange($2, $1)
+                ) THEN 'RESERVED'
+                WHEN EXISTS (
+                    SELECT 1 FROM seat_holds h
+                    WHERE h.seat_id = s.id AND h.expires_at > now()::TIMESTAMP
+                    AND h.during && tsrange($2, $1)
+                ) THEN 'HELD'
+                ELSE 'AVAILABLE'
+            END AS status
+            FROM seats s
+            ORDER BY s.seat_number, s.id
+        """
+
+    async with db_connection() as conn:
+        return await conn.fetch(query, end_dt, start_dt)
+
+
+@app.get("/seats/free-windows")
+async def get_free_windows(
+        duration_minutes: int = Query(..., gt=0, le=24 * 60, description="Length of the window needed, in minutes"),
+        start_time: Optional[str] = Query(None, description="Search from (YYYY-MM-DD HH:MM); defaults to now"),
+        end_time: Optional[str] = Query(None, description="Search until (YYYY-MM-DD HH:MM); defaults to 7 days after the start"),
+        seat_ids: Optional[List[int]] = Query(None, description="Seats to search; all seats if left out"),
+        zone: Optional[str] = Query(None, description="Only search seats in this zone"),
+        limit: int = Query(5, gt=0, le=MAX_WINDOWS, description="Number of windows to return"),
+        current_user: dict = Depends(get_current_user),
+        conn=Depends(get_db)
+):
+    """
+    Find the earliest free windows of `duration_minutes` across a set of seats, at most one per gap.
+    Each seat's reservations and live holds in the searched range are merged into a multirange and
+    subtracted from the range in the same query, so the gaps come back directly instead of
+    one seat-details call per seat.
+    - Requires authentication via JWT.
+    """
+    try:
+        search_start = datetime.strptime(start_time, "%Y-%m-%d %H:%M") if start_time else None
+        search_end = datetime.strptime(end_time, "%Y-%m-%d %H:%M") if end_time else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM")
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    search_start = max(search_start or now, now)
+    search_end = search_end or search_start + DEFAULT_WINDOW_SEARCH
+    if search_end <= search_start:
+        raise HTTPException(status_code=400, detail="End time must be in the future and after start time")
+    if search_end - search_start > MAX_WINDOW_SEARCH:
+        raise HTTPException(status_code=400, detail=f"Search range is limited to {MAX_WINDOW_SEARCH.days} days")
+
+    windows = await conn.fetch("""
+        WITH busy AS (
+            SELECT s.id AS seat_id, s.seat_number, s.zone, s.seat_row, s.seat_position,
+                   COALESCE(range_agg(b.during) FILTER (WHERE b.during IS NOT NULL), '{}'::tsmultirange) AS busy
+            FROM seats s
+            LEFT JOIN LATERAL (
+                SELECT r.during FROM reservations r
+                WHERE r.seat_id = s.id AND r.status = 'RESERVED' AND r.during && tsrange($1, $2)
+                UNION ALL
+                SELECT h.during FROM seat_holds h
+                WHERE h.seat_id = s.id AND h.expires_at > now()::TIMESTAMP AND h.during && tsrange($1, $2)
+            ) b ON TRUE
+            WHERE ($3::BIGINT[] IS NULL OR s.id = ANY($3::BIGINT[]))
+            AND ($4::TEXT IS NULL OR s.zone = $4)
+            GROUP BY s.id
+        ), gaps AS (
+            SELECT seat_id, seat_number, zone, seat_row, seat_position,
+                   unnest(tsmultirange(tsrange($1, $2)) - busy) AS gap
+            FROM busy
+        )
+        SELECT seat_id, seat_number, zone, seat_row, seat_position, lower(gap) AS start_time, upper(gap) AS free_until
+        FROM gaps
+        WHERE upper(gap) - lower(gap) >= $5
+        ORDER BY lower(gap), seat_number, seat_id
+        LIMIT $6
+    """, search_start, search_end, seat_ids, zone, timedelta(minutes=duration_minutes), limit)
 
     return [
-        {"id": seat[0], "seat_number": seat[1], "status": seat[2] if len(seat) > 2 else "AVAILABLE"}
-        for seat in seats
+        {
+            "seat_id": window['seat_id'],
+            "seat_number": window['seat_number'],
+            "zone": window['zone'],
+            "row": window['seat_row'],
+            "position": window['seat_position'],
+            "start_time": window['start_time'],
+            "end_time": window['start_time'] + timedelta(minutes=duration_minutes),
+            "free_until": window['free_until']
+        }
+        for window in windows
     ]
 
 
+@app.get("/seats/grid")
+async def get_seat_grid(
+        date: str = Query(..., description="Day to draw, YYYY-MM-DD"),
+        slot_minutes: int = Query(30, description="Slot length in minutes; must divide a day evenly"),
+        zone: Optional[str] = Query(None, description="Only include seats in this zone"),
+        encoding: str = Query("rle", description="'rle' for run-length rows, 'bitset' for base64 bitsets"),
+        current_user: dict = Depends(get_current_user),
+        conn=Depends(get_db)
+):
+    """
+    Occupancy of every seat across a whole day in one call (seats x time slots), for the floor grid.
+    The day's reservations and live holds are fetched once and rasterized into the grid with NumPy.
+
+    - `encoding="rle"` → Each seat's row as [state, slots, state, slots, ...] with 0 = free, 1 = held, 2 = reserved.
+    - `encoding="bitset"` → Each seat's reserved and held slots as base64 bitsets, first slot in the high bit.
+    - Requires authentication via JWT.
+    """
+    try:
+        day_start = datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+    if slot_minutes < MIN_GRID_SLOT_MINUTES or (24 * 60) % slot_minutes:
+        raise HTTPException(status_code=400, detail=f"slot_minutes must be at least {MIN_GRID_SLOT_MINUTES} and divide 1440")
+    if encoding not in ("rle", "bitset"):
+        raise HTTPException(status_code=400, detail="Invalid encoding. Use 'rle' or 'bitset'.")
+
+    day_end = day_start + timedelta(days=1)
+    slots = 24 * 60 // slot_minutes
+
+    seats = await conn.fetch("""
+        SELECT id, seat_number, zone, seat_row, seat_position FROM seats
+        WHERE $1::TEXT IS NULL OR zone = $1
+        ORDER BY id
+    """, zone)
+
+    # Offsets are seconds from midnight, so the rasterization never touches datetime objects
+    intervals = await conn.fetch("""
+        SELECT r.seat_id, EXTRACT(EPOCH FROM r.start_time - $1) AS start_offset,
+               EXTRACT(EPOCH FROM r.end_time - $1) AS end_offset, 2 AS state
+        FROM reservations r
+        WHERE r.status = 'RESERVED' AND r.during && tsrange($1, $2)
+        UNION ALL
+        SELECT h.seat_id, EXTRACT(EPOCH FROM h.start_time - $1), EXTRACT(EPOCH FROM h.end_time - $1), 1
+        FROM seat_holds h
+        WHERE h.expires_at > now()::TIMESTAMP AND h.during && tsrange($1, $2)
+    """, day_start, day_end)
+
+    seat_ids = np.array([seat['id'] for seat in seats], dtype=np.int64)
+    grid = rasterize(
+        seat_ids,
+        np.array([row['seat_id'] for row in intervals], dtype=np.int64),
+        np.array([(row['start_offset'], row['end_offset']) for row in intervals], dtype=np.float64).reshape(-1, 2),
+        np.array([row['state'] for row in intervals], dtype=np.uint8),
+        slot_minutes * 60,
+        slots,
+    )
+
+    # Rows were built in id order for the lookup; the response lists seats by seat number
+    order = sorted(range(len(seats)), key=lambda i: (seats[i]['seat_number'], seats[i]['id']))
+    if encoding == "rle":
+        runs = encode_runs(grid)
+        rows = [{"runs": runs[i]} for i in order]
+    else:
+        reserved, held = encode_bitsets(grid, RESERVED), encode_bitsets(grid, HELD)
+        rows = [{"reserved": reserved[i], "held": held[i]} for i in order]
+
+    return {
+        "date": date,
+        "slot_minutes": slot_minutes,
+        "slots": slots,
+        "encoding": encoding,
+        "seats": [
+            dict({
+                "id": seats[i]['id'],
+                "seat_number": seats[i]['seat_number'],
+                "zone": seats[i]['zone'],
+                "row": seats[i]['seat_row'],
+                "position": seats[i]['seat_position'],
+            }, **row)
+            for i, row in zip(order, rows)
+        ]
+    }
+
+
 @app.get("/seats/{seat_id}")
-def get_seat_details(seat_id: int, current_user: dict = Depends(get_current_user)):
+async def get_seat_details(seat_id: int, response: Response, if_none_match: Optional[str] = Header(None),
+                           current_user: dict = Depends(get_current_user)):
     """
     Get details of a specific seat along with its reserved time slots.
     - Requires authentication via JWT.
+    - The seat and its current status come from the in-memory seat index while it is current.
+      The response then carries an ETag from the seat's version, and a matching If-None-Match
+      gets `304 Not Modified` without touching the database.
     """
+    current_time = datetime.now()
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+    if seat_index.is_fresh():
+        seat = seat_index.seat(seat_id)
+        is_reserved = seat is not None and seat_index.is_reserved_at(seat_id, current_time)
+        if seat is not None:
+            # Read before the reservations below, so the tag is never newer than the body it goes out with
+            etag = make_etag(seat_id, seat_index.version(seat_id), is_reserved)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+        async with db_connection() as conn:
+            return await seat_details(conn, seat_id, seat, is_reserved)
 
-    try:
+    async with db_connection() as conn:
         # Fetch seat details
-        cur.execute("""
-            SELECT id, seat_number FROM seats WHERE id = %s
-        """, (seat_id,))
+        seat = await conn.fetchrow("""
+            SELECT id, seat_number, zone, seat_row, seat_position FROM seats WHERE id = $1
+        """, seat_id)
 
-        seat = cur.fetchone()
-        if not seat:
-            raise HTTPException(status_code=404, detail="Seat not found")
+        # Determine if seat is currently reserved
+        is_reserved = seat is not None and await conn.fetchval("""
+            SELECT COUNT(*) FROM reservations
+            WHERE seat_id = $1 AND status = 'RESERVED' AND start_time <= $2 AND end_time >= $3
+        """, seat_id, current_time, current_time) > 0
 
-        # Fetch reservation time slots for this seat
-        cur.execute("""
-            SELECT start_time, end_time, status FROM reservations WHERE seat_id = %s
-        """, (seat_id,))
+        return await seat_details(conn, seat_id, seat, is_reserved)
 
-        reservations = cur.fetchall()
 
-        # Determine if seat is currently reserved
-        current_time = datetime.now()
-        cur.execute("""
-            SELECT COUNT(*) FROM reservations
-            WHERE seat_id = %s AND start_time <= %s AND end_time >= %s
-        """, (seat_id, current_time, current_time))
+async def seat_details(conn, seat_id: int, seat, is_reserved: bool) -> dict:
+    """get_seat_details body for a seat already looked up (None if it doesn't exist)."""
+    if not seat:
+        raise HTTPException(status_code=404, detail="Seat not found")
 
-        is_reserved = cur.fetchone()[0] > 0
-        seat_status = "RESERVED" if is_reserved else "AVAILABLE"
+    # Fetch reservation time slots for this seat
+    reservations = await conn.fetch("""
+        SELECT start_time, end_time, status FROM reservations WHERE seat_id = $1
+    """, seat_id)
 
-    finally:
-        cur.close()
-        conn.close()
+    seat_status = "RESERVED" if is_reserved else "AVAILABLE"
 
     return {
-        "seat_id": seat[0],
-        "seat_number": seat[1],
+        "seat_id": seat['id'],
+        "seat_number": seat['seat_number'],
+        "zone": seat['zone'],
+        "row": seat['seat_row'],
+        "position": seat['seat_position'],
         "status": seat_status,
         "reservations": [
             {"start_time": res[0], "end_time": res[1], "status": res[2]}
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Availability cache settings from environment variables
+AVAILABILITY_CACHE_SIZE = int(os.getenv("AVAILABILITY_CACHE_SIZE", "1024"))  # Responses kept, least recently used evicted first
+AVAILABILITY_CACHE_MAX_AGE = float(os.getenv("AVAILABILITY_CACHE_MAX_AGE", "300"))  # Seconds an untouched response is trusted
+AVAILABILITY_CACHE_SWR = os.getenv("AVAILABILITY_CACHE_SWR", "true").lower() == "true"  # Serve stale while revalidating
+AVAILABILITY_CACHE_MAX_STALE = float(os.getenv("AVAILABILITY_CACHE_MAX_STALE", "2.0"))  # Longest a stale response may be served
+
+
+class CacheEntry:
+    __slots__ = ("start_time", "end_time", "body", "expires_at", "stale_since", "refreshing")
+
+    def __init__(self, start_time, end_time, body, expires_at):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.body = body
+        self.expires_at = expires_at  # time.monotonic() deadline
+        self.stale_since = None  # time.monotonic() of the first change since the body was built
+        self.refreshing = False
+
+
+class AvailabilityCache:
+    """
+    LRU cache of serialized availability responses, keyed by (start_time, end_time, filter).
+    Entries are invalidated only by changes whose range overlaps theirs (see SeatIndex.subscribe),
+    and expire on their own when a hold they show runs out.
+    With stale-while-revalidate on, an invalidated entry keeps being served for up to `max_stale`
+    seconds while a single background task rebuilds it; otherwise it is dropped at once.
+    """
+
+    def __init__(self, size: int, max_age: float, swr: bool, max_stale: float):
+        self.size = size
+        self.max_age = max_age
+        self.swr = swr
+        self.max_stale = max_stale
+        self._entries = OrderedDict()
+        self._generation = 0  # Bumped by every invalidation, to spot changes landing during a build
+
+        # Counters reported by stats()
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+        self._refreshes = 0
+
+    async def get(self, key, start_time: datetime, end_time: datetime, build):
+        """
+        Cached body for `key`, calling `build()` on a miss. `build` returns (body, expires_at),
+        where `expires_at` is a datetime after which the body goes out of date by itself, or None.
+        """
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry.expires_at > now:
+            if entry.stale_since is None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry.body
+            if now - entry.stale_since <= self.max_stale:
+                self._entries.move_to_end(key)
+                self._stale_hits += 1
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    asyncio.ensure_future(self._refresh(key, entry, build))
+                return entry.body
+
+        self._misses += 1
+        generation = self._generation
+        body, expires_at = await build()
+        if generation == self._generation:
+            self._store(key, start_time, end_time, body, expires_at)
+        return body
+
+    def invalidate(self, start_time, end_time):
+        """Mark or drop every entry whose range overlaps [start_time, end_time); (None, None) clears everything."""
+        self._generation += 1
+        if start_time is None:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+            return
+
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.start_time < end_time and entry.end_time > start_time:
+                self._invalidations += 1
+                if not self.swr:
+                    del self._entries[key]
+                elif entry.stale_since is None:
+                    entry.stale_since = now
+
+    def stats(self) -> dict:
+        """Snapshot of cache counters for the metrics endpoint."""
+        lookups = self._hits + self._stale_hits + self._misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.size,
+            "stale_while_revalidate": self.swr,
+            "hits_total": self._hits,
+            "stale_hits_total": self._stale_hits,
+            "misses_total": self._misses,
+            "hit_ratio": round((self._hits + self._stale_hits) / lookups, 4) if lookups else 0.0,
+            "invalidations_total": self._invalidations,
+            "evictions_total": self._evictions,
+            "refreshes_total": self._refreshes,
+        }
+
+    async def _refresh(self, key, entry, build):
+        generation = self._generation
+        try:
+            body, expires_at = await build()
+        except Exception as e:
+            logger.error(f"Availability cache refresh failed: {e}")
+            self._entries.pop(key, None)
+            return
+        self._refreshes += 1
+        if self._entries.get(key) is not entry:
+            return  # Evicted or cleared meanwhile
+        self._store(key, entry.start_time, entry.end_time, body, expires_at)
+        if generation != self._generation:
+            # A change landed while rebuilding, so the new body may already be behind
+            self._entries[key].stale_since = time.monotonic()
+
+    def _store(self, key, start_time, end_time, body, expires_at):
+        deadline = time.monotonic() + self.max_age
+        if expires_at is not None:
+            deadline = min(deadline, time.monotonic() + (expires_at - datetime.now()).total_seconds())
+        self._entries[key] = CacheEntry(start_time, end_time, body, deadline)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+
+availability_cache = AvailabilityCache(AVAILABILITY_CACHE_SIZE, AVAILABILITY_CACHE_MAX_AGE,
+                                       AVAILABILITY_CACHE_SWR, AVAILABILITY_CACHE_MAX_STALE)
@@ -1,5 +1,12 @@
-import psycopg2
+import asyncpg
+import asyncio
 import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
 
 # Database connection settings from environment variables
 DB_HOST = os.getenv("DB_HOST", "db")
@@ -7,12 +14,156 @@ DB_NAME = os.getenv("DB_NAME", "blu_reserve")
 DB_USER = os.getenv("POSTGRES_USER", "postgres")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 
-def get_db_connection():
-    """Create a connection to the PostgreSQL database."""
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD
-    )
-    return conn
+# Connection pool settings
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))  # Connections opened at startup
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))  # Hard cap per service process
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # Seconds to wait for a free connection
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # Validate before handing out
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available within the timeout."""
+
+
+class AsyncConnectionPool:
+    """
+    asyncio-native pool of PostgreSQL connections (asyncpg) shared by every request of the service.
+    Coroutines wait (up to `timeout` seconds) when all `max_size` connections are in use,
+    without tying up a worker thread.
+    """
+
+    def __init__(self, min_size: int, max_size: int, timeout: float, pre_ping: bool):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self._pool = None
+
+        # Counters reported by stats()
+        self._in_use = 0
+        self._waiting = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    async def open(self):
+        """Create the pool; asyncpg opens `min_size` connections up front."""
+        self._pool = await asyncpg.create_pool(
+            host=DB_HOST,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            min_size=self.min_size,
+            max_size=self.max_size
+        )
+        logger.info(f"Async database pool warmed up with {self._pool.get_size()} connection(s)")
+
+    async def acquire(self):
+        """Borrow a connection, replacing it once if the pre-ping finds it broken."""
+        started = time.monotonic()
+        conn = await self._acquire()
+        if not await self._is_alive(conn):
+            self._reconnects += 1
+            conn.terminate()
+            await self._pool.release(conn)
+            conn = await self._acquire()
+
+        waited = time.monotonic() - started
+        self._in_use += 1
+        self._acquired += 1
+        self._wait_time_total += waited
+        self._wait_time_max = max(self._wait_time_max, waited)
+        return conn
+
+    async def _acquire(self):
+        """One guarded wait for a pooled connection; a timeout is counted and raised as PoolTimeout."""
+        self._waiting += 1
+        try:
+            return await self._pool.acquire(timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+        finally:
+            self._waiting -= 1
+
+    async def release(self, conn):
+        """Return a borrowed connection; asyncpg resets any open transaction."""
+        self._in_use -= 1
+        await self._pool.release(conn)
+
+    async def close(self):
+        """Close all connections (called on shutdown)."""
+        if self._pool is not None:
+            await self._pool.close()
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage for the metrics endpoint."""
+        size = self._pool.get_size() if self._pool is not None else 0
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "idle": self._pool.get_idle_size() if self._pool is not None else 0,
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "acquired_total": self._acquired,
+            "timeouts_total": self._timeouts,
+            "reconnects_total": self._reconnects,
+            "wait_time_avg_ms": round(self._wait_time_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+            "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+        }
+
+    async def _is_alive(self, conn) -> bool:
+        if conn.is_closed():
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            await conn.execute("SELECT 1")
+            return True
+        except (asyncpg.PostgresConnectionError, ConnectionError, OSError):
+            return False
+
+
+db_pool = AsyncConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_PRE_PING)
+
+
+async def init_db_pool():
+    """Open and warm up the shared pool; call once at application startup."""
+    await db_pool.open()
+
+
+async def close_db_pool():
+    """Release pooled connections; call once at application shutdown."""
+    await db_pool.close()
+
+
+async def connect():
+    """Open a dedicated connection outside the pool, for long-lived sessions such as LISTEN."""
+    return await asyncpg.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+
+
+@asynccontextmanager
+async def db_connection():
+    """Lend a pooled connection to a block of code, answering 503 if none frees up in time."""
+    try:
+        conn = await db_pool.acquire()
+    except PoolTimeout as e:
+        logger.error(f"Database pool exhausted: {e}")
+        raise HTTPException(status_code=503, detail="Database is busy, please retry")
+
+    try:
+        yield conn
+    finally:
+        await db_pool.release(conn)
+
+
+async def get_db():
+    """
+    FastAPI dependency that lends a pooled connection to a single request
+    and hands it back to the pool once the response is ready.
+    """
+    async with db_connection() as conn:
+        yield conn
@@ -0,0 +1,15 @@
+import hashlib
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag for a response fully determined by `parts` (version stamps plus whatever else the body depends on)."""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """True if an If-None-Match header names `etag` (weak comparison, `*` matches anything), i.e. the client's copy is current."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
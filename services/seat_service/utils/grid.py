@@ -0,0 +1,62 @@
+import base64
+import numpy as np
+
+# Cell states of the availability grid
+FREE, HELD, RESERVED = 0, 1, 2
+
+
+def rasterize(seat_ids: np.ndarray, interval_seats: np.ndarray, offsets: np.ndarray, states: np.ndarray,
+              slot_seconds: int, slots: int) -> np.ndarray:
+    """
+    Turn intervals into a (seats x slots) grid of FREE / HELD / RESERVED cells in one vectorized pass.
+
+    `seat_ids` must be sorted. Each interval i covers seat `interval_seats[i]` from `offsets[i, 0]`
+    to `offsets[i, 1]` seconds after the start of the grid, in state `states[i]`; a slot counts as taken
+    if any part of it is covered. Every interval adds +1 at its first slot and -1 after its last in a
+    difference array, so a cumulative sum along each row gives per-slot coverage; RESERVED wins over HELD.
+    """
+    grid = np.zeros((len(seat_ids), slots), dtype=np.uint8)
+    if len(offsets) == 0:
+        return grid
+
+    rows = np.searchsorted(seat_ids, interval_seats)
+    known = (rows < len(seat_ids)) & (seat_ids[np.minimum(rows, len(seat_ids) - 1)] == interval_seats)
+    first = np.clip(np.floor(offsets[:, 0] / slot_seconds), 0, slots).astype(np.int64)
+    last = np.clip(np.ceil(offsets[:, 1] / slot_seconds), 0, slots).astype(np.int64)
+
+    width = slots + 1
+    for state in (HELD, RESERVED):
+        selected = known & (states == state) & (last > first)
+        diff = np.bincount(rows[selected] * width + first[selected], minlength=len(seat_ids) * width) \
+            - np.bincount(rows[selected] * width + last[selected], minlength=len(seat_ids) * width)
+        covered = np.cumsum(diff.reshape(len(seat_ids), width), axis=1)[:, :slots] > 0
+        grid[covered] = state
+    return grid
+
+
+def encode_runs(grid: np.ndarray) -> list:
+    """
+    Run-length encode each row as a flat [state, length, state, length, ...] list.
+    Run boundaries for the whole grid are found at once; only the split into rows loops in Python.
+    """
+    seats, slots = grid.shape
+    if seats == 0 or slots == 0:
+        return [[] for _ in range(seats)]
+
+    flat = grid.ravel()
+    boundary = np.empty(flat.size, dtype=bool)
+    boundary[0] = True
+    boundary[1:] = flat[1:] != flat[:-1]
+    boundary[::slots] = True  # Every row starts a new run
+
+    starts = np.flatnonzero(boundary)
+    lengths = np.diff(np.append(starts, flat.size))
+    pairs = np.column_stack((flat[starts], lengths))
+    row_breaks = np.searchsorted(starts, np.arange(1, seats) * slots)
+    return [row.ravel().tolist() for row in np.split(pairs, row_breaks)]
+
+
+def encode_bitsets(grid: np.ndarray, state: int) -> list:
+    """Per row, a base64 bitset of the cells in `state` (first slot = most significant bit of the first byte)."""
+    packed = np.packbits(grid == state, axis=1)
+    return [base64.b64encode(row.tobytes()).decode("ascii") for row in packed]
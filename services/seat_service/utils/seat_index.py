@@ -0,0 +1,353 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from utils.database import db_pool, connect
+
+logger = logging.getLogger(__name__)
+
+# Seat index settings from environment variables
+SEAT_INDEX_ENABLED = os.getenv("SEAT_INDEX_ENABLED", "true").lower() == "true"
+SEAT_INDEX_HEARTBEAT = float(os.getenv("SEAT_INDEX_HEARTBEAT", "1.0"))  # Seconds between heartbeats through the channel
+SEAT_INDEX_MAX_LAG = float(os.getenv("SEAT_INDEX_MAX_LAG", "5.0"))  # Staler than this, reads go to the database
+SEAT_INDEX_RESYNC_AFTER = float(os.getenv("SEAT_INDEX_RESYNC_AFTER", "30.0"))  # Staler than this, reconnect and reload
+CHANNEL = "seat_changes"  # Fed by the notify_seat_change() triggers in init.sql
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse a timestamp from a notification payload; PostgreSQL trims trailing zeros off the fraction."""
+    if "." in value:
+        whole, fraction = value.split(".", 1)
+        value = f"{whole}.{fraction.ljust(6, '0')}"
+    return datetime.fromisoformat(value)
+
+
+class SeatIntervals:
+    """
+    RESERVED ranges of one seat, sorted by start. Active reservations on a seat never overlap
+    (reservations_no_overlap), so the ends are sorted too and every lookup is a binary search.
+    """
+
+    __slots__ = ("starts", "ends", "ids")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, reservation_id: int, start: datetime, end: datetime):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, reservation_id)
+
+    def remove(self, reservation_id: int, start: datetime):
+        i = bisect_left(self.starts, start)
+        while i < len(self.ids) and self.starts[i] == start:
+            if self.ids[i] == reservation_id:
+                del self.starts[i], self.ends[i], self.ids[i]
+                return
+            i += 1
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        """True if a reservation overlaps [start, end)."""
+        i = bisect_right(self.ends, start)
+        return i < len(self.ids) and self.starts[i] < end
+
+    def covers(self, moment: datetime) -> bool:
+        """True if a reservation is running at `moment`, bounds included."""
+        i = bisect_left(self.ends, moment)
+        return i < len(self.ids) and self.starts[i] <= moment
+
+
+class SeatIndex:
+    """
+    In-memory copy of seat availability: the seats, each seat's RESERVED ranges and the seat holds.
+    It is loaded from a snapshot and then kept current from the seat_changes channel.
+    A heartbeat sent through the same channel proves the listener has applied every change
+    committed before it was sent; once the last heartbeat back is older than `max_lag`,
+    is_fresh() turns False and callers answer from the database until the listener catches up
+    (or, past `resync_after`, is reconnected and reloaded).
+    """
+
+    def __init__(self, heartbeat: float, max_lag: float, resync_after: float):
+        self.heartbeat = heartbeat
+        self.max_lag = max_lag
+        self.resync_after = resync_after
+        self._token = uuid.uuid4().hex  # Tells this process's heartbeats apart from other replicas'
+        self._conn = None
+        self._task = None
+        self._buffer = None  # Notifications received while a snapshot is loading
+        self._synced_at = None  # time.monotonic() the index is known to be current as of
+        self._epoch = None  # Changes on every load, so versions from before a reload never match
+        self._version = 0  # Change events applied since the load
+        self._seat_versions = {}  # seat_id -> change events that touched the seat since the load
+
+        self._seats = {}  # seat_id -> {id, seat_number, zone, seat_row, seat_position}
+        self._order = []  # seat ids in seat_number order
+        self._reserved = {}  # seat_id -> SeatIntervals
+        self._reservation_at = {}  # reservation_id -> (seat_id, start_time, end_time)
+        self._holds = {}  # seat_id -> {hold_id: (start_time, end_time, expires_at)}
+        self._hold_seat = {}  # hold_id -> seat_id
+        self._subscribers = []  # Called with (start_time, end_time) of every changed range; (None, None) = everything
+
+        # Counters reported by stats()
+        self._applied = 0
+        self._resyncs = 0
+        self._memory_reads = 0
+        self._fallbacks = 0
+
+    async def start(self):
+        """Load the index and keep it current; call once the database pool is open."""
+        try:
+            await self._resync()
+        except Exception as e:
+            logger.error(f"Seat index failed to load, reading from the database until it does: {e}")
+        self._task = asyncio.ensure_future(self._maintain())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def is_fresh(self) -> bool:
+        """True if reads may be answered from memory; each call is counted as a memory read or a fallback."""
+        fresh = self._lag() <= self.max_lag
+        if fresh:
+            self._memory_reads += 1
+        else:
+            self._fallbacks += 1
+        return fresh
+
+    def subscribe(self, callback):
+        """Register `callback(start_time, end_time)` to hear about every range whose availability changed."""
+        self._subscribers.append(callback)
+
+    def version(self, seat_id: int = None) -> str:
+        """
+        Version stamp of the whole index, or of one seat's seat row and reservations. It moves on every
+        change event that touches them (and on every reload), so it can stand in for the data in an ETag.
+        Stamps are per replica: another replica's stamp for the same data won't match.
+        """
+        counter = self._version if seat_id is None else self._seat_versions.get(seat_id, 0)
+        return f"{self._epoch}.{counter}"
+
+    def seat(self, seat_id: int):
+        return self._seats.get(seat_id)
+
+    def seat_statuses(self, start_time: datetime, end_time: datetime):
+        """[(seat, status)] for every seat in seat_number order; status is RESERVED, HELD or AVAILABLE."""
+        now = datetime.now()
+        statuses = []
+        for seat_id in self._order:
+            intervals = self._reserved.get(seat_id)
+            if intervals and intervals.overlaps(start_time, end_time):
+                status = "RESERVED"
+            elif self._is_held(seat_id, start_time, end_time, now):
+                status = "HELD"
+            else:
+                status = "AVAILABLE"
+            statuses.append((self._seats[seat_id], status))
+        return statuses
+
+    def next_hold_expiry(self, start_time: datetime, end_time: datetime):
+        """When the first live hold overlapping the range expires (its seat frees up without any change event), or None."""
+        now = datetime.now()
+        expiries = [
+            expires_at
+            for holds in self._holds.values()
+            for held_start, held_end, expires_at in holds.values()
+            if expires_at > now and held_start < end_time and held_end > start_time
+        ]
+        return min(expiries) if expiries else None
+
+    def is_reserved_at(self, seat_id: int, moment: datetime) -> bool:
+        intervals = self._reserved.get(seat_id)
+        return bool(intervals) and intervals.covers(moment)
+
+    def stats(self) -> dict:
+        """Snapshot of index state for the metrics endpoint."""
+        lag = self._lag()
+        return {
+            "fresh": lag <= self.max_lag,
+            "lag_ms": round(lag * 1000, 3) if self._synced_at is not None else None,
+            "seats": len(self._seats),
+            "reservations": len(self._reservation_at),
+            "holds": len(self._hold_seat),
+            "changes_applied_total": self._applied,
+            "resyncs_total": self._resyncs,
+            "memory_reads_total": self._memory_reads,
+            "fallbacks_total": self._fallbacks,
+        }
+
+    def _lag(self) -> float:
+        return time.monotonic() - self._synced_at if self._synced_at is not None else float("inf")
+
+    def _is_held(self, seat_id, start_time, end_time, now) -> bool:
+        for held_start, held_end, expires_at in self._holds.get(seat_id, {}).values():
+            if expires_at > now and held_start < end_time and held_end > start_time:
+                return True
+        return False
+
+    async def _maintain(self):
+        while True:
+            try:
+                if self._conn is None or self._conn.is_closed() or self._lag() > self.resync_after:
+                    await self._resync()
+                await self._send_heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Seat index upkeep failed: {e}")
+            await asyncio.sleep(self.heartbeat)
+
+    async def _resync(self):
+        """(Re)connect the listener, then load a snapshot; changes arriving meanwhile are replayed after it."""
+        self._synced_at = None
+        if self._conn is not None:
+            self._conn.terminate()
+            self._conn = None
+
+        conn = await connect()
+        self._buffer = []
+        try:
+            await conn.add_listener(CHANNEL, self._on_notify)
+            began = time.monotonic()
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                seats = await conn.fetch("""
+                    SELECT id, seat_number, zone, seat_row, seat_position FROM seats
+                """)
+                reservations = await conn.fetch("""
+                    SELECT id, seat_id, start_time, end_time FROM reservations WHERE status = 'RESERVED'
+                """)
+                holds = await conn.fetch("""
+                    SELECT id, seat_id, start_time, end_time, expires_at FROM seat_holds
+                    WHERE expires_at > now()::TIMESTAMP
+                """)
+        except Exception:
+            self._buffer = None
+            conn.terminate()
+            raise
+
+        self._seats, self._reserved, self._reservation_at, self._holds, self._hold_seat = {}, {}, {}, {}, {}
+        self._epoch, self._version, self._seat_versions = uuid.uuid4().hex[:12], 0, {}
+        for seat in seats:
+            self._seats[seat['id']] = dict(seat)
+        self._sort_seats()
+        for row in reservations:
+            self._add_reservation(row['id'], row['seat_id'], row['start_time'], row['end_time'])
+        for row in holds:
+            self._add_hold(row['id'], row['seat_id'], row['start_time'], row['end_time'], row['expires_at'])
+
+        buffered, self._buffer = self._buffer, None
+        self._conn = conn
+        self._synced_at = began
+        for message in buffered:
+            self._apply(message)
+
+        self._resyncs += 1
+        self._notify(None, None)
+        logger.info(f"Seat index loaded: {len(seats)} seats, {len(reservations)} reservations, "
+                    f"{len(holds)} holds, {len(buffered)} changes replayed")
+
+    async def _send_heartbeat(self):
+        conn = await db_pool.acquire()
+        try:
+            await conn.execute("SELECT pg_notify($1, $2)", CHANNEL,
+                               json.dumps({"heartbeat": self._token, "sent_at": time.monotonic()}))
+        finally:
+            await db_pool.release(conn)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        message = json.loads(payload)
+        if self._buffer is not None:
+            self._buffer.append(message)
+        else:
+            self._apply(message)
+
+    def _apply(self, message: dict):
+        if "heartbeat" in message:
+            if message["heartbeat"] == self._token and self._synced_at is not None:
+                self._synced_at = max(self._synced_at, message["sent_at"])
+            return
+
+        table, op, row = message["table"], message["op"], message["row"]
+        if table in ("reservations", "seat_holds"):
+            start_time, end_time = parse_timestamp(row["start_time"]), parse_timestamp(row["end_time"])
+            if table == "reservations":
+                located = self._reservation_at.get(row["id"])
+                if located is not None:
+                    self._bump(located[0])  # The seat it was on, in case it moved
+                previous = self._drop_reservation(row["id"])
+                if op != "DELETE" and row["status"] == "RESERVED":
+                    self._add_reservation(row["id"], row["seat_id"], start_time, end_time)
+            else:
+                previous = self._drop_hold(row["id"])
+                if op != "DELETE":
+                    self._add_hold(row["id"], row["seat_id"], start_time, end_time, parse_timestamp(row["expires_at"]))
+            if previous is not None and previous != (start_time, end_time):
+                self._notify(*previous)
+            self._bump(row["seat_id"])
+            self._notify(start_time, end_time)
+        elif table == "seats":
+            if op == "DELETE":
+                self._seats.pop(row["id"], None)
+            else:
+                self._seats[row["id"]] = {key: row[key] for key in ("id", "seat_number", "zone", "seat_row", "seat_position")}
+            self._sort_seats()
+            self._bump(row["id"])
+            self._notify(None, None)
+        self._version += 1
+        self._applied += 1
+
+    def _bump(self, seat_id):
+        self._seat_versions[seat_id] = self._seat_versions.get(seat_id, 0) + 1
+
+    def _notify(self, start_time, end_time):
+        for callback in self._subscribers:
+            callback(start_time, end_time)
+
+    def _sort_seats(self):
+        self._order = sorted(self._seats, key=lambda seat_id: (self._seats[seat_id]['seat_number'], seat_id))
+
+    def _add_reservation(self, reservation_id, seat_id, start_time, end_time):
+        self._reserved.setdefault(seat_id, SeatIntervals()).add(reservation_id, start_time, end_time)
+        self._reservation_at[reservation_id] = (seat_id, start_time, end_time)
+
+    def _drop_reservation(self, reservation_id):
+        """Forget a reservation; returns the (start_time, end_time) it covered, or None."""
+        located = self._reservation_at.pop(reservation_id, None)
+        if located is None:
+            return None
+        seat_id, start_time, end_time = located
+        self._reserved[seat_id].remove(reservation_id, start_time)
+        return start_time, end_time
+
+    def _add_hold(self, hold_id, seat_id, start_time, end_time, expires_at):
+        self._holds.setdefault(seat_id, {})[hold_id] = (start_time, end_time, expires_at)
+        self._hold_seat[hold_id] = seat_id
+
+    def _drop_hold(self, hold_id):
+        """Forget a hold; returns the (start_time, end_time) it covered, or None."""
+        seat_id = self._hold_seat.pop(hold_id, None)
+        if seat_id is None:
+            return None
+        holds = self._holds[seat_id]
+        start_time, end_time, _ = holds.pop(hold_id)
+        if not holds:
+            del self._holds[seat_id]
+        return start_time, end_time
+
+
+seat_index = SeatIndex(SEAT_INDEX_HEARTBEAT, SEAT_INDEX_MAX_LAG, SEAT_INDEX_RESYNC_AFTER)
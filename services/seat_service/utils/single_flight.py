@@ -0,0 +1,57 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent reads: the first caller for a key starts the work, and callers
+    arriving while it is in flight await the same result (or exception) instead of running it again.
+    The work runs in its own task, so a caller that disconnects doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._in_flight = {}  # key -> asyncio.Task
+        self._callers = {}  # key -> callers sharing the in-flight task
+
+        # Counters reported by stats()
+        self._executed = 0
+        self._coalesced = 0
+        self._max_callers = 0
+
+    async def do(self, key, fn):
+        """Return `await fn()`, sharing one call among concurrent callers with the same key."""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            self._callers[key] = 1
+            self._executed += 1
+            task.add_done_callback(lambda _: self._finish(key, task))
+        else:
+            self._callers[key] += 1
+            self._coalesced += 1
+            self._max_callers = max(self._max_callers, self._callers[key])
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Snapshot of coalescing counters for the metrics endpoint."""
+        requests = self._executed + self._coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "executed_total": self._executed,
+            "coalesced_total": self._coalesced,
+            "coalesced_ratio": round(self._coalesced / requests, 4) if requests else 0.0,
+            "max_callers_per_call": self._max_callers,
+        }
+
+    def _finish(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            del self._callers[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Single-flight call for {key} failed: {task.exception()}")
+
+
+single_flight = SingleFlight()
@@ -1,9 +1,12 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, Security
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Security, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from utils.database import get_db_connection
+from utils.database import get_db, db_connection, db_pool, init_db_pool, close_db_pool
+from utils.single_flight import single_flight
+from utils.etag import make_etag, etag_matches
 from utils.jwt_handler import decode_access_token
 from passlib.context import CryptContext
+from typing import Optional
 import logging
 
 # Initialize logging
@@ -16,6 +19,28 @@ security = HTTPBearer()
 # Password hashing utility
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+
+@app.on_event("startup")
+def startup():
+    init_db_pool()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    close_db_pool()
+
+
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+    """Report connection pool usage (in use, waiting, wait time)."""
+    return db_pool.stats()
+
+
+@app.get("/metrics/single-flight")
+def single_flight_metrics():
+    """Report how many identical concurrent reads were coalesced onto one database query."""
+    return single_flight.stats()
+
 # Dependency to authenticate users via JWT
 def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     """Extract JWT token from Authorization header and decode it."""
@@ -35,34 +60,75 @@ class UpdateUserDetails(BaseModel):
     password: str = None
 
 @app.get("/users/{user_id}")
-def get_user_details(user_id: int, current_user: dict = Depends(get_current_user)):
-    """Retrieve user details by ID."""
+def get_user_details(user_id: int, response: Response, if_none_match: Optional[str] = Header(None),
+                     current_user: dict = Depends(get_current_user)):
+    """
+    Retrieve user details by ID. Identical concurrent lookups share one query and one connection.
+    The response carries an ETag built from the user's row version and their budget's; a matching
+    If-None-Match is answered `304 Not Modified` after a version-only lookup.
+    """
     logger.debug(f"Fetching details for user ID: {user_id}")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            SELECT id, username, email, bluDollar_balance, 'EMPLOYEE' AS role FROM employees WHERE id = %s
-            UNION ALL
-            SELECT id, username, email, bluDollar_balance, 'MANAGER' AS role FROM managers WHERE id = %s
-        """, (user_id, user_id))
+    if if_none_match:
+        version = fetch_user_version(user_id)
+        if version and etag_matches(if_none_match, make_etag(*version)):
+            return Response(status_code=304, headers={"ETag": make_etag(*version)})
 
-        user = cur.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-    finally:
-        cur.close()
-        conn.close()
+    user = single_flight.do(("user", user_id), lambda: fetch_user_details(user_id))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
+    # Versions come from the same row as the details, so the tag always matches the body
+    response.headers["ETag"] = make_etag(user[4], user[5], user[6])
     return {"id": user[0], "username": user[1], "email": user[2], "bluDollar_balance": user[3], "role": user[4]}
 
+# The balance shown is the sum of the manager's budget shards, so its version is the sum of theirs
+USER_VERSION_COLUMNS = """
+    'EMPLOYEE' AS role, e.row_version,
+    (SELECT COALESCE(SUM(s.row_version), 0) FROM manager_balance_shards s WHERE s.manager_id = e.manager_id)
+"""
+MANAGER_VERSION_COLUMNS = """
+    'MANAGER' AS role, m.row_version,
+    (SELECT COALESCE(SUM(s.row_version), 0) FROM manager_balance_shards s WHERE s.manager_id = m.id)
+"""
+
+def fetch_user_details(user_id: int):
+    """Load one user's details row (id, username, email, balance, role, row_version, balance_version), or None."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+            SELECT e.id, e.username, e.email, COALESCE(b.balance, 0) AS bluDollar_balance, {USER_VERSION_COLUMNS}
+            FROM employees e LEFT JOIN manager_balances b ON b.manager_id = e.manager_id
+            WHERE e.id = %s
+            UNION ALL
+            SELECT m.id, m.username, m.email, COALESCE(b.balance, 0) AS bluDollar_balance, {MANAGER_VERSION_COLUMNS}
+            FROM managers m LEFT JOIN manager_balances b ON b.manager_id = m.id
+            WHERE m.id = %s
+            """, (user_id, user_id))
+            return cur.fetchone()
+        finally:
+            cur.close()
+
+def fetch_user_version(user_id: int):
+    """(role, row_version, balance_version) of one user, or None; reads a few integers, not the user."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+            SELECT {USER_VERSION_COLUMNS} FROM employees e WHERE e.id = %s
+            UNION ALL
+            SELECT {MANAGER_VERSION_COLUMNS} FROM managers m WHERE m.id = %s
+            """, (user_id, user_id))
+            return cur.fetchone()
+        finally:
+            cur.close()
+
 @app.put("/users/{user_id}")
-def update_user_details(user_id: int, details: UpdateUserDetails, current_user: dict = Depends(get_current_user)):
+def update_user_details(user_id: int, details: UpdateUserDetails, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
     """Update user details (username, email, or password)."""
     logger.debug(f"Updating user {user_id} with details: {details}")
 
-    conn = get_db_connection()
     cur = conn.cursor()
     try:
         # Determine if the user exists and fetch role
@@ -99,16 +165,14 @@ def update_user_details(user_id: int, details: UpdateUserDetails, current_user:
             conn.commit()
     finally:
         cur.close()
-        conn.close()
 
     return {"message": "User details updated successfully"}
 
 @app.get("/users/{user_id}/role")
-def get_user_role(user_id: int, current_user: dict = Depends(get_current_user)):
+def get_user_role(user_id: int, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
     """Retrieve the role of a user."""
     logger.debug(f"Fetching role for user ID: {user_id}")
 
-    conn = get_db_connection()
     cur = conn.cursor()
     try:
         cur.execute("""
@@ -122,52 +186,62 @@ def get_user_role(user_id: int, current_user: dict = Depends(get_current_user)):
             raise HTTPException(status_code=404, detail="User not found")
     finally:
         cur.close()
-        conn.close()
 
     return {"user_id": user_id, "role": result[0]}
 
 @app.get("/users")
 def get_users_by_role(role: str = Query(None, regex="^(EMPLOYEE|MANAGER)$"),
-                      current_user: dict = Depends(get_current_user)):
+                      current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
     """Retrieve all users filtered by role."""
     logger.debug(f"Fetching all users with role: {role}")
 
-    conn = get_db_connection()
     cur = conn.cursor()
     try:
         if role == "EMPLOYEE":
-            cur.execute("SELECT id, username, email, bluDollar_balance FROM employees")
+            cur.execute("""
+                SELECT e.id, e.username, e.email, COALESCE(b.balance, 0)
+                FROM employees e LEFT JOIN manager_balances b ON b.manager_id = e.manager_id
+            """)
         elif role == "MANAGER":
-            cur.execute("SELECT id, username, email, bluDollar_balance FROM managers")
+            cur.execute("""
+                SELECT m.id, m.username, m.email, COALESCE(b.balance, 0)
+                FROM managers m LEFT JOIN manager_balances b ON b.manager_id = m.id
+            """)
         else:
             raise HTTPException(status_code=400, detail="Invalid role")
 
         users = cur.fetchall()
     finally:
         cur.close()
-        conn.close()
 
     return [{"id": user[0], "username": user[1], "email": user[2], "bluDollar_balance": user[3]} for user in users]
 
 @app.get("/users/search")
-def search_users(username: str = None, email: str = None, current_user: dict = Depends(get_current_user)):
+def search_users(username: str = None, email: str = None, current_user: dict = Depends(get_current_user), conn=Depends(get_db)):
     """Search users by username or email."""
     logger.debug(f"Searching users with username: {username}, email: {email}")
 
-    conn = get_db_connection()
     cur = conn.cursor()
     try:
         if username:
             cur.execute("""
-                SELECT id, username, email, bluDollar_balance, 'EMPLOYEE' AS role FROM employees WHERE username ILIKE %s
+                SELECT e.id, e.username, e.email, COALESCE(b.balance, 0) AS bluDollar_balance, 'EMPLOYEE' AS role
+                FROM employees e LEFT JOIN manager_balances b ON b.manager_id = e.manager_id
+                WHERE e.username ILIKE %s
                 UNION ALL
-                SELECT id, username, email, bluDollar_balance, 'MANAGER' AS role FROM managers WHERE username ILIKE %s
+                SELECT m.id, m.username, m.email, COALESCE(b.balance, 0) AS bluDollar_balance, 'MANAGER' AS role
+                FROM managers m LEFT JOIN manager_balances b ON b.manager_id = m.id
+                WHERE m.username ILIKE %s
             """, (f"%{username}%", f"%{username}%"))
         elif email:
             cur.execute("""
-                SELECT id, username, email, bluDollar_balance, 'EMPLOYEE' AS role FROM employees WHERE email ILIKE %s
+                SELECT e.id, e.username, e.email, COALESCE(b.balance, 0) AS bluDollar_balance, 'EMPLOYEE' AS role
+                FROM employees e LEFT JOIN manager_balances b ON b.manager_id = e.manager_id
+                WHERE e.email ILIKE %s
                 UNION ALL
-                SELECT id, username, email, bluDollar_balance, 'MANAGER' AS role FROM managers WHERE email ILIKE %s
+                SELECT m.id, m.username, m.email, COALESCE(b.balance, 0) AS bluDollar_balance, 'MANAGER' AS role
+                FROM managers m LEFT JOIN manager_balances b ON b.manager_id = m.id
+                WHERE m.email ILIKE %s
             """, (f"%{email}%", f"%{email}%"))
         else:
             raise HTTPException(status_code=400, detail="Query parameter 'username' or 'email' is required")
@@ -175,6 +249,5 @@ def search_users(username: str = None, email: str = None, current_user: dict = D
         users = cur.fetchall()
     finally:
         cur.close()
-        conn.close()
 
     return [{"id": user[0], "username": user[1], "email": user[2], "bluDollar_balance": user[3], "role": user[4]} for user in users]
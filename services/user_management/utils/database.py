@@ -1,5 +1,13 @@
 import psycopg2
+import psycopg2.extensions
 import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
 
 # Database connection settings from environment variables
 DB_HOST = os.getenv("DB_HOST", "db")
@@ -7,12 +15,213 @@ DB_NAME = os.getenv("DB_NAME", "blu_reserve")
 DB_USER = os.getenv("POSTGRES_USER", "postgres")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 
-def get_db_connection():
-    """Create a connection to the PostgreSQL database."""
-    conn = psycopg2.connect(
+# Connection pool settings
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))  # Connections opened at startup
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))  # Hard cap per service process
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # Seconds to wait for a free connection
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # Validate before handing out
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available within the timeout."""
+
+
+def _connect():
+    """Open a new connection to the PostgreSQL database."""
+    return psycopg2.connect(
         host=DB_HOST,
         database=DB_NAME,
         user=DB_USER,
         password=DB_PASSWORD
     )
-    return conn
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections shared by every request of the service.
+    Callers block (up to `timeout` seconds) when all `max_size` connections are in use.
+    """
+
+    def __init__(self, min_size: int, max_size: int, timeout: float, pre_ping: bool):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+
+        self._idle = []  # Most recently returned connection is reused first
+        self._size = 0  # Open connections, idle or in use
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+        # Counters reported by stats()
+        self._acquired = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def warm_up(self):
+        """Open `min_size` connections up front so the first requests skip the handshake."""
+        opened = []
+        with self._cond:
+            missing = max(self.min_size - self._size, 0)
+            self._size += missing
+
+        try:
+            for _ in range(missing):
+                opened.append(_connect())
+        finally:
+            with self._cond:
+                self._size -= missing - len(opened)
+                self._idle.extend(opened)
+                self._cond.notify_all()
+
+        logger.info(f"Database pool warmed up with {len(opened)} connection(s)")
+
+    def getconn(self):
+        """Borrow a connection, opening a new one if the pool has not reached `max_size`."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        conn = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # Reserve the slot; connect outside the lock
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        reconnected = False
+        try:
+            if conn is None:
+                conn = _connect()
+            elif not self._is_alive(conn):
+                reconnected = True
+                self._close_quietly(conn)
+                conn = _connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._acquired += 1
+            self._reconnects += reconnected
+            self._wait_time_total += waited
+            self._wait_time_max = max(self._wait_time_max, waited)
+
+        return conn
+
+    def putconn(self, conn):
+        """Return a borrowed connection, rolling back anything the request left open."""
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            if discard:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        """Close all idle connections (called on shutdown)."""
+        with self._cond:
+            while self._idle:
+                self._close_quietly(self._idle.pop())
+                self._size -= 1
+
+    def stats(self) -> dict:
+        """Snapshot of pool usage for the metrics endpoint."""
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "acquired_total": self._acquired,
+                "timeouts_total": self._timeouts,
+                "reconnects_total": self._reconnects,
+                "wait_time_avg_ms": round(self._wait_time_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+            }
+
+    def _is_alive(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+db_pool = ConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_PRE_PING)
+
+
+def init_db_pool():
+    """Warm up the shared pool; call once at application startup."""
+    db_pool.warm_up()
+
+
+def close_db_pool():
+    """Release pooled connections; call once at application shutdown."""
+    db_pool.close()
+
+
+@contextmanager
+def db_connection():
+    """Lend a pooled connection to a block of code, answering 503 if none frees up in time."""
+    try:
+        conn = db_pool.getconn()
+    except PoolTimeout as e:
+        logger.error(f"Database pool exhausted: {e}")
+        raise HTTPException(status_code=503, detail="Database is busy, please retry")
+
+    try:
+        yield conn
+    finally:
+        db_pool.putconn(conn)
+
+
+def get_db():
+    """
+    FastAPI dependency that lends a pooled connection to a single request
+    and hands it back to the pool once the response is ready.
+    """
+    with db_connection() as conn:
+        yield conn
@@ -0,0 +1,73 @@
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "callers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callers = 1
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent reads across the request threads: the first caller for a key
+    runs the work, and callers arriving while it runs wait for the same result (or exception)
+    instead of borrowing another connection to run the same query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call in flight
+
+        # Counters reported by stats()
+        self._executed = 0
+        self._coalesced = 0
+        self._max_callers = 0
+
+    def do(self, key, fn):
+        """Return `fn()`, sharing one call among concurrent callers with the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+                leader = True
+            else:
+                call.callers += 1
+                self._coalesced += 1
+                self._max_callers = max(self._max_callers, call.callers)
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        """Snapshot of coalescing counters for the metrics endpoint."""
+        requests = self._executed + self._coalesced
+        return {
+            "in_flight": len(self._calls),
+            "executed_total": self._executed,
+            "coalesced_total": self._coalesced,
+            "coalesced_ratio": round(self._coalesced / requests, 4) if requests else 0.0,
+            "max_callers_per_call": self._max_callers,
+        }
+
+
+single_flight = SingleFlight()